@@ -0,0 +1,238 @@
+"""
+Class-wide grade analytics for an assignment.
+
+Everything is computed in one aggregation ($facet) over the assignment's
+submissions: per-criterion statistics for auto and manual grades, a score
+histogram ($bucket on percent of the maximum), auto/manual disagreement,
+interview verdict counts and indicator hits per marker. The Flask route caches
+the result and drops it on every grade or verdict write.
+"""
+import os
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional
+
+from rubric import criterion_stats_stages, load_rubric, summarize_criteria
+from variants import hex_to_indices
+
+ANALYTICS_TTL_SECONDS = int(os.environ.get("ANALYTICS_TTL_SECONDS", "600"))
+# A total-score gap of at least this percent of the maximum counts as a disagreement
+GRADE_DISAGREEMENT_PERCENT = float(os.environ.get("GRADE_DISAGREEMENT_PERCENT", "10"))
+
+HISTOGRAM_BOUNDARIES = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100.01]
+
+
+def _percent_of(score_expr, max_points: int):
+    return {"$multiply": [{"$divide": [score_expr, max_points or 1]}, 100]}
+
+
+def _histogram_stages(field: str, max_points: int) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {f"{field}.totalScore": {"$type": "number"}}},
+        {"$bucket": {
+            "groupBy": _percent_of(f"${field}.totalScore", max_points),
+            "boundaries": HISTOGRAM_BOUNDARIES,
+            "default": "other",
+            "output": {"count": {"$sum": 1}}
+        }}
+    ]
+
+
+def _manual_points_for(criterion_id_expr):
+    """pointsEarned of the manual criterion with the same id (null when the teacher skipped it)."""
+    return {"$let": {
+        "vars": {"match": {"$arrayElemAt": [
+            {"$filter": {
+                "input": "$manualGrade.criteria",
+                "as": "m",
+                "cond": {"$eq": ["$$m.criterionId", criterion_id_expr]}
+            }},
+            0
+        ]}},
+        "in": "$$match.pointsEarned"
+    }}
+
+
+def analytics_pipeline(assignment_id, max_points: int) -> List[Dict[str, Any]]:
+    both_graded = {"autoGrade.criteria": {"$exists": True}, "manualGrade.criteria": {"$exists": True}}
+    return [
+        {"$match": {"assignmentId": assignment_id}},
+        {"$facet": {
+            "overview": [
+                {"$group": {
+                    "_id": None,
+                    "submissions": {"$sum": 1},
+                    "autoGraded": {"$sum": {"$cond": [{"$ifNull": ["$autoGrade", False]}, 1, 0]}},
+                    "manualGraded": {"$sum": {"$cond": [{"$ifNull": ["$manualGrade", False]}, 1, 0]}},
+                    "flagged": {"$sum": {"$cond": ["$needsInterview", 1, 0]}},
+                    "meanCheatingScore": {"$avg": "$cheatingScore"}
+                }}
+            ],
+            "autoCriteria": criterion_stats_stages("autoGrade"),
+            "manualCriteria": criterion_stats_stages("manualGrade"),
+            "autoHistogram": _histogram_stages("autoGrade", max_points),
+            "manualHistogram": _histogram_stages("manualGrade", max_points),
+            "disagreement": [
+                {"$match": both_graded},
+                {"$project": {"delta": {"$subtract": ["$manualGrade.totalScore", "$autoGrade.totalScore"]}}},
+                {"$group": {
+                    "_id": None,
+                    "pairs": {"$sum": 1},
+                    "meanDelta": {"$avg": "$delta"},
+                    "meanAbsDelta": {"$avg": {"$abs": "$delta"}},
+                    "maxAbsDelta": {"$max": {"$abs": "$delta"}},
+                    "disagreements": {"$sum": {"$cond": [
+                        {"$gte": [{"$abs": _percent_of("$delta", max_points)}, GRADE_DISAGREEMENT_PERCENT]}, 1, 0
+                    ]}}
+                }}
+            ],
+            "criterionDisagreement": [
+                {"$match": both_graded},
+                {"$unwind": "$autoGrade.criteria"},
+                {"$project": {
+                    "criterionId": "$autoGrade.criteria.criterionId",
+                    "auto": "$autoGrade.criteria.pointsEarned",
+                    "manual": _manual_points_for("$autoGrade.criteria.criterionId")
+                }},
+                {"$match": {"manual": {"$type": "number"}}},
+                {"$group": {
+                    "_id": "$criterionId",
+                    "pairs": {"$sum": 1},
+                    "meanDelta": {"$avg": {"$subtract": ["$manual", "$auto"]}},
+                    "meanAbsDelta": {"$avg": {"$abs": {"$subtract": ["$manual", "$auto"]}}},
+                    "disagreements": {"$sum": {"$cond": [{"$ne": ["$manual", "$auto"]}, 1, 0]}}
+                }}
+            ],
+            "verdicts": [
+                {"$match": {"interviewCompleted": True}},
+                {"$group": {"_id": {"$ifNull": ["$interviewVerdict", "none"]}, "count": {"$sum": 1}}}
+            ],
+            "analyzedStudents": [
+                {"$match": {"analysis": {"$exists": True}}},
+                {"$group": {"_id": None, "count": {"$sum": 1}, "studentIds": {"$addToSet": "$studentId"}}}
+            ],
+            "indicators": [
+                {"$unwind": "$indicatorsFound"},
+                {"$group": {"_id": "$indicatorsFound.evidence", "hits": {"$sum": 1}}}
+            ]
+        }}
+    ]
+
+
+def _first(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return rows[0] if rows else {}
+
+
+def _histogram(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    counts = {row["_id"]: row["count"] for row in rows}
+    bins = [
+        {"fromPercent": low, "toPercent": min(high, 100), "count": counts.get(low, 0)}
+        for low, high in zip(HISTOGRAM_BOUNDARIES, HISTOGRAM_BOUNDARIES[1:])
+    ]
+    if counts.get("other"):
+        bins.append({"fromPercent": None, "toPercent": None, "count": counts["other"]})
+    return bins
+
+
+def _markers(homework: Optional[Dict[str, Any]]) -> List[str]:
+    if not homework:
+        return []
+    if homework.get("marker_pool"):
+        return [marker.get("detail", "") for marker in homework["marker_pool"]]
+    return list(homework.get("changes", []))
+
+
+def _exposure(variants_col, homework: Optional[Dict[str, Any]], student_ids: List[str], analyzed: int) -> List[int]:
+    """How many analyzed students received each marker (everyone, unless markers vary per student)."""
+    markers = _markers(homework)
+    if not homework or not homework.get("marker_pool"):
+        return [analyzed] * len(markers)
+    exposed = [0] * len(markers)
+    docs = variants_col.find(
+        {"assignmentId": homework["assignment_id"], "poolHash": homework["pool_hash"], "studentId": {"$in": student_ids}},
+        {"bits": 1}
+    )
+    for doc in docs:
+        for i in hex_to_indices(doc["bits"]):
+            if i < len(exposed):
+                exposed[i] += 1
+    return exposed
+
+
+def marker_hit_rates(variants_col, homework, indicator_rows, analyzed_row) -> List[Dict[str, Any]]:
+    hits = {row["_id"]: row["hits"] for row in indicator_rows}
+    markers = _markers(homework)
+    exposure = _exposure(variants_col, homework, analyzed_row.get("studentIds", []), analyzed_row.get("count", 0))
+    rates = []
+    for marker, exposed in zip(markers, exposure):
+        count = hits.pop(marker, 0)
+        rates.append({
+            "marker": marker,
+            "hits": count,
+            "exposed": exposed,
+            "hitRate": round(count / exposed, 3) if exposed else 0.0
+        })
+    # Evidence that no longer matches a current marker (e.g. after markers were regenerated)
+    rates.extend(
+        {"marker": marker, "hits": count, "exposed": None, "hitRate": None}
+        for marker, count in sorted(hits.items(), key=lambda item: -item[1])
+    )
+    return rates
+
+
+def assignment_analytics(submissions_col, variants_col, assignment: Dict[str, Any],
+                         homework: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    compiled = load_rubric(assignment)
+    facets = _first(list(submissions_col.aggregate(analytics_pipeline(assignment["_id"], compiled.total_points))))
+
+    overview = _first(facets.get("overview", []))
+    overview.pop("_id", None)
+    disagreement = _first(facets.get("disagreement", []))
+    disagreement.pop("_id", None)
+    by_criterion = {row["_id"]: row for row in facets.get("criterionDisagreement", [])}
+
+    return {
+        "assignmentId": str(assignment["_id"]),
+        "maxScore": compiled.total_points,
+        "overview": {
+            "submissions": overview.get("submissions", 0),
+            "autoGraded": overview.get("autoGraded", 0),
+            "manualGraded": overview.get("manualGraded", 0),
+            "flagged": overview.get("flagged", 0),
+            "meanCheatingScore": round(overview.get("meanCheatingScore") or 0.0, 3)
+        },
+        "criteria": {
+            "auto": summarize_criteria(compiled, facets.get("autoCriteria", [])),
+            "manual": summarize_criteria(compiled, facets.get("manualCriteria", []))
+        },
+        "histogram": {
+            "auto": _histogram(facets.get("autoHistogram", [])),
+            "manual": _histogram(facets.get("manualHistogram", []))
+        },
+        "disagreement": {
+            "pairs": disagreement.get("pairs", 0),
+            "disagreements": disagreement.get("disagreements", 0),
+            "thresholdPercent": GRADE_DISAGREEMENT_PERCENT,
+            "meanDelta": round(disagreement.get("meanDelta") or 0.0, 2),
+            "meanAbsDelta": round(disagreement.get("meanAbsDelta") or 0.0, 2),
+            "maxAbsDelta": disagreement.get("maxAbsDelta", 0),
+            "criteria": [
+                {
+                    "criterionId": cid,
+                    "pairs": by_criterion[cid]["pairs"],
+                    "disagreements": by_criterion[cid]["disagreements"],
+                    "meanDelta": round(by_criterion[cid]["meanDelta"] or 0.0, 2),
+                    "meanAbsDelta": round(by_criterion[cid]["meanAbsDelta"] or 0.0, 2)
+                }
+                for cid in compiled.ids
+                if cid in by_criterion
+            ]
+        },
+        "verdicts": [
+            {"verdict": row["_id"], "count": row["count"]}
+            for row in sorted(facets.get("verdicts", []), key=lambda row: -row["count"])
+        ],
+        "markers": marker_hit_rates(
+            variants_col, homework, facets.get("indicators", []), _first(facets.get("analyzedStudents", []))
+        ),
+        "computedAt": datetime.now(UTC).isoformat()
+    }
@@ -1,22 +1,59 @@
 from io import BytesIO
-from flask import Flask, request, send_file, jsonify
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from pymongo import MongoClient
+from flask import Flask, Response, request, send_file, jsonify, g
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import pypdf
 import os
-import hashlib
 import json
+import threading
+import traceback
+import uuid
+import time
+import queue
+import contextvars
+import io
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, UTC
 
 load_dotenv()
 
-from gemini import mutate_prompt, detect_indicators, generate_rubric_suggestions, grade_with_rubric, analyze_interview_transcript
+import gemini
+from gemini import (
+    mutate_prompt, detect_indicators, generate_rubric_suggestions, grade_with_rubric, analyze_interview_transcript,
+    stream_mutate_prompt, stream_rubric_suggestions, stream_interview_analysis, generate_marker_pool,
+    finalize_interview
+)
+import prompts
+import routing
+import similarity
+from database import get_client, get_db, read_collection, pool_stats
+from indexes import ensure_indexes
+import counters
+from markers import load_detection_index
+from pdf_cache import open_pdf_cache, make_key as make_pdf_cache_key
+from blobstore import open_blob_store
+import uploads
+from uploads import pdf_source, upload_digest
+from pdf_builder import build_secret_replacement_pdf, PDF_LAYOUT_VERSION
+import batch_pdf
+import variants
+from rubric import CompiledRubric, compile_rubric, load_rubric, criterion_stats
+import rubric_rules
+import analytics
+import marker_stats
+import interview
+import digests
+import llm_usage
+import textstore
+from cache import ResultCache, source_version, assignment_tag, homework_tag
 from flask_cors import CORS
 
 app = Flask(__name__)
+# Uploads are spooled, hashed and size-capped while they are parsed (see uploads.py)
+app.request_class = uploads.UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = uploads.MAX_CONTENT_LENGTH
 
 # Configure CORS to allow Next.js dev server
 CORS(app, resources={
@@ -40,50 +77,166 @@ def convert_objectids(obj):
     else:
         return obj
 
-# MongoDB setup
-mongo_uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
-mongo_client = MongoClient(mongo_uri)
-db = mongo_client["lms"]
+# MongoDB setup (pool/timeouts configured in database.py)
+mongo_client = get_client()
+db = get_db()
 homeworks_col = db["homeworks"]
 submissions_col = db["submissions"]
 courses_col = db["courses"]
 assignments_col = db["assignments"]
 users_col = db["users"]
 cache_col = db["cache"]
+similarity_col = db["similarity"]
+variants_col = db["variants"]
+
+# Dashboard reads may be served by secondaries
+courses_read_col = read_collection("courses")
+assignments_read_col = read_collection("assignments")
+submissions_read_col = read_collection("submissions")
+
+try:
+    ensure_indexes(db)
+except Exception as e:
+    print(f"[STARTUP] Could not create indexes: {str(e)}")
+
+# PDF cache (bounded, LRU-evicted, validated on startup); local disk or shared GridFS
+pdf_cache = open_pdf_cache(db=db)
+# Uploaded submission PDFs, deduplicated by content hash
+upload_store = open_blob_store("uploads", db=db)
+# Batch renders run one at a time as background jobs; the lock and job reports live in
+# pdf_batches so every worker sees them, and a lock older than the timeout is presumed abandoned
+PDF_BATCH_TIMEOUT_SECONDS = int(os.environ.get("PDF_BATCH_TIMEOUT_SECONDS", "1800"))
+pdf_batches_col = db["pdf_batches"]
+batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-batch")
+print(f"[STARTUP] PDF cache validated: {pdf_cache.validate()}")
+
+# Background integrity preparation (mutations, homework document, cached PDF).
+# State lives on the assignment (integrityStatus / integrityPrepToken / integrityPrepStartedAt),
+# so every worker and process sees the same preparation; one older than this is presumed abandoned.
+INTEGRITY_PREP_STALE_SECONDS = int(os.environ.get("INTEGRITY_PREP_STALE_SECONDS", "900"))
+INTEGRITY_PREP_RETRY_AFTER_SECONDS = 5
+# A failed preparation is not re-claimed by PDF requests for this long
+INTEGRITY_PREP_FAILURE_BACKOFF_SECONDS = int(os.environ.get("INTEGRITY_PREP_FAILURE_BACKOFF_SECONDS", "60"))
+# Per-student variants: one Gemini call for a marker pool, subsets combined locally
+STUDENT_VARIANTS = os.environ.get("STUDENT_VARIANTS", "1") == "1"
+prep_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("INTEGRITY_PREP_WORKERS", "2")),
+    thread_name_prefix="integrity-prep"
+)
+
+# Submission pipeline: detection and grading run side by side on the same text
+PLAGIARISM_THRESHOLD = float(os.environ.get("PLAGIARISM_THRESHOLD", "0.5"))  # default mirrors src/lib/constants.ts
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PIPELINE_WORKERS", "8")),
+    thread_name_prefix="pipeline"
+)
+
+# Server-sent events for long Gemini calls
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Dashboard counters are repaired periodically (0 disables the background job)
+COUNTERS_RECONCILE_SECONDS = int(os.environ.get("COUNTERS_RECONCILE_SECONDS", "900"))
+
+
+# Large fields left out of submission lists (fetched per submission instead)
+SUBMISSION_LIST_EXCLUDED_FIELDS = textstore.SUBMISSION_STORED_FIELDS + ["interviewTranscript", "interviewProgress"]
+
+
+# Result cache: one version per namespace from the model and the code that produces the results
+result_cache = ResultCache(cache_col, {
+    "detect": source_version(routing.chain("detect", gemini.model), prompts.DETECT.version, detect_indicators),
+    "detect-standalone": source_version(routing.chain("detect", gemini.model), prompts.DETECT.version, detect_indicators),
+    "grade": source_version(routing.chain("grade", gemini.model), prompts.GRADE.version, grade_with_rubric, CompiledRubric,
+                            rubric_rules),
+    "grade-digest": source_version(routing.chain("grade", gemini.model), prompts.GRADE.version, prompts.DIGEST.version,
+                                   grade_with_rubric, gemini.digest_submission, digests.render, CompiledRubric, rubric_rules),
+    "rubric_gen": source_version(gemini.model, prompts.RUBRIC.version, gemini._parse_rubric),
+    "analytics": source_version(analytics),
+})
 
-# PDF cache directory
-PDF_CACHE_DIR = os.path.join(os.path.dirname(__file__), "pdf_cache")
-os.makedirs(PDF_CACHE_DIR, exist_ok=True)
 
+def invalidate_analytics(assignment_id):
+    """Drop cached class analytics after a grade or verdict changes."""
+    if assignment_id:
+        result_cache.invalidate(tags=[assignment_tag(assignment_id)], namespaces=["analytics"])
 
-def _hash_key(parts):
-    joined = "||".join([str(p) for p in parts])
-    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
 
+@app.before_request
+def _begin_llm_usage():
+    g.llm_usage_token = llm_usage.begin()
+    g.request_started = time.perf_counter()
 
-def cache_get(key: str):
-    doc = cache_col.find_one({"key": key, "expiresAt": {"$gt": datetime.now(UTC)}})
-    return doc.get("value") if doc else None
 
+@app.teardown_request
+def _end_llm_usage(exc):
+    token = g.pop("llm_usage_token", None)
+    if token is None:
+        return
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+    usage = llm_usage.end(token, route, (time.perf_counter() - g.request_started) * 1000)
+    if usage and usage.calls:
+        print(f"[LLM] {route}: {usage.calls} calls, {usage.prompt_tokens} prompt + {usage.output_tokens} output tokens, "
+              f"~{usage.saved_tokens} saved by digests")
+
+
+def _in_request_context(fn, *args, **kwargs):
+    """Submit-able wrapper that keeps LLM usage attributed to the calling route."""
+    return contextvars.copy_context().run(fn, *args, **kwargs)
 
-def cache_set(key: str, value, ttl_seconds: int = 3600):
-    cache_col.update_one(
-        {"key": key},
-        {
-            "$set": {
-                "key": key,
-                "value": value,
-                "createdAt": datetime.now(UTC),
-                "expiresAt": datetime.now(UTC) + timedelta(seconds=ttl_seconds)
-            }
-        },
-        upsert=True
-    )
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(convert_objectids(data))}\n\n"
+
+
+def _wants_stream() -> bool:
+    """Clients opt into SSE with ?stream=1 or an Accept: text/event-stream header."""
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def _sse_response(events, tag: str) -> Response:
+    """
+    Stream (event, data) pairs as server-sent events.
+    The iterator runs on its own thread so heartbeats keep proxies from timing out
+    while Gemini is still thinking. Events must not touch the request context.
+    """
+    pending = queue.Queue()
+    done = object()
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract all text from PDF bytes."""
-    pdf_file = BytesIO(pdf_bytes)
+    def produce():
+        try:
+            for item in events:
+                pending.put(item)
+        except Exception as e:
+            print(f"[{tag}] Stream error: {str(e)}")
+            traceback.print_exc()
+            pending.put(("error", {"error": str(e)}))
+        finally:
+            pending.put(done)
+
+    def body():
+        threading.Thread(target=produce, daemon=True).start()
+        yield _sse("start", {"ok": True})
+        while True:
+            try:
+                item = pending.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is done:
+                break
+            yield _sse(*item)
+
+    return Response(body(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+def extract_text_from_pdf(pdf_bytes: bytes = None, stream=None) -> str:
+    """Extract all text from PDF bytes or a seekable binary stream."""
+    pdf_file = stream if stream is not None else BytesIO(pdf_bytes)
     reader = pypdf.PdfReader(pdf_file)
     text = ""
     for page in reader.pages:
@@ -91,162 +244,21 @@ def extract_text_from_pdf(pdf_bytes: bytes) -> str:
     return text
 
 
-def build_secret_replacement_pdf(visible_text: str, secret_text: str, output_path: str) -> bytes:
+def _store_upload(file, metadata: dict):
     """
-    Generate a PDF with visible text but with secret text replacement via marked content.
-    The visible_text is what appears on screen, secret_text is what copy/paste/accessibility sees.
+    Extract the text of an uploaded PDF from its spooled copy, then stream the PDF into the
+    upload store. Returns (text, {"blob", "size"}); a PDF that is already stored is not copied.
     """
-    # Normalize text to avoid ReportLab encoding issues with standard fonts
-    replacements = {
-        '\u201c': '"', '\u201d': '"',  # Smart quotes
-        '\u2018': "'", '\u2019': "'",  # Smart single quotes
-        '\u2013': '-', '\u2014': '-'   # Dashes
-    }
-    for k, v in replacements.items():
-        if visible_text:
-            visible_text = visible_text.replace(k, v)
-        if secret_text:
-            secret_text = secret_text.replace(k, v)
-
-    page_size = letter
-    font_size = 12
-    margin = 50
-    line_height = font_size * 1.2
-    font_name = "Times-Roman"  # Reason: common assignment font
-    
-    # Use BytesIO if no output path specified
-    if output_path is None:
-        output_buffer = BytesIO()
-        c = canvas.Canvas(output_buffer, pagesize=page_size)
-    else:
-        c = canvas.Canvas(output_path, pagesize=page_size)
-    
-    c.setFont(font_name, font_size)
-    
-    # Layout: wrap text to fit page width, respecting newlines
-    lines = []
-    
-    # Normalize newlines
-    paragraphs = visible_text.replace('\r\n', '\n').split('\n')
-    
-    max_width = page_size[0] - 2 * margin
-    space_w = c.stringWidth(" ", font_name, font_size)
-    
-    for p_idx, paragraph in enumerate(paragraphs):
-        # If paragraph is empty, it's a blank line
-        if not paragraph.strip():
-            lines.append([])
-            continue
-            
-        words = paragraph.split()
-        current_line = []
-        current_width = 0
-        
-        for word in words:
-            w_w = c.stringWidth(word, font_name, font_size)
-            if current_width + w_w > max_width and current_line:
-                lines.append(current_line)
-                current_line = [word]
-                current_width = w_w + space_w
-            else:
-                current_line.append(word)
-                current_width += w_w + space_w
-        if current_line:
-            lines.append(current_line)
-
-    # Filter for non-empty lines to distribute secret text
-    non_empty_line_indices = [i for i, l in enumerate(lines) if l]
-    num_content_lines = len(non_empty_line_indices)
-    
-    if num_content_lines == 0:
-        c.save()
-        if output_path is None:
-            output_buffer.seek(0)
-            return output_buffer.getvalue()
-        return True
-    
-    # Distribute secret_text across NON-EMPTY lines
-    target_words = secret_text.split()
-    total_len = len(secret_text)
-    ideal_len = total_len / num_content_lines if num_content_lines > 0 else 0
-    
-    chunks = []
-    current_chunk_words = []
-    current_len = 0
-    word_idx = 0
-    n_words = len(target_words)
-    
-    for i in range(num_content_lines - 1):
-        if word_idx >= n_words:
-            chunks.append("")
-            continue
-        
-        while word_idx < n_words:
-            word = target_words[word_idx]
-            w_len = len(word)
-            
-            if len(current_chunk_words) == 0:
-                current_chunk_words.append(word)
-                current_len += w_len
-                word_idx += 1
-            elif current_len + 1 + w_len <= ideal_len * 1.2:
-                current_chunk_words.append(word)
-                current_len += 1 + w_len
-                word_idx += 1
-            else:
-                break
-        
-        chunks.append(" ".join(current_chunk_words))
-        current_chunk_words = []
-        current_len = 0
-    
-    # Last content line gets the rest
-    if word_idx < n_words:
-        chunks.append(" ".join(target_words[word_idx:]))
-    else:
-        chunks.append("")
-    
-    # Map chunks back to line indices
-    line_to_chunk = {line_idx: chunk for line_idx, chunk in zip(non_empty_line_indices, chunks)}
-    
-    # Draw lines
-    y = page_size[1] - margin
-    for i, line_words in enumerate(lines):
-        # Check if we need new page
-        if y < margin:
-            c.showPage()
-            c.setFont(font_name, font_size)
-            y = page_size[1] - margin
-
-        if not line_words:
-            # Empty line, just spacing
-            y -= line_height
-            continue
-            
-        x = margin
-        line_str = " ".join(line_words)
-        
-        # Get corresponding secret chunk
-        chunk = line_to_chunk.get(i, "")
-        if not chunk:
-            chunk = " "
-        
-        # Escape special PDF characters
-        esc_chunk = chunk.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-        
-        # Inject marked content with ActualText
-        c._code.append(f"/Span <</ActualText ({esc_chunk})>> BDC")
-        c.drawString(x, y, line_str)
-        c._code.append("EMC")
-        
-        y -= line_height
-    
-    c.save()
-    
-    if output_path is None:
-        output_buffer.seek(0)
-        return output_buffer.getvalue()
-    return True
+    with pdf_source(file) as source:
+        text = extract_text_from_pdf(stream=source)
+    blob = upload_store.put_stream(file.stream, content_type="application/pdf", metadata=metadata,
+                                   sha256=upload_digest(file))
+    return text, {"blob": blob["id"], "size": blob["size"]}
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload too large (limit {uploads.UPLOAD_MAX_BYTES // (1024 * 1024)} MB)"}), 413
 
 
 @app.route("/health", methods=["GET"])
@@ -259,6 +271,69 @@ def health():
     })
 
 
+def _store_generated_homework(visible_text: str, teacher_id, assignment_id, mutation_result: dict) -> dict:
+    """Render the PDF for a mutation result, store the homework and return the /generate payload."""
+    mutated_text = mutation_result["mutated"]
+    mutations = mutation_result["mutations"]
+    changes = mutation_result["changes"]
+    print(f"[GENERATE] Gemini returned {len(mutations)} mutations")
+
+    # Generate PDF with visible/invisible split
+    print("[GENERATE] Building PDF...")
+    pdf_bytes = build_secret_replacement_pdf(visible_text=visible_text, secret_text=mutated_text, output_path=None, spans=mutation_result["spans"])
+    print(f"[GENERATE] PDF generated: {len(pdf_bytes)} bytes")
+
+    # Store homework metadata in MongoDB
+    print("[GENERATE] Storing in MongoDB...")
+    homework_doc = {
+        "teacher_id": teacher_id,
+        "assignment_id": assignment_id,
+        **textstore.prompt_fields(visible_text, mutated_text),
+        "mutations": mutations,
+        "changes": changes,
+        "spans": mutation_result["spans"],
+        "detection_index": mutation_result["detection_index"]
+    }
+    result = homeworks_col.insert_one(homework_doc)
+    homework_id = str(result.inserted_id)
+    print(f"[GENERATE] Success! homework_id={homework_id}")
+
+    return {
+        "homework_id": homework_id,
+        "original_prompt": visible_text,
+        "mutated_prompt": mutated_text,
+        "mutations": mutations,
+        "changes": changes,
+        "pdf_download": "/download/" + homework_id
+    }
+
+
+@app.route("/health/llm", methods=["GET"])
+def health_llm():
+    """LLM calls, tokens, digest savings and latency per route and per model, plus model routing decisions, since startup."""
+    return jsonify({
+        "routes": llm_usage.route_stats(),
+        "models": llm_usage.model_stats(),
+        "routing": {"fastModel": routing.FAST_MODEL, "fullModel": gemini.model, "tasks": routing.task_stats()}
+    })
+
+
+@app.route("/health/db", methods=["GET"])
+def health_db():
+    """MongoDB reachability plus connection pool metrics."""
+    stats = pool_stats()
+    try:
+        started = time.perf_counter()
+        mongo_client.admin.command("ping")
+        stats["pingMs"] = _elapsed_ms(started)
+        stats["status"] = "ok"
+        return jsonify(stats)
+    except Exception as e:
+        stats["status"] = "error"
+        stats["error"] = str(e)
+        return jsonify(stats), 503
+
+
 @app.route("/generate", methods=["POST"])
 def generate():
     """Generate a homework PDF with invisible mutation for integrity checking."""
@@ -275,49 +350,51 @@ def generate():
         print("[GENERATE] Error: Invalid visible_text")
         return jsonify({"error": "Provide JSON with 'visible_text': string, 'teacher_id': string, 'assignment_id': string"}), 400
 
+    if _wants_stream():
+        def events():
+            print("[GENERATE] Streaming Gemini API...")
+            for event, payload in stream_mutate_prompt(visible_text, guidance=marker_stats.guidance(db)):
+                if event == "result":
+                    payload = _store_generated_homework(visible_text, teacher_id, assignment_id, payload)
+                yield event, payload
+        return _sse_response(events(), "GENERATE")
+
     try:
         # Use Gemini to suggest mutations
         print("[GENERATE] Calling Gemini API...")
-        mutation_result = mutate_prompt(prompt_text=visible_text)
-        mutated_text = mutation_result["mutated"]
-        mutations = mutation_result["mutations"]
-        changes = mutation_result["changes"]
-        print(f"[GENERATE] Gemini returned {len(mutations)} mutations")
-
-        # Generate PDF with visible/invisible split
-        print("[GENERATE] Building PDF...")
-        pdf_bytes = build_secret_replacement_pdf(visible_text=visible_text, secret_text=mutated_text, output_path=None)
-        print(f"[GENERATE] PDF generated: {len(pdf_bytes)} bytes")
-
-        # Store homework metadata in MongoDB
-        print("[GENERATE] Storing in MongoDB...")
-        homework_doc = {
-            "teacher_id": teacher_id,
-            "assignment_id": assignment_id,
-            "original_prompt": visible_text,
-            "mutated_prompt": mutated_text,
-            "mutations": mutations,
-            "changes": changes
-        }
-        result = homeworks_col.insert_one(homework_doc)
-        homework_id = str(result.inserted_id)
-        print(f"[GENERATE] Success! homework_id={homework_id}")
-
-        return jsonify({
-            "homework_id": homework_id,
-            "original_prompt": visible_text,
-            "mutated_prompt": mutated_text,
-            "mutations": mutations,
-            "changes": changes,
-            "pdf_download": "/download/" + homework_id
-        })
+        mutation_result = mutate_prompt(prompt_text=visible_text, guidance=marker_stats.guidance(db))
+        return jsonify(_store_generated_homework(visible_text, teacher_id, assignment_id, mutation_result))
     except Exception as e:
         print(f"[GENERATE] Error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+def _detect_for_homework(homework, homework_id: str, response_text: str, tags=()) -> dict:
+    """Run marker detection for a homework, cached per homework and text."""
+    cache_parts = [homework_id, response_text]
+    cached_analysis = result_cache.get("detect", cache_parts)
+    
+    if cached_analysis:
+        print(f"[SUBMIT] Using cached detection result for {homework_id}")
+        return cached_analysis
+
+    # Detect indicators in submission
+    original_prompt, mutated_prompt = textstore.homework_prompts(homework)
+    analysis = detect_indicators(
+        student_text=response_text,
+        original_prompt=original_prompt,
+        secret_prompt=mutated_prompt,
+        changes=homework.get("changes", []),
+        detection_index=load_detection_index(homework)
+    )
+    # 24 hour cache for submissions (partial results are re-run next time)
+    if not analysis.get("partial"):
+        result_cache.set("detect", cache_parts, analysis, ttl_seconds=3600*24,
+                         tags=[homework_tag(homework_id.split(":")[0]), *tags])
+    return analysis
+
+
 @app.route("/submit", methods=["POST"])
 def submit():
     """Student submits their response (PDF or text) for integrity analysis."""
@@ -342,40 +419,27 @@ def submit():
         return jsonify({"error": "Homework not found"}), 404
     
     # Extract text from file if provided, else use response_text
+    response_pdf = None
     if file:
         try:
-            pdf_bytes = file.read()
-            response_text = extract_text_from_pdf(pdf_bytes=pdf_bytes)
+            response_text, response_pdf = _store_upload(file, {"homeworkId": homework_id, "studentId": student_id})
         except:
             return jsonify({"error": "Failed to extract text from PDF"}), 400
     
     if not response_text:
         return jsonify({"error": "No response text provided"}), 400
     
-    # Create cache key for detection
-    cache_key = _hash_key(["detect", homework_id, response_text])
-    cached_analysis = cache_get(cache_key)
-    
-    if cached_analysis:
-        print(f"[SUBMIT] Using cached detection result for {cache_key}")
-        analysis = cached_analysis
-    else:
-        # Detect indicators in submission
-        analysis = detect_indicators(
-            student_text=response_text,
-            original_prompt=homework["original_prompt"],
-            secret_prompt=homework["mutated_prompt"],
-            changes=homework.get("changes", [])
-        )
-        cache_set(cache_key, analysis, ttl_seconds=3600*24) # 24 hour cache for submissions
+    analysis = _detect_for_homework(homework, homework_id, response_text)
     
     # Store submission and analysis in MongoDB
     submission_doc = {
         "homework_id": homework_id,
         "student_id": student_id,
-        "response_text": response_text,
+        **textstore.pack_field("response_text", response_text),
         "analysis": analysis
     }
+    if response_pdf:
+        submission_doc["response_pdf"] = response_pdf
     submissions_col.insert_one(submission_doc)
     
     return jsonify(analysis)
@@ -392,17 +456,14 @@ def download(homework_id: str):
     if not homework:
         return jsonify({"error": "Homework not found"}), 404
     
-    pdf_bytes = build_secret_replacement_pdf(
-        visible_text=homework["original_prompt"],
-        secret_text=homework["mutated_prompt"],
-        output_path=None
-    )
-    return send_file(
-        BytesIO(pdf_bytes),
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name="homework.pdf"
-    )
+    original_prompt, mutated_prompt = textstore.homework_prompts(homework)
+    pdf_key = _pdf_cache_key(homework_id, original_prompt, mutated_prompt)
+    return _serve_pdf(pdf_key, "homework.pdf", lambda: build_secret_replacement_pdf(
+        visible_text=original_prompt,
+        secret_text=mutated_prompt,
+        output_path=None,
+        spans=homework.get("spans")
+    ))
 
 
 @app.route("/detect", methods=["POST"])
@@ -421,20 +482,19 @@ def detect():
     # Extract text from file if provided, else use student_text
     if file:
         try:
-            pdf_bytes = file.read()
-            student_text = extract_text_from_pdf(pdf_bytes=pdf_bytes)
+            with pdf_source(file) as source:
+                student_text = extract_text_from_pdf(stream=source)
         except:
             return jsonify({"error": "Failed to extract text from PDF"}), 400
     
     if not student_text:
         return jsonify({"error": "No student text provided"}), 400
     
-    # Create cache key
-    cache_key = _hash_key(["detect-standalone", original_prompt, secret_prompt, str(changes), student_text])
-    cached_result = cache_get(cache_key)
+    cache_parts = [original_prompt, secret_prompt, str(changes), student_text]
+    cached_result = result_cache.get("detect-standalone", cache_parts)
     
     if cached_result:
-        print(f"[DETECT] Using cached result for {cache_key}")
+        print("[DETECT] Using cached result")
         return jsonify(cached_result)
 
     # Detect indicators
@@ -442,13 +502,74 @@ def detect():
         student_text=student_text,
         original_prompt=original_prompt,
         secret_prompt=secret_prompt,
-        changes=changes
+        changes=changes,
+        detection_index=load_detection_index(changes=changes)
     )
-    cache_set(cache_key, detection_result, ttl_seconds=3600*24)
+    if not detection_result.get("partial"):
+        result_cache.set("detect-standalone", cache_parts, detection_result, ttl_seconds=3600*24)
     
     return jsonify(detection_result)
 
 
+def _reconcile_counters_loop():
+    while True:
+        time.sleep(COUNTERS_RECONCILE_SECONDS)
+        try:
+            report = counters.reconcile_all(db)
+            if report["drift"]:
+                print(f"[COUNTERS] Repaired drift: {report['drift']}")
+        except Exception as e:
+            print(f"[COUNTERS] Reconcile error: {str(e)}")
+
+
+if COUNTERS_RECONCILE_SECONDS > 0:
+    threading.Thread(target=_reconcile_counters_loop, name="counters-reconcile", daemon=True).start()
+
+
+@app.route("/api/admin/cache", methods=["GET"])
+def cache_stats():
+    """Result cache namespaces with their current versions and live entry counts, plus prompt template versions."""
+    try:
+        return jsonify({"namespaces": result_cache.stats(), "prompts": prompts.versions()})
+    except Exception as e:
+        print(f"[CACHE] Stats error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/admin/cache/invalidate", methods=["POST"])
+def invalidate_cache():
+    """Delete cached results by tag (e.g. assignment:<id>, homework:<id>) and/or namespace."""
+    data = request.json or {}
+    tags = data.get("tags") or []
+    namespaces = data.get("namespaces") or []
+    unknown = [n for n in namespaces if n not in result_cache.versions]
+    if unknown:
+        return jsonify({"error": f"Unknown namespaces: {', '.join(unknown)}"}), 400
+    if not tags and not namespaces:
+        return jsonify({"error": "Provide tags and/or namespaces"}), 400
+    try:
+        deleted = result_cache.invalidate(tags=tags, namespaces=namespaces)
+        print(f"[CACHE] Invalidated {deleted} entries (tags={tags}, namespaces={namespaces})")
+        return jsonify({"deleted": deleted})
+    except Exception as e:
+        print(f"[CACHE] Invalidate error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/counters/reconcile", methods=["POST"])
+def reconcile_counters():
+    """Recompute dashboard counters from the source collections (all teachers, or one)."""
+    data = request.get_json(silent=True) or {}
+    teacher_id = data.get("teacherId") or request.args.get("teacherId")
+    try:
+        report = counters.reconcile_all(db, [teacher_id] if teacher_id else None)
+        print(f"[COUNTERS] Reconciled {report['teachers']} teachers, {report['courses']} courses")
+        return jsonify(report)
+    except Exception as e:
+        print(f"[COUNTERS] Reconcile error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/courses", methods=["GET"])
 def get_courses():
     """Get courses for a teacher."""
@@ -462,27 +583,25 @@ def get_courses():
     
     # teacher_id is now a Clerk user ID (string), not ObjectId
     print(f"[FLASK] Querying courses with professorId: {teacher_id}")
-    courses = list(courses_col.find({"professorId": teacher_id}))
+    courses = list(courses_read_col.find({"professorId": teacher_id}))
     
     print(f"[FLASK] Found {len(courses)} courses")
     for course in courses:
         print(f"[FLASK] Course: {course.get('name')} (ID: {course['_id']}, Prof: {course.get('professorId')})")
     
-    # Add counts
+    # Add counts (maintained in the counters collection)
+    assignment_counts = counters.course_assignment_counts(db, [str(c["_id"]) for c in courses])
     for course in courses:
         course["_id"] = str(course["_id"])
         # professorId is already a string (Clerk ID)
         course["studentCount"] = len(course.get("enrolledStudents", []))
-        course["assignmentCount"] = assignments_col.count_documents({"courseId": ObjectId(course["_id"])})
+        course["assignmentCount"] = assignment_counts.get(course["_id"], 0)
     
     # Calculate stats
+    teacher_stats = counters.teacher_counters(db, teacher_id)
     total_assignments = sum(c["assignmentCount"] for c in courses)
-    total_submissions = submissions_col.count_documents({"teacherId": teacher_id})
-    pending_reviews = submissions_col.count_documents({
-        "teacherId": teacher_id,
-        "needsInterview": True,
-        "interviewCompleted": {"$ne": True}
-    })
+    total_submissions = teacher_stats.get("totalSubmissions", 0)
+    pending_reviews = teacher_stats.get("pendingReviews", 0)
     
     print(f"[FLASK] Returning {len(courses)} courses with stats: {total_assignments} assignments, {total_submissions} submissions, {pending_reviews} pending")
     
@@ -508,7 +627,7 @@ def get_course(course_id):
         course["_id"] = str(course["_id"])
         # professorId is already a string (Clerk ID)
         course["studentCount"] = len(course.get("enrolledStudents", []))
-        course["assignmentCount"] = assignments_col.count_documents({"courseId": ObjectId(course_id)})
+        course["assignmentCount"] = counters.course_assignment_counts(db, [course_id]).get(course_id, 0)
         
         return jsonify({"course": course})
     except Exception as e:
@@ -521,7 +640,7 @@ def course_assignments(course_id):
     
     if request.method == "GET":
         try:
-            assignments = list(assignments_col.find({
+            assignments = list(assignments_read_col.find({
                 "courseId": ObjectId(course_id),
                 "status": {"$ne": "deleted"}
             }))
@@ -530,7 +649,7 @@ def course_assignments(course_id):
                 assignment["_id"] = str(assignment["_id"])
                 assignment["courseId"] = str(assignment["courseId"])
                 assignment["professorId"] = str(assignment["professorId"])
-                assignment["submissionCount"] = submissions_col.count_documents({
+                assignment["submissionCount"] = submissions_read_col.count_documents({
                     "assignmentId": ObjectId(assignment["_id"])
                 })
             
@@ -556,115 +675,383 @@ def course_assignments(course_id):
             }
             
             result = assignments_col.insert_one(assignment)
+            if assignment["status"] != "deleted":
+                counters.incr_course(db, course_id, assignments=1)
+
+            # Prepare mutations and the student PDF before anyone downloads it
+            schedule_integrity_prep(str(result.inserted_id))
+
             assignment["_id"] = str(result.inserted_id)
             assignment["courseId"] = str(assignment["courseId"])
             # professorId is already a string
             assignment["submissionCount"] = 0
+            assignment["integrityStatus"] = "preparing"
+            assignment["integrityReady"] = False
             
             return jsonify({"assignment": assignment}), 201
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
 
+def _pdf_cache_key(assignment_id: str, visible_text: str, mutated_text: str) -> str:
+    return make_pdf_cache_key(assignment_id, visible_text, mutated_text, layout_version=PDF_LAYOUT_VERSION)
+
+
+def _send_cached_pdf(pdf_path, pdf_key: str, download_name: str):
+    """
+    Serve a cached PDF with conditional (ETag) support. pdf_path is a file path (local cache,
+    range requests supported), a blob reader, which send_file streams chunk by chunk, or the
+    rendered bytes in a BytesIO. A path is opened here, so FileNotFoundError surfaces now.
+    """
+    return send_file(
+        pdf_path,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=pdf_key,
+        max_age=3600
+    )
+
+
+def _serve_pdf(pdf_key: str, download_name: str, render):
+    """
+    Serve a PDF from the cache, or render it with render() and cache it on a miss.
+    Another worker may evict or invalidate a cached file between get() and opening it;
+    that counts as a miss. Freshly rendered bytes are served from memory for the same reason.
+    """
+    pdf_path = pdf_cache.get(pdf_key)
+    if pdf_path:
+        try:
+            return _send_cached_pdf(pdf_path, pdf_key, download_name)
+        except FileNotFoundError:
+            print(f"[PDF] Cached PDF {pdf_key} was removed before it could be opened; rendering it again")
+    pdf_bytes = render()
+    stored = pdf_cache.put(pdf_key, pdf_bytes)
+    if hasattr(stored, "close"):
+        stored.close()  # blob reader from the shared cache; we serve our own bytes
+    return _send_cached_pdf(io.BytesIO(pdf_bytes), pdf_key, download_name)
+
+
+def _prepare_assignment_integrity(assignment_id: str, prep_token: str):
+    """Generate mutations, the homework document and the cached PDF for an assignment."""
+    assignment = assignments_col.find_one({"_id": ObjectId(assignment_id)})
+    if not assignment or assignment.get("integrityPrepToken") != prep_token:
+        print(f"[PREP] Skipping superseded preparation for {assignment_id}")
+        return
+
+    try:
+        visible_text = assignment.get("instructions", "")
+        pool_fields = {}
+        guidance = marker_stats.guidance(db)
+        if STUDENT_VARIANTS:
+            print(f"[PREP] Generating a pool of {variants.MARKER_POOL_SIZE} markers for assignment {assignment_id}")
+            pool = variants.pool_from_result(
+                generate_marker_pool(prompt_text=visible_text, pool_size=variants.MARKER_POOL_SIZE, guidance=guidance)
+            )
+            pool_fields = {"marker_pool": pool, "pool_hash": variants.pool_hash(pool)}
+            # The class-wide prompt (no student id) uses the first markers of the pool
+            mutation_result = variants.build_variant(visible_text, pool, variants.default_indices(len(pool)))
+        else:
+            print(f"[PREP] Generating mutations for assignment {assignment_id}")
+            mutation_result = mutate_prompt(prompt_text=visible_text, guidance=guidance)
+        pdf_bytes = build_secret_replacement_pdf(
+            visible_text=visible_text,
+            secret_text=mutation_result["mutated"],
+            output_path=None,
+            spans=mutation_result["spans"]
+        )
+
+        # The assignment may have been edited again while Gemini was running
+        current = assignments_col.find_one({"_id": ObjectId(assignment_id)}, {"integrityPrepToken": 1})
+        if not current or current.get("integrityPrepToken") != prep_token:
+            print(f"[PREP] Discarding stale preparation for {assignment_id}")
+            return
+
+        pdf_key = _pdf_cache_key(assignment_id, visible_text, mutation_result["mutated"])
+        pdf_cache.put(pdf_key, pdf_bytes)
+
+        prompt_fields = textstore.prompt_fields(visible_text, mutation_result["mutated"])
+        homeworks_col.update_one(
+            {"assignment_id": assignment_id},
+            {
+                "$set": {
+                    "assignment_id": assignment_id,
+                    "teacher_id": assignment.get("professorId"),
+                    "course_id": str(assignment.get("courseId")),
+                    **prompt_fields,
+                    "mutations": mutation_result["mutations"],
+                    "changes": mutation_result["changes"],
+                    "spans": mutation_result["spans"],
+                    "detection_index": mutation_result["detection_index"],
+                    "pdf_key": pdf_key,
+                    "updated_at": datetime.now(),
+                    **pool_fields
+                },
+                "$setOnInsert": {"created_at": datetime.now()},
+                "$unset": textstore.prompt_unset(prompt_fields)
+            },
+            upsert=True
+        )
+        if not pool_fields:
+            homeworks_col.update_one({"assignment_id": assignment_id}, {"$unset": {"marker_pool": "", "pool_hash": ""}})
+        # Detections against the previous markers no longer apply
+        result_cache.invalidate(tags=[assignment_tag(assignment_id)], namespaces=["detect"])
+        assignments_col.update_one(
+            {"_id": ObjectId(assignment_id), "integrityPrepToken": prep_token},
+            {
+                "$set": {
+                    "integrityStatus": "ready",
+                    "integrityReady": True,
+                    "integrityMarkerCount": len(mutation_result["changes"]),
+                    "integrityPoolSize": len(pool_fields.get("marker_pool", [])),
+                    "integrityPreparedAt": datetime.now(UTC)
+                },
+                "$unset": {"integrityError": ""}
+            }
+        )
+        print(f"[PREP] Assignment {assignment_id} ready with {len(mutation_result['changes'])} markers")
+    except Exception as e:
+        print(f"[PREP] Error preparing {assignment_id}: {str(e)}")
+        traceback.print_exc()
+        assignments_col.update_one(
+            {"_id": ObjectId(assignment_id), "integrityPrepToken": prep_token},
+            {"$set": {"integrityStatus": "failed", "integrityReady": False, "integrityError": str(e),
+                      "integrityFailedAt": datetime.now(UTC)}}
+        )
+
+
+def schedule_integrity_prep(assignment_id: str, only_if_idle: bool = False) -> bool:
+    """
+    Mark an assignment as preparing and queue its mutation/PDF setup in the background.
+    An edit always takes over (the new token makes any running preparation discard its result);
+    with only_if_idle the preparation is claimed only when no live one is running in any worker.
+    Returns whether a preparation was queued.
+    """
+    prep_token = uuid.uuid4().hex
+    now = datetime.now(UTC)
+    query = {"_id": ObjectId(assignment_id)}
+    if only_if_idle:
+        query["$or"] = [
+            {"integrityStatus": {"$ne": "preparing"}},
+            {"integrityPrepStartedAt": {"$not": {"$gt": now - timedelta(seconds=INTEGRITY_PREP_STALE_SECONDS)}}}
+        ]
+    result = assignments_col.update_one(query, {"$set": {
+        "integrityStatus": "preparing",
+        "integrityReady": False,
+        "integrityPrepToken": prep_token,
+        "integrityPrepStartedAt": now
+    }})
+    if not result.modified_count:
+        return False
+    prep_executor.submit(_prepare_assignment_integrity, assignment_id, prep_token)
+    print(f"[PREP] Scheduled integrity preparation for {assignment_id}")
+    return True
+
+
+def _integrity_preparing(assignment) -> bool:
+    """Whether a live (not abandoned) preparation is running for the assignment, in any worker."""
+    if assignment.get("integrityStatus") != "preparing":
+        return False
+    started = assignment.get("integrityPrepStartedAt")
+    if started is None:
+        return False
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=UTC)
+    return datetime.now(UTC) - started < timedelta(seconds=INTEGRITY_PREP_STALE_SECONDS)
+
+
+def _integrity_preparing_response():
+    response = jsonify({
+        "integrityStatus": "preparing",
+        "message": "The assignment PDF is being prepared; retry shortly."
+    })
+    response.status_code = 202
+    response.headers["Retry-After"] = str(INTEGRITY_PREP_RETRY_AFTER_SECONDS)
+    return response
+
+
 @app.route("/api/assignments/<assignment_id>/pdf", methods=["GET"])
 def get_assignment_pdf(assignment_id):
-    """Generate or retrieve cached assignment PDF with mutation markers."""
+    """
+    Retrieve (rendering on a cache miss) the assignment PDF with mutation markers.
+    Mutations are only ever generated by the background preparation: while one is running
+    (in any worker) this returns 202 with Retry-After, and an assignment without a homework
+    document gets a preparation claimed for it instead of an inline Gemini call.
+    """
     try:
         # Check if assignment exists
         assignment = assignments_col.find_one({"_id": ObjectId(assignment_id)})
         if not assignment:
             return jsonify({"error": "Assignment not found"}), 404
-        
-        # Check cache first
-        pdf_filename = f"{assignment_id}.pdf"
-        pdf_path = os.path.join(PDF_CACHE_DIR, pdf_filename)
-        
+
+        if _integrity_preparing(assignment):
+            return _integrity_preparing_response()
+
+        visible_text = assignment.get("instructions", "")
+        download_name = f"{assignment.get('title', 'assignment')}.pdf"
+
         # Check if we have stored mutation data for this assignment
         homework = homeworks_col.find_one({"assignment_id": assignment_id})
-        
-        if os.path.exists(pdf_path) and homework:
-            # Return cached PDF
-            print(f"[PDF] Returning cached PDF for assignment {assignment_id}")
-            return send_file(
-                pdf_path,
-                mimetype="application/pdf",
-                as_attachment=True,
-                download_name=f"{assignment.get('title', 'assignment')}.pdf"
+        failed_at = assignment.get("integrityFailedAt")
+        if not homework and assignment.get("integrityStatus") == "failed" and failed_at and \
+                datetime.now(UTC) - failed_at.replace(tzinfo=UTC) < timedelta(seconds=INTEGRITY_PREP_FAILURE_BACKOFF_SECONDS):
+            return jsonify({"error": "Preparing the assignment failed", "details": assignment.get("integrityError"),
+                            "integrityStatus": "failed"}), 503
+        if not homework or assignment.get("integrityStatus") == "preparing":
+            # Never prepared (or its preparation was abandoned): claim one; concurrent requests
+            # lose the claim and also get 202, so the mutations are generated exactly once
+            schedule_integrity_prep(assignment_id, only_if_idle=True)
+            return _integrity_preparing_response()
+
+        # Students get their own subset of the marker pool, rendered on first download
+        variant = variants.variant_for_student(variants_col, homework, request.args.get("studentId"))
+        if variant:
+            pdf_key = _pdf_cache_key(assignment_id, visible_text, variant["mutated"])
+
+            def render_variant():
+                print(f"[PDF] Rendering variant {variant['bits']} for assignment {assignment_id}")
+                return build_secret_replacement_pdf(
+                    visible_text=visible_text,
+                    secret_text=variant["mutated"],
+                    output_path=None,
+                    spans=variant["spans"]
+                )
+
+            return _serve_pdf(pdf_key, download_name, render_variant)
+
+        # Cache entries are keyed by the homework version, so edits never hit a stale PDF
+        _, mutated_text = textstore.homework_prompts(homework)
+        pdf_key = _pdf_cache_key(assignment_id, visible_text, mutated_text)
+
+        def render_homework():
+            # We have homework metadata but no PDF: render it from the stored spans
+            print(f"[PDF] Regenerating PDF from existing audit info for {assignment_id}")
+            return build_secret_replacement_pdf(
+                visible_text=visible_text,
+                secret_text=mutated_text,
+                output_path=None,
+                spans=homework.get("spans")
             )
-        
-        visible_text = assignment.get("instructions", "")
 
-        # If we have homework metadata but no PDF, use the metadata to regenerate PDF
-        if homework:
-            print(f"[PDF] Regenerating PDF from existing audit info for {assignment_id}")
-            mutated_text = homework["mutated_prompt"]
-            mutations = homework.get("mutations", [])
-            changes = homework.get("changes", [])
-        else:
-            # Generate new PDF with mutations
-            print(f"[PDF] Generating new PDF for assignment {assignment_id}")
-            
-            # Use Gemini to create mutated version
-            from gemini import mutate_prompt
-            mutation_result = mutate_prompt(prompt_text=visible_text)
-            mutated_text = mutation_result["mutated"]
-            mutations = mutation_result["mutations"]
-            changes = mutation_result["changes"]
-
-        # Generate PDF
-        pdf_bytes = build_secret_replacement_pdf(
-            visible_text=visible_text,
-            secret_text=mutated_text,
-            output_path=None
-        )
-        
-        # Save to cache
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_bytes)
-        
-        # Store mutation metadata
-        if homework:
-            # Update existing (just the PDF path and timestamp)
+        response = _serve_pdf(pdf_key, download_name, render_homework)
+        if homework.get("pdf_key") != pdf_key:
+            # Record the PDF key on the homework
             homeworks_col.update_one(
-                {"assignment_id": assignment_id},
+                {"_id": homework["_id"]},
                 {"$set": {
-                    "pdf_path": pdf_path,
+                    "pdf_key": pdf_key,
                     "updated_at": datetime.now()
                 }}
             )
-        else:
-            # Create new
-            homeworks_col.insert_one({
-                "assignment_id": assignment_id,
-                "teacher_id": assignment.get("professorId"),
-                "course_id": str(assignment.get("courseId")),
-                "original_prompt": visible_text,
-                "mutated_prompt": mutated_text,
-                "mutations": mutations,
-                "changes": changes,
-                "pdf_path": pdf_path,
-                "created_at": datetime.now()
-            })
-        
-        print(f"[PDF] PDF generated and cached at {pdf_path}")
-        
-        return send_file(
-            BytesIO(pdf_bytes),
-            mimetype="application/pdf",
-            as_attachment=True,
-            download_name=f"{assignment.get('title', 'assignment')}.pdf"
-        )
-        
+        return response
+
     except Exception as e:
         print(f"[PDF] Error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+def _claim_pdf_batch(job_id: str) -> bool:
+    """Take the batch lock for job_id unless a live batch holds it (in any worker)."""
+    now = datetime.now(UTC)
+    try:
+        pdf_batches_col.update_one(
+            {"_id": "lock", "$or": [
+                {"jobId": None},
+                {"startedAt": {"$not": {"$gt": now - timedelta(seconds=PDF_BATCH_TIMEOUT_SECONDS)}}}
+            ]},
+            {"$set": {"jobId": job_id, "startedAt": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False  # the lock exists and is held
+    return True
+
+
+def _run_pdf_batch(job_id: str, options: dict):
+    try:
+        pdf_batches_col.update_one({"_id": job_id}, {"$set": {"status": "running"}})
+        report = batch_pdf.run_batch_in_subprocess(**options, timeout=PDF_BATCH_TIMEOUT_SECONDS)
+        pdf_cache.rescan()  # pick up entries written by the batch workers (other writers may still be busy)
+        print(f"[BATCH] Rendered {report['rendered']}/{report['requested']} PDFs in {report['seconds']}s "
+              f"({report['pdfsPerSecond']} PDFs/s, {report['workers']} workers)")
+        pdf_batches_col.update_one({"_id": job_id}, {"$set": {
+            "status": "done", "report": report, "finishedAt": datetime.now(UTC)
+        }})
+    except Exception as e:
+        print(f"[BATCH] Error: {str(e)}")
+        traceback.print_exc()
+        pdf_batches_col.update_one({"_id": job_id}, {"$set": {
+            "status": "failed", "error": str(e), "finishedAt": datetime.now(UTC)
+        }})
+    finally:
+        pdf_batches_col.update_one({"_id": "lock", "jobId": job_id}, {"$set": {"jobId": None}})
+
+
+@app.route("/api/pdfs/batch", methods=["POST"])
+def batch_render_pdfs():
+    """
+    Render PDFs for many assignments/homeworks on a process pool and warm the PDF cache.
+    The batch runs in the background: answers 202 {jobId, status}; poll GET /api/pdfs/batch/<jobId>
+    for the report. Only one batch runs at a time; an overlapping request gets 409 with the running jobId.
+    """
+    data = request.get_json(silent=True) or {}
+    assignment_ids = data.get("assignmentIds") or []
+    homework_ids = data.get("homeworkIds") or []
+    all_assignments = bool(data.get("all"))
+    if not (all_assignments or assignment_ids or homework_ids):
+        return jsonify({"error": "Provide 'assignmentIds', 'homeworkIds' or 'all': true"}), 400
+    try:
+        workers = int(data["workers"]) if data.get("workers") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "workers must be an integer"}), 400
+
+    options = {
+        "assignment_ids": assignment_ids,
+        "homework_ids": homework_ids,
+        "all_assignments": all_assignments,
+        "workers": workers,
+        "force": bool(data.get("force"))
+    }
+    try:
+        job_id = uuid.uuid4().hex
+        if not _claim_pdf_batch(job_id):
+            lock = pdf_batches_col.find_one({"_id": "lock"}) or {}
+            return jsonify({"error": "A PDF batch is already running", "jobId": lock.get("jobId")}), 409
+        pdf_batches_col.insert_one({"_id": job_id, "status": "queued", "options": options,
+                                    "createdAt": datetime.now(UTC)})
+        batch_executor.submit(_run_pdf_batch, job_id, options)
+        print(f"[BATCH] Started job {job_id}")
+        return jsonify({"jobId": job_id, "status": "queued"}), 202
+    except Exception as e:
+        print(f"[BATCH] Error: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/pdfs/batch/<job_id>", methods=["GET"])
+def get_pdf_batch(job_id):
+    """Status of a batch job: queued, running, done (with its report) or failed (with the error)."""
+    job = pdf_batches_col.find_one({"_id": job_id}) if job_id != "lock" else None
+    if not job:
+        return jsonify({"error": "Batch job not found"}), 404
+    started = job["createdAt"] if job["createdAt"].tzinfo else job["createdAt"].replace(tzinfo=UTC)
+    if job["status"] in ("queued", "running") and \
+            datetime.now(UTC) - started > timedelta(seconds=PDF_BATCH_TIMEOUT_SECONDS):
+        job["status"] = "abandoned"  # its worker died without recording a result
+    job["jobId"] = job.pop("_id")
+    return jsonify(job)
+
+
 @app.route("/api/assignments/<assignment_id>", methods=["GET", "PUT"])
 def get_assignment(assignment_id):
-    """Get or update a single assignment by ID."""
+    """
+    Get or update a single assignment by ID.
+    PUT stores the new content and answers 202 {success, integrityStatus: "preparing"}; the new
+    mutations are generated in the background and are no longer part of the PUT response.
+    GET returns them (mutations, mutated_prompt) once integrityStatus is "ready".
+    """
     if request.method == "GET":
         try:
             assignment = assignments_col.find_one({"_id": ObjectId(assignment_id)})
@@ -679,7 +1066,7 @@ def get_assignment(assignment_id):
             homework = homeworks_col.find_one({"assignment_id": assignment_id})
             if homework:
                 assignment["mutations"] = homework.get("mutations", [])
-                assignment["mutated_prompt"] = homework.get("mutated_prompt", "")
+                assignment["mutated_prompt"] = textstore.homework_prompts(homework)[1]
             
             return jsonify({"assignment": assignment})
         except Exception as e:
@@ -694,40 +1081,25 @@ def get_assignment(assignment_id):
             if not content:
                 return jsonify({"error": "Content is required"}), 400
             
-            # Regenerate mutations for the new content
-            print(f"[ASSIGNMENT] Regenerating mutations for assignment {assignment_id}")
-            from gemini import mutate_prompt # Ensure mutate_prompt is available
-            mutation_result = mutate_prompt(prompt_text=content)
-            mutated_text = mutation_result["mutated"]
-            mutations = mutation_result["mutations"]
-            changes = mutation_result["changes"]
-            
-            # Update homework metadata in MongoDB
-            homework_doc = {
-                "assignment_id": assignment_id,
-                "original_prompt": content,
-                "mutated_prompt": mutated_text,
-                "mutations": mutations,
-                "changes": changes
-            }
-            
-            homeworks_col.update_one(
-                {"assignment_id": assignment_id},
-                {"$set": homework_doc},
-                upsert=True
-            )
-            
             # Update assignment content
-            assignments_col.update_one(
+            result = assignments_col.update_one(
                 {"_id": ObjectId(assignment_id)},
                 {"$set": {"instructions": content, "updatedAt": datetime.now(UTC)}} # Changed 'content' to 'instructions' to match schema
             )
+            if result.matched_count == 0:
+                return jsonify({"error": "Assignment not found"}), 404
+            
+            # The cached PDF was built from the old content
+            pdf_cache.invalidate(assignment_id)
+            
+            # Regenerate mutations, homework and PDF in the background
+            print(f"[ASSIGNMENT] Regenerating mutations for assignment {assignment_id}")
+            schedule_integrity_prep(assignment_id)
             
             return jsonify({
                 "success": True,
-                "mutations": mutations,
-                "changes": changes
-            })
+                "integrityStatus": "preparing"
+            }), 202
         except Exception as e:
             print(f"[ASSIGNMENT] Update error: {str(e)}")
             return jsonify({"error": str(e)}), 500
@@ -737,7 +1109,11 @@ def get_assignment(assignment_id):
 def get_assignment_submissions(assignment_id):
     """Get all submissions for an assignment."""
     try:
-        submissions = list(submissions_col.find({"assignmentId": ObjectId(assignment_id)}))
+        # The list view needs no submission text or transcripts; leave them out of the transfer
+        submissions = list(submissions_read_col.find(
+            {"assignmentId": ObjectId(assignment_id)},
+            {field: 0 for field in SUBMISSION_LIST_EXCLUDED_FIELDS}
+        ))
         
         # Convert all ObjectIds to strings recursively
         submissions = [convert_objectids(sub) for sub in submissions]
@@ -749,6 +1125,27 @@ def get_assignment_submissions(assignment_id):
         return jsonify({"error": str(e), "submissions": []}), 500
 
 
+@app.route("/api/assignments/<assignment_id>/similarity", methods=["GET"])
+def get_assignment_similarity(assignment_id):
+    """Report clusters of near-duplicate submissions for an assignment."""
+    try:
+        threshold = float(request.args.get("threshold", similarity.DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "threshold must be a number"}), 400
+
+    try:
+        clusters = similarity.near_duplicate_clusters(similarity_col, assignment_id, threshold=threshold)
+        print(f"[SIMILARITY] {len(clusters)} clusters for assignment {assignment_id}")
+        return jsonify({
+            "clusters": clusters,
+            "threshold": threshold,
+            "indexedCount": similarity_col.count_documents({"assignmentId": assignment_id})
+        })
+    except Exception as e:
+        print(f"[SIMILARITY] Error: {str(e)}")
+        return jsonify({"error": str(e), "clusters": []}), 500
+
+
 @app.route("/api/assignments/<assignment_id>/status", methods=["PATCH"])
 def update_assignment_status(assignment_id):
     """Update assignment status: open, hidden, or deleted."""
@@ -757,12 +1154,17 @@ def update_assignment_status(assignment_id):
     if status not in ["open", "hidden", "deleted"]:
         return jsonify({"error": "Invalid status. Must be open, hidden, or deleted"}), 400
     try:
-        result = assignments_col.update_one(
+        previous = assignments_col.find_one_and_update(
             {"_id": ObjectId(assignment_id)},
-            {"$set": {"status": status, "updatedAt": datetime.now(UTC)}}
+            {"$set": {"status": status, "updatedAt": datetime.now(UTC)}},
+            projection={"status": 1, "courseId": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({"error": "Assignment not found"}), 404
+        was_deleted = previous.get("status") == "deleted"
+        if was_deleted != (status == "deleted"):
+            counters.incr_course(db, previous.get("courseId"), assignments=1 if was_deleted else -1)
         assignment = assignments_col.find_one({"_id": ObjectId(assignment_id)})
         assignment["_id"] = str(assignment["_id"])
         assignment["courseId"] = str(assignment["courseId"])
@@ -779,12 +1181,23 @@ def generate_rubric():
     title = data.get("title", "")
     if not instructions:
         return jsonify({"error": "instructions required"}), 400
-    cache_key = _hash_key(["rubric_gen", instructions])
-    cached = cache_get(cache_key)
+    cache_parts = [instructions]
+    cached = result_cache.get("rubric_gen", cache_parts)
+    if _wants_stream():
+        def events():
+            if cached:
+                yield "result", {"rubric": cached, "cached": True}
+                return
+            for event, payload in stream_rubric_suggestions(instructions=instructions, title=title):
+                if event == "result":
+                    result_cache.set("rubric_gen", cache_parts, payload, ttl_seconds=3600)
+                    payload = {"rubric": payload, "cached": False}
+                yield event, payload
+        return _sse_response(events(), "RUBRIC")
     if cached:
         return jsonify({"rubric": cached, "cached": True})
     rubric = generate_rubric_suggestions(instructions=instructions, title=title)
-    cache_set(cache_key, rubric, ttl_seconds=3600)
+    result_cache.set("rubric_gen", cache_parts, rubric, ttl_seconds=3600)
     return jsonify({"rubric": rubric, "cached": False})
 
 
@@ -805,9 +1218,10 @@ def assignment_rubric(assignment_id):
         
         if "rubric" in data:
             rubric = data["rubric"]
-            total = sum(item.get("maxPoints", 0) for item in rubric)
+            compiled = compile_rubric(rubric)
             update_fields["rubric"] = rubric
-            update_fields["totalPoints"] = total
+            update_fields["rubricCompiled"] = compiled
+            update_fields["totalPoints"] = compiled["totalPoints"]
             
         if "visibleToStudents" in data:
             update_fields["rubricVisibleToStudents"] = bool(data["visibleToStudents"])
@@ -816,6 +1230,8 @@ def assignment_rubric(assignment_id):
             {"_id": ObjectId(assignment_id)},
             {"$set": update_fields}
         )
+        if "rubric" in data:
+            result_cache.invalidate(tags=[assignment_tag(assignment_id)], namespaces=["grade", "grade-digest", "analytics"])
         
         # Return updated document state
         updated = assignments_col.find_one({"_id": ObjectId(assignment_id)})
@@ -826,7 +1242,90 @@ def assignment_rubric(assignment_id):
         })
 
 
-def _grade_submission(submission_id):
+@app.route("/api/assignments/<assignment_id>/rubric/stats", methods=["GET"])
+def rubric_stats(assignment_id):
+    """Class-wide per-criterion statistics over all auto-grades for an assignment."""
+    try:
+        assignment = assignments_read_col.find_one({"_id": ObjectId(assignment_id)}, {"rubric": 1, "rubricCompiled": 1})
+        if not assignment:
+            return jsonify({"error": "Assignment not found"}), 404
+        stats = criterion_stats(submissions_read_col, assignment)
+        return jsonify({
+            "assignmentId": assignment_id,
+            "graded": max((s["count"] for s in stats), default=0),
+            "criteria": stats
+        })
+    except Exception as e:
+        print(f"[RUBRIC] Stats error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/markers/stats", methods=["GET"])
+def get_marker_stats():
+    """Marker kinds ranked by hit rate and interview-confirmed precision, plus the current mutation guidance."""
+    try:
+        ranked = marker_stats.ranking(db, refresh=request.args.get("refresh") == "1")
+        return jsonify({"kinds": ranked, "guidance": marker_stats.guidance(db)})
+    except Exception as e:
+        print(f"[MARKERS] Stats error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/assignments/<assignment_id>/analytics", methods=["GET"])
+def assignment_analytics(assignment_id):
+    """Class-wide grade analytics: criterion stats, score histograms, auto/manual disagreement, verdicts, marker hits."""
+    try:
+        cached = result_cache.get("analytics", [assignment_id])
+        if cached:
+            return jsonify({**cached, "cached": True})
+
+        assignment = assignments_read_col.find_one({"_id": ObjectId(assignment_id)}, {"rubric": 1, "rubricCompiled": 1})
+        if not assignment:
+            return jsonify({"error": "Assignment not found"}), 404
+        homework = homeworks_col.find_one(
+            {"assignment_id": assignment_id},
+            {"assignment_id": 1, "changes": 1, "marker_pool": 1, "pool_hash": 1}
+        )
+        result = analytics.assignment_analytics(submissions_read_col, variants_col, assignment, homework)
+        result_cache.set("analytics", [assignment_id], result, ttl_seconds=analytics.ANALYTICS_TTL_SECONDS,
+                         tags=[assignment_tag(assignment_id)])
+        return jsonify({**result, "cached": False})
+    except Exception as e:
+        print(f"[ANALYTICS] Error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _grade_text(assignment, submission_text, use_digest: bool = False):
+    """
+    Grade text against the assignment rubric, cached by rubric and text. Returns (result, cached).
+    use_digest grades the stored submission digest instead of the raw text (for re-grades).
+    """
+    compiled = load_rubric(assignment)
+    namespace = "grade-digest" if use_digest else "grade"
+    cache_parts = [compiled.hash, submission_text]
+    cached = result_cache.get(namespace, cache_parts)
+    if cached:
+        return cached, True
+
+    # Objective criteria (length, citations, sections) are scored locally from the full text
+    criteria_results = compiled.apply_rules(submission_text)
+    if compiled.llm_rubric:
+        digest_text = None
+        if use_digest and digests.worth_digesting(submission_text):
+            digest_text = digests.as_prompt_text(digests.ensure_digest(db, submission_text), len(submission_text))
+        grading = grade_with_rubric(submission_text=submission_text, rubric=compiled.llm_rubric,
+                                    instructions=assignment.get("instructions", ""), digest_text=digest_text)
+        criteria_results += grading.get("criteria", [])
+    result = compiled.score(criteria_results)
+    if digest_text:
+        result["source"] = "digest"
+
+    if not result.get("incomplete"):
+        result_cache.set(namespace, cache_parts, result, ttl_seconds=3600, tags=[assignment_tag(assignment["_id"])])
+    return result, False
+
+
+def _grade_submission(submission_id, use_digest: bool = False):
     submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
     if not submission:
         return {"error": "Submission not found", "status": 404}
@@ -836,61 +1335,297 @@ def _grade_submission(submission_id):
     rubric = assignment.get("rubric", [])
     if not rubric:
         return {"error": "Rubric not configured", "status": 400}
-    submission_text = submission.get("submittedText")
+    submission_text = textstore.submission_text(submission)
     if not submission_text:
         return {"error": "No submission text to grade", "status": 400}
 
-    rubric_hash = _hash_key(["rubric", json.dumps(rubric, sort_keys=True)])
-    cache_key = _hash_key(["grade", rubric_hash, submission_text])
-    cached = cache_get(cache_key)
-    if cached:
-        return {"result": cached, "cached": True, "status": 200}
-
-    grading = grade_with_rubric(submission_text=submission_text, rubric=rubric, instructions=assignment.get("instructions", ""))
-    criteria_results = grading.get("criteria", [])
-    # attach maxPoints
-    rubric_map = {item.get("id") or item.get("criterion"): item for item in rubric}
-    final_criteria = []
-    total_score = 0
-    total_max = 0
-    for item in rubric:
-        cid = item.get("id") or item.get("criterion")
-        matched = next((c for c in criteria_results if c.get("criterionId") == cid), None)
-        earned = matched.get("pointsEarned", 0) if matched else 0
-        max_pts = item.get("maxPoints", 0)
-        total_score += earned
-        total_max += max_pts
-        final_criteria.append({
-            "criterionId": cid,
-            "criterion": item.get("criterion"),
-            "maxPoints": max_pts,
-            "pointsEarned": earned,
-            "justification": (matched.get("justification") if matched else "")
-        })
+    # Keep the cross-submission similarity index current as submissions land
+    try:
+        similarity.index_submission(
+            similarity_col,
+            assignment_id=str(submission.get("assignmentId")),
+            submission_id=str(submission["_id"]),
+            text=submission_text,
+            student_id=submission.get("studentId")
+        )
+    except Exception as e:
+        print(f"[SIMILARITY] Indexing error for {submission_id}: {str(e)}")
 
-    result = {
-        "totalScore": total_score,
-        "maxScore": total_max,
-        "gradedAt": datetime.now(UTC).isoformat(),
-        "criteria": final_criteria
-    }
+    result, cached = _grade_text(assignment, submission_text, use_digest=use_digest)
+    if cached:
+        return {"result": result, "cached": True, "status": 200}
 
     submissions_col.update_one(
         {"_id": ObjectId(submission_id)},
         {"$set": {"autoGrade": result, "updatedAt": datetime.now(UTC)}}
     )
-    cache_set(cache_key, result, ttl_seconds=3600)
+    invalidate_analytics(submission.get("assignmentId"))
     return {"result": result, "cached": False, "status": 200}
 
 
 @app.route("/api/submissions/<submission_id>/auto-grade", methods=["POST"])
 def auto_grade_submission(submission_id):
-    out = _grade_submission(submission_id)
+    # ?source=digest re-grades from the submission digest instead of the full text
+    out = _grade_submission(submission_id, use_digest=request.args.get("source") == "digest")
     if "error" in out:
         return jsonify({"error": out["error"]}), out.get("status", 500)
     return jsonify({"autoGrade": out["result"], "cached": out.get("cached", False)})
 
 
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, _elapsed_ms(start)
+
+
+def _detection_target(homework: dict, student_id: str):
+    """(homework to detect against, cache key, markers given) for the markers this student actually received."""
+    detect_homework, detect_key = homework, str(homework["_id"])
+    given_markers = homework.get("spans") or homework.get("mutations", [])
+    variant = variants.variant_for_student(variants_col, homework, student_id)
+    if variant:
+        given_markers = variant["mutations"]
+        detect_homework = {
+            "original_prompt": textstore.original_prompt(homework),
+            "mutated_prompt": variant["mutated"],
+            "changes": variant["changes"],
+            "detection_index": variant["detection_index"]
+        }
+        detect_key = f"{homework['_id']}:{variant['bits']}"
+    return detect_homework, detect_key, given_markers
+
+
+def _score_detection(analysis: dict, threshold: float):
+    """(markers found, cheating score, flagged, indicators for display) from a detection result."""
+    # Parse cheating score (e.g., "2/3" -> 0.67)
+    found, total = [int(x) for x in analysis.get("score", "0/0").split("/")]
+    cheating_score = found / total if total > 0 else 0
+    indicators_found = [
+        {
+            "type": ind.get("type") or "marker_found",
+            "evidence": ind.get("evidence") or ind.get("change") or "",
+            "location": ind.get("location") or (ind.get("locations") or ["unknown"])[0]
+        }
+        for ind in analysis.get("indicators_found", [])
+    ]
+    indicators_found = [ind for ind in indicators_found if ind["evidence"]]
+    return found, cheating_score, cheating_score > threshold, indicators_found
+
+
+def _analysis_failed(error: Exception) -> dict:
+    """Placeholder detection result for a submission whose detection failed; never flags."""
+    return {"score": "0/0", "indicators_found": [], "summary": "Analysis pending: detection failed", "error": str(error)}
+
+
+@app.route("/api/submissions/pipeline", methods=["POST"])
+def submission_pipeline():
+    """Extract, detect and grade a submission in one request, then persist it with a single write."""
+    started = time.perf_counter()
+    timings = {}
+
+    file = request.files.get("file")
+    data = request.form.to_dict() if (file or request.form) else (request.get_json(silent=True) or {})
+    assignment_id = data.get("assignmentId")
+    student_id = data.get("studentId")
+    submission_text = data.get("submissionText", "")
+
+    if not assignment_id or not student_id:
+        return jsonify({"error": "Provide assignmentId and studentId"}), 400
+    try:
+        threshold = float(data.get("plagiarismThreshold", PLAGIARISM_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({"error": "plagiarismThreshold must be a number"}), 400
+
+    try:
+        try:
+            assignment = assignments_col.find_one({"_id": ObjectId(assignment_id)})
+        except Exception:
+            return jsonify({"error": "Invalid assignment ID"}), 400
+        if not assignment:
+            return jsonify({"error": "Assignment not found"}), 404
+
+        homework = homeworks_col.find_one({"assignment_id": assignment_id})
+        if not homework:
+            return jsonify({"error": "Audit info not found for this assignment"}), 404
+
+        # Extract text once; both stages reuse it. The PDF itself is kept in the upload store.
+        stage = time.perf_counter()
+        submitted_pdf = None
+        if file:
+            try:
+                submission_text, submitted_pdf = _store_upload(file, {"assignmentId": assignment_id, "studentId": student_id})
+            except Exception:
+                return jsonify({"error": "Failed to extract text from PDF"}), 400
+        timings["extractMs"] = _elapsed_ms(stage)
+
+        if not submission_text:
+            return jsonify({"error": "No submission text provided"}), 400
+
+        # Detection and grading are independent LLM calls, so run them concurrently
+        stage = time.perf_counter()
+        # Detect against the markers this student was actually given
+        detect_homework, detect_key, given_markers = _detection_target(homework, student_id)
+        detect_future = pipeline_executor.submit(
+            _in_request_context, _timed, _detect_for_homework, detect_homework, detect_key, submission_text,
+            [assignment_tag(assignment_id)]
+        )
+        grade_future = None
+        if assignment.get("rubric"):
+            grade_future = pipeline_executor.submit(_in_request_context, _timed, _grade_text, assignment, submission_text)
+
+        analysis_failed = False
+        try:
+            analysis, timings["detectMs"] = detect_future.result()
+        except Exception as e:
+            # Neither should detection failures: store the submission unflagged and re-run it later
+            # (POST /api/submissions/<id>/analyze)
+            print(f"[PIPELINE] Detection error: {str(e)}")
+            analysis, analysis_failed = _analysis_failed(e), True
+        auto_grade = None
+        if grade_future:
+            try:
+                (auto_grade, _), timings["gradeMs"] = grade_future.result()
+            except Exception as e:
+                # Grading failures should not lose the submission
+                print(f"[PIPELINE] Grading error: {str(e)}")
+        timings["analysisMs"] = _elapsed_ms(stage)
+
+        found, cheating_score, flagged, indicators_found = _score_detection(analysis, threshold)
+
+        marker_outcome = None
+        if not analysis_failed:
+            try:
+                marker_outcome = marker_stats.record_detection(db, given_markers, analysis)
+            except Exception as e:
+                print(f"[MARKERS] Could not record marker hits: {str(e)}")
+
+        # Persist submission, analysis and grade in one write
+        stage = time.perf_counter()
+        now = datetime.now(UTC)
+        submission = {
+            "assignmentId": ObjectId(assignment_id),
+            "studentId": student_id,
+            "teacherId": assignment.get("professorId"),
+            **textstore.pack_field("submittedText", submission_text),
+            "cheatingScore": cheating_score,
+            "indicatorsFound": indicators_found,
+            "analysis": analysis,
+            "analysisStatus": "error" if analysis_failed else "complete",
+            "status": "flagged" if flagged else "submitted",
+            "submittedAt": now,
+            "needsInterview": flagged,
+            "interviewCompleted": False,
+            "suspicionScore": found,
+            "createdAt": now,
+            "updatedAt": now
+        }
+        if auto_grade:
+            submission["autoGrade"] = auto_grade
+        if marker_outcome:
+            submission["markerOutcome"] = marker_outcome
+        if submitted_pdf:
+            submission["submittedPdf"] = submitted_pdf
+        result = submissions_col.insert_one(submission)
+        submission_id = str(result.inserted_id)
+        counters.incr_teacher(db, submission["teacherId"], submissions=1, pending=1 if flagged else 0)
+        invalidate_analytics(assignment_id)
+        if flagged:
+            # The interview will need the digest; build it while the student gets there
+            pipeline_executor.submit(_warm_digest, submission_text)
+        timings["persistMs"] = _elapsed_ms(stage)
+
+        try:
+            similarity.index_submission(
+                similarity_col,
+                assignment_id=assignment_id,
+                submission_id=submission_id,
+                text=submission_text,
+                student_id=student_id
+            )
+        except Exception as e:
+            print(f"[SIMILARITY] Indexing error for {submission_id}: {str(e)}")
+
+        timings["totalMs"] = _elapsed_ms(started)
+        print(f"[PIPELINE] Stored submission {submission_id} timings={timings}")
+
+        return jsonify({
+            "success": True,
+            "submissionId": submission_id,
+            "cheatingScore": cheating_score,
+            "needsInterview": flagged,
+            "analysis": analysis,
+            "analysisStatus": submission["analysisStatus"],
+            "autoGrade": auto_grade,
+            "timings": timings
+        })
+    except Exception as e:
+        print(f"[PIPELINE] Error: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/submissions/<submission_id>/analyze", methods=["POST"])
+def reanalyze_submission(submission_id):
+    """Re-run marker detection for a stored submission (e.g. analysisStatus "error" after a Gemini failure)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        threshold = float(data.get("plagiarismThreshold", PLAGIARISM_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({"error": "plagiarismThreshold must be a number"}), 400
+    try:
+        submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
+        if not submission:
+            return jsonify({"error": "Submission not found"}), 404
+        assignment_id = str(submission.get("assignmentId"))
+        homework = homeworks_col.find_one({"assignment_id": assignment_id})
+        if not homework:
+            return jsonify({"error": "Audit info not found for this assignment"}), 404
+        submission_text = textstore.submission_text(submission)
+        if not submission_text:
+            return jsonify({"error": "No submission text to analyze"}), 400
+
+        detect_homework, detect_key, given_markers = _detection_target(homework, submission.get("studentId"))
+        analysis = _detect_for_homework(detect_homework, detect_key, submission_text, [assignment_tag(assignment_id)])
+        found, cheating_score, flagged, indicators_found = _score_detection(analysis, threshold)
+
+        update_fields = {
+            "cheatingScore": cheating_score,
+            "indicatorsFound": indicators_found,
+            "analysis": analysis,
+            "analysisStatus": "complete",
+            "suspicionScore": found,
+            "updatedAt": datetime.now(UTC)
+        }
+        # A re-run may raise a flag but never clears one (or an interview) that already exists
+        newly_flagged = flagged and not submission.get("needsInterview")
+        if newly_flagged:
+            update_fields.update({"needsInterview": True, "status": "flagged"})
+        if not submission.get("markerOutcome"):
+            try:
+                update_fields["markerOutcome"] = marker_stats.record_detection(db, given_markers, analysis)
+            except Exception as e:
+                print(f"[MARKERS] Could not record marker hits: {str(e)}")
+
+        submissions_col.update_one({"_id": submission["_id"]}, {"$set": update_fields})
+        if newly_flagged and not submission.get("interviewCompleted"):
+            counters.incr_teacher(db, submission.get("teacherId"), pending=1)
+        invalidate_analytics(submission.get("assignmentId"))
+        print(f"[ANALYZE] Re-ran detection for {submission_id}: {analysis.get('score')} (flagged={flagged})")
+        return jsonify({
+            "success": True,
+            "cheatingScore": cheating_score,
+            "needsInterview": bool(flagged or submission.get("needsInterview")),
+            "analysis": analysis
+        })
+    except Exception as e:
+        print(f"[ANALYZE] Error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/submissions/<submission_id>/grade", methods=["GET"])
 def get_submission_grade(submission_id):
     submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
@@ -937,6 +1672,7 @@ def save_manual_grade(submission_id):
                 }
             }
         )
+        invalidate_analytics(submission.get("assignmentId"))
         
         return jsonify({"success": True, "manualGrade": manual_grade})
     
@@ -947,7 +1683,12 @@ def save_manual_grade(submission_id):
 
 @app.route("/api/submissions/<submission_id>", methods=["GET"])
 def get_submission(submission_id):
-    """Get a single submission by ID."""
+    """Get a single submission by ID, with its near-duplicates among the assignment's submissions."""
+    try:
+        threshold = float(request.args.get("similarityThreshold", similarity.DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({"error": "similarityThreshold must be a number"}), 400
+
     try:
         submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
         
@@ -957,14 +1698,11 @@ def get_submission(submission_id):
         # Convert all ObjectIds to strings recursively
         submission = convert_objectids(submission)
         
-        # Backward-compat: unify response text field
-        # Prefer 'submittedText', fall back to legacy 'submissionText' or 'response_text'
-        unified_text = (
-            submission.get("submittedText")
-            or submission.get("submissionText")
-            or submission.get("response_text")
-        )
-        if unified_text is not None:
+        # Backward-compat: unify response text field (decompressed from whichever field holds it)
+        unified_text = textstore.submission_text(submission)
+        for field in textstore.SUBMISSION_STORED_FIELDS:
+            submission.pop(field, None)
+        if unified_text:
             submission["submittedText"] = unified_text
             submission["response_text"] = unified_text
 
@@ -976,13 +1714,101 @@ def get_submission(submission_id):
                 ind for ind in indicators 
                 if ind.get("type") and ind.get("evidence") and ind.get("location")
             ]
-        
+
+        # Near-duplicates from the similarity index (filled when submissions are stored or graded)
+        similar = []
+        if submission.get("assignmentId"):
+            try:
+                similar = similarity.find_similar(
+                    similarity_col, submission["assignmentId"], submission_id, threshold=threshold
+                )
+            except Exception as e:
+                print(f"[SIMILARITY] Lookup error for {submission_id}: {str(e)}")
+        submission["similarSubmissions"] = similar
+
         return jsonify({"submission": submission})
     except Exception as e:
         print(f"[SUBMISSION] Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/submissions/<submission_id>/pdf", methods=["GET"])
+def get_submission_pdf(submission_id):
+    """Stream the PDF a student uploaded, straight from the upload store."""
+    try:
+        submission = submissions_col.find_one(
+            {"_id": ObjectId(submission_id)},
+            {"submittedPdf": 1, "response_pdf": 1, "studentId": 1}
+        )
+        if not submission:
+            return jsonify({"error": "Submission not found"}), 404
+        pdf = submission.get("submittedPdf") or submission.get("response_pdf")
+        stored = upload_store.open(pdf["blob"]) if pdf else None
+        if stored is None:
+            return jsonify({"error": "No PDF stored for this submission"}), 404
+        return send_file(
+            stored,
+            mimetype="application/pdf",
+            as_attachment=True,
+            download_name=f"submission-{submission_id}.pdf",
+            conditional=True,
+            etag=pdf["blob"],
+            max_age=3600
+        )
+    except Exception as e:
+        print(f"[SUBMISSION] PDF error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _apply_interview_analysis(submission: dict, transcript: list, analysis: dict) -> dict:
+    """Store the transcript and verdict on the submission and return the response payload."""
+    # Determine status based on score
+    # Using exact user requirements: <50 = suspicious, >50 = verified
+    score = analysis.get("score", 0)
+    new_status = "flagged" if score < 50 else "verified"
+    print(f"[TRANSCRIPT] Calculated verdict: {new_status} (Score: {score})")
+    
+    update_fields = {
+        "interviewTranscript": transcript,
+        "interviewScore": score,
+        "interviewReasoning": analysis.get("reasoning", ""),
+        "interviewVerdict": new_status, # Use the calculated status directly
+        "interviewCompleted": True,
+        "updatedAt": datetime.now(UTC)
+    }
+    
+    # Only update status if it was previously flagged/suspicious
+    if submission.get("status") == "flagged" or submission.get("status") == "pending":
+         update_fields["status"] = new_status
+
+    # Completing the first interview clears a pending review
+    result = submissions_col.update_one(
+        {"_id": submission["_id"], "interviewCompleted": {"$ne": True}},
+        {"$set": update_fields}
+    )
+    if result.modified_count:
+        if submission.get("needsInterview"):
+            counters.incr_teacher(db, submission.get("teacherId"), pending=-1)
+        # Only the first verdict counts towards marker precision
+        try:
+            marker_stats.record_verdict(db, submission.get("markerOutcome"), new_status)
+        except Exception as e:
+            print(f"[MARKERS] Could not record verdict: {str(e)}")
+    elif result.matched_count == 0:
+        result = submissions_col.update_one(
+            {"_id": submission["_id"]},
+            {"$set": update_fields}
+        )
+    print(f"[TRANSCRIPT] DB Update acknowledged: {result.acknowledged}, Modified: {result.modified_count}")
+    invalidate_analytics(submission.get("assignmentId"))
+    
+    return {
+        "success": True,
+        "analysis": analysis,
+        "newStatus": new_status
+    }
+
+
 @app.route("/api/submissions/<submission_id>/transcript", methods=["POST"])
 def save_transcript(submission_id):
     """Save interview transcript and analyze it."""
@@ -999,45 +1825,150 @@ def save_transcript(submission_id):
         
         # Analyze the interview
         print(f"[TRANSCRIPT] Analyzing transcript length: {len(transcript)}")
+        # Interviews recorded turn by turn only need the closing call
+        stored = submission.get("interviewTranscript", [])
+        if submission.get("interviewProgress") and transcript[:len(stored)] == stored and not _wants_stream():
+            submission["interviewTranscript"] = transcript
+            return jsonify(_finalize_interview(submission))
+
+        digest_text = _interview_digest_text(submission)
+        if _wants_stream():
+            def events():
+                for event, payload in stream_interview_analysis(transcript, textstore.submission_text(submission), digest_text):
+                    if event == "result":
+                        print(f"[TRANSCRIPT] Analysis result: {payload}")
+                        payload = _apply_interview_analysis(submission, transcript, payload)
+                    yield event, payload
+            return _sse_response(events(), "TRANSCRIPT")
+
         analysis = analyze_interview_transcript(
             transcript=transcript,
-            submission_text=submission.get("response_text", "")
+            submission_text=textstore.submission_text(submission),
+            digest_text=digest_text
         )
         print(f"[TRANSCRIPT] Analysis result: {analysis}")
         
-        # Determine status based on score
-        # Using exact user requirements: <50 = suspicious, >50 = verified
-        score = analysis.get("score", 0)
-        new_status = "flagged" if score < 50 else "verified"
-        print(f"[TRANSCRIPT] Calculated verdict: {new_status} (Score: {score})")
-        
-        update_fields = {
-            "interviewTranscript": transcript,
-            "interviewScore": score,
-            "interviewReasoning": analysis.get("reasoning", ""),
-            "interviewVerdict": new_status, # Use the calculated status directly
-            "interviewCompleted": True,
-            "updatedAt": datetime.now(UTC)
-        }
-        
-        # Only update status if it was previously flagged/suspicious
-        if submission.get("status") == "flagged" or submission.get("status") == "pending":
-             update_fields["status"] = new_status
+        return jsonify(_apply_interview_analysis(submission, transcript, analysis))
 
-        result = submissions_col.update_one(
-            {"_id": ObjectId(submission_id)},
-            {"$set": update_fields}
-        )
-        print(f"[TRANSCRIPT] DB Update acknowledged: {result.acknowledged}, Modified: {result.modified_count}")
-        
+    except Exception as e:
+        print(f"[TRANSCRIPT] Error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _warm_digest(submission_text: str):
+    if not digests.worth_digesting(submission_text):
+        return
+    try:
+        digests.ensure_digest(db, submission_text)
+    except Exception as e:
+        print(f"[DIGEST] Could not build digest: {str(e)}")
+
+
+def _interview_digest_text(submission: dict):
+    """
+    Digest prompt text for interview analysis (replaces the first 5000 characters of the submission);
+    None for submissions short enough to send whole.
+    """
+    submission_text = textstore.submission_text(submission)
+    if not digests.worth_digesting(submission_text):
+        return None
+    return digests.as_prompt_text(digests.ensure_digest(db, submission_text), min(len(submission_text), 5000))
+
+
+def _interview_exchange_text(submission: dict) -> str:
+    """The submission as exchange assessments see it: its digest, or the text itself when short."""
+    return _interview_digest_text(submission) or textstore.submission_text(submission)
+
+
+def _finalize_interview(submission: dict) -> dict:
+    """Assess the remaining turns, make the closing call and store the verdict."""
+    transcript = submission.get("interviewTranscript", [])
+    progress = interview.advance(submissions_col, submission, lambda: _interview_exchange_text(submission), final=True)
+    if progress["exchanges"]:
+        analysis = finalize_interview(interview.notes(progress), progress["runningScore"])
+    else:
+        # Nothing was said by the student: fall back to the one-shot analysis
+        analysis = analyze_interview_transcript(transcript=transcript, submission_text=textstore.submission_text(submission),
+                                                digest_text=_interview_digest_text(submission))
+    print(f"[INTERVIEW] Final analysis after {len(progress['exchanges'])} exchanges: {analysis}")
+    payload = _apply_interview_analysis(submission, transcript, analysis)
+    payload["exchanges"] = len(progress["exchanges"])
+    return payload
+
+
+def _append_turns(submission: dict, data: dict):
+    """
+    Store new turns on the submission. With `offset` (the transcript length the client
+    had before these turns) retried turns are skipped and ordering is enforced.
+    Returns (submission, error response or None).
+    """
+    turns = data.get("turns") or ([data["turn"]] if data.get("turn") else [])
+    stored = len(submission.get("interviewTranscript", []))
+    query = {"_id": submission["_id"], "interviewCompleted": {"$ne": True}}
+    if data.get("offset") is not None:
+        offset = int(data["offset"])
+        if offset > stored:
+            return submission, (jsonify({"error": "Turns are missing before offset", "stored": stored}), 409)
+        turns = turns[stored - offset:]
+        query["interviewTranscript"] = {"$size": stored} if stored else {"$in": [None, []]}
+    if not turns:
+        return submission, None
+
+    updated = submissions_col.find_one_and_update(
+        query,
+        {
+            "$push": {"interviewTranscript": {"$each": turns}},
+            "$set": {"updatedAt": datetime.now(UTC)}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        return submission, (jsonify({"error": "Transcript changed concurrently or interview already completed",
+                                     "stored": stored}), 409)
+    return updated, None
+
+
+@app.route("/api/submissions/<submission_id>/interview/turns", methods=["POST"])
+def append_interview_turns(submission_id):
+    """Append interview turns ({turns: [{role, content}], offset?}) and assess any exchanges they complete."""
+    try:
+        submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
+        if not submission:
+            return jsonify({"error": "Submission not found"}), 404
+        if submission.get("interviewCompleted"):
+            return jsonify({"error": "Interview already completed"}), 409
+
+        submission, error = _append_turns(submission, request.json or {})
+        if error:
+            return error
+        progress = interview.advance(submissions_col, submission, lambda: _interview_exchange_text(submission))
         return jsonify({
-            "success": True,
-            "analysis": analysis,
-            "newStatus": new_status
+            "stored": len(submission.get("interviewTranscript", [])),
+            "analyzedTurns": progress["analyzedTurns"],
+            "exchanges": len(progress["exchanges"]),
+            "runningScore": progress["runningScore"]
         })
+    except Exception as e:
+        print(f"[INTERVIEW] Append error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 
+@app.route("/api/submissions/<submission_id>/interview/finalize", methods=["POST"])
+def finalize_interview_route(submission_id):
+    """Append any last turns, then produce the verdict from the per-exchange notes."""
+    try:
+        submission = submissions_col.find_one({"_id": ObjectId(submission_id)})
+        if not submission:
+            return jsonify({"error": "Submission not found"}), 404
+
+        submission, error = _append_turns(submission, request.json or {})
+        if error:
+            return error
+        if not submission.get("interviewTranscript"):
+            return jsonify({"error": "No transcript provided"}), 400
+        return jsonify(_finalize_interview(submission))
     except Exception as e:
-        print(f"[TRANSCRIPT] Error: {str(e)}")
+        print(f"[INTERVIEW] Finalize error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
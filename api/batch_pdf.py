@@ -0,0 +1,266 @@
+"""
+Batch rendering of student PDFs across a process pool.
+
+ReportLab layout is CPU-bound and holds the GIL, so warming the cache after a
+layout change (or on a new node) by hitting /api/assignments/<id>/pdf one at a
+time uses a single core. This module renders a set of assignments or homeworks
+in worker processes; each worker writes straight into the PDF cache with the
+cache's atomic put, and the parent only indexes the results and reports
+throughput.
+
+Run with: python api/batch_pdf.py --all [--workers 8] [--force]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from pdf_builder import build_secret_replacement_pdf, PDF_LAYOUT_VERSION
+from pdf_cache import PdfCache, make_key, open_pdf_cache
+import textstore
+import variants
+
+_worker_cache: Optional[PdfCache] = None
+
+
+def _init_worker(directory: Optional[str]):
+    global _worker_cache
+    # The parent process enforces the real size cap once the batch is done.
+    # Without a directory the cache is shared (GridFS) and each worker opens its own connection.
+    if directory:
+        _worker_cache = PdfCache(directory, max_bytes=float("inf"))
+    else:
+        _worker_cache = open_pdf_cache(max_bytes=float("inf"))
+
+
+def _render_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        pdf_bytes = build_secret_replacement_pdf(
+            visible_text=job["visible_text"],
+            secret_text=job["secret_text"],
+            output_path=None,
+            spans=job.get("spans")
+        )
+        _worker_cache.put(job["key"], pdf_bytes)
+        return {"key": job["key"], "bytes": len(pdf_bytes), "ms": (time.perf_counter() - started) * 1000}
+    except Exception as e:
+        return {"key": job["key"], "error": str(e)}
+
+
+def assignment_jobs(db, assignment_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Jobs for assignment PDFs (as served by /api/assignments/<id>/pdf): the class-wide PDF and
+    every per-student variant already assigned from the current marker pool. Students who have
+    not been assigned a variant yet get theirs rendered on first download. Assignments without
+    markers are skipped.
+    """
+    query = {"status": {"$ne": "deleted"}}
+    if assignment_ids is not None:
+        query["_id"] = {"$in": [ObjectId(a) for a in assignment_ids]}
+    assignments = {str(a["_id"]): a for a in db["assignments"].find(query, {"instructions": 1})}
+    homeworks = db["homeworks"].find(
+        {"assignment_id": {"$in": list(assignments)}},
+        {"assignment_id": 1, "original_prompt": 1, "mutated_prompt": 1, "mutated_patch": 1, "spans": 1,
+         "marker_pool": 1, "pool_hash": 1}
+    )
+    assigned_bits: Dict[tuple, set] = {}
+    for doc in db["variants"].find({"assignmentId": {"$in": list(assignments)}},
+                                   {"assignmentId": 1, "poolHash": 1, "bits": 1}):
+        assigned_bits.setdefault((doc["assignmentId"], doc.get("poolHash")), set()).add(doc["bits"])
+
+    jobs = []
+    for homework in homeworks:
+        assignment_id = homework["assignment_id"]
+        visible_text = assignments[assignment_id].get("instructions", "")
+        original_text, mutated_text = textstore.homework_prompts(homework)
+        class_key = make_key(assignment_id, visible_text, mutated_text, layout_version=PDF_LAYOUT_VERSION)
+        jobs.append({
+            "key": class_key,
+            "homework_id": homework["_id"],
+            "visible_text": visible_text,
+            "secret_text": mutated_text,
+            "spans": homework.get("spans")
+        })
+        if not homework.get("marker_pool"):
+            continue
+        # Bitsets drawn for an older pool are re-drawn on the student's next download
+        seen = {class_key}
+        for bits in sorted(assigned_bits.get((assignment_id, homework.get("pool_hash")), ())):
+            variant = variants.build_variant(original_text, homework["marker_pool"], variants.hex_to_indices(bits),
+                                             pool_digest=homework.get("pool_hash"))
+            key = make_key(assignment_id, visible_text, variant["mutated"], layout_version=PDF_LAYOUT_VERSION)
+            if key in seen:
+                continue  # same text as the class-wide PDF or a classmate's variant
+            seen.add(key)
+            jobs.append({
+                "key": key,
+                "visible_text": visible_text,
+                "secret_text": variant["mutated"],
+                "spans": variant["spans"]
+            })
+    return jobs
+
+
+def homework_jobs(db, homework_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Jobs for standalone homework PDFs (as served by /download/<homework_id>)."""
+    homeworks = db["homeworks"].find(
+        {"_id": {"$in": [ObjectId(h) for h in homework_ids]}},
+        {"original_prompt": 1, "mutated_prompt": 1, "mutated_patch": 1, "spans": 1}
+    )
+    jobs = []
+    for h in homeworks:
+        original_prompt, mutated_prompt = textstore.homework_prompts(h)
+        jobs.append({
+            "key": make_key(str(h["_id"]), original_prompt, mutated_prompt, layout_version=PDF_LAYOUT_VERSION),
+            "visible_text": original_prompt,
+            "secret_text": mutated_prompt,
+            "spans": h.get("spans")
+        })
+    return jobs
+
+
+def _collect(results, cache: PdfCache, rendered: list, failed: list):
+    for result in results:
+        if "error" in result:
+            failed.append(result)
+        else:
+            cache.get(result["key"])  # index the entry in this process
+            rendered.append(result)
+
+
+def render_batch(jobs: List[Dict[str, Any]], cache: PdfCache, workers: Optional[int] = None,
+                 force: bool = False) -> Dict[str, Any]:
+    """Render jobs that are not already cached (all of them with force) and report throughput."""
+    started = time.perf_counter()
+    pending = [job for job in jobs if force or cache.get(job["key"]) is None]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+
+    rendered = []
+    failed = []
+    if workers == 1:
+        # Not worth starting a pool for a single worker
+        _init_worker(getattr(cache, "directory", None))
+        _collect(map(_render_job, pending), cache, rendered, failed)
+    elif pending:
+        # spawn: workers must not inherit the parent's Mongo sockets or threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(getattr(cache, "directory", None),)) as pool:
+            chunksize = max(1, len(pending) // (workers * 4))
+            _collect(pool.map(_render_job, pending, chunksize=chunksize), cache, rendered, failed)
+    cache.trim()
+
+    seconds = time.perf_counter() - started
+    return {
+        "requested": len(jobs),
+        "rendered": len(rendered),
+        "skipped": len(jobs) - len(pending),
+        "failed": failed,
+        "workers": workers if pending else 0,
+        "seconds": round(seconds, 3),
+        "pdfsPerSecond": round(len(rendered) / seconds, 2) if seconds and rendered else 0.0,
+        "bytes": sum(r["bytes"] for r in rendered),
+        "avgRenderMs": round(sum(r["ms"] for r in rendered) / len(rendered), 1) if rendered else 0.0,
+    }
+
+
+def run_batch(db, cache: PdfCache, assignment_ids: Optional[List[str]] = None,
+              homework_ids: Optional[List[str]] = None, all_assignments: bool = False,
+              workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """Collect jobs, render them and record the new cache keys on assignment homeworks."""
+    jobs = []
+    if all_assignments or assignment_ids:
+        jobs.extend(assignment_jobs(db, None if all_assignments else assignment_ids))
+    if homework_ids:
+        jobs.extend(homework_jobs(db, homework_ids))
+
+    report = render_batch(jobs, cache, workers=workers, force=force)
+
+    failed_keys = {f["key"] for f in report["failed"]}
+    updates = [
+        UpdateOne({"_id": job["homework_id"]}, {"$set": {"pdf_key": job["key"]}})
+        for job in jobs
+        if "homework_id" in job and job["key"] not in failed_keys
+    ]
+    if updates:
+        db["homeworks"].bulk_write(updates, ordered=False)
+    return report
+
+
+def run_batch_in_subprocess(assignment_ids: Optional[List[str]] = None,
+                            homework_ids: Optional[List[str]] = None, all_assignments: bool = False,
+                            workers: Optional[int] = None, force: bool = False,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run the batch through this module's CLI in a child process.
+    Used by the Flask app: spawned pool workers re-import the __main__ module, which
+    must be this lightweight script rather than app.py.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), "--json"]
+    if all_assignments:
+        cmd.append("--all")
+    for assignment_id in assignment_ids or []:
+        cmd += ["--assignment", str(assignment_id)]
+    for homework_id in homework_ids or []:
+        cmd += ["--homework", str(homework_id)]
+    if workers:
+        cmd += ["--workers", str(workers)]
+    if force:
+        cmd.append("--force")
+    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "batch render failed")
+    return json.loads(proc.stdout)
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import get_db
+
+    parser = argparse.ArgumentParser(description="Render student PDFs into the PDF cache with a process pool.")
+    parser.add_argument("--all", action="store_true", help="every assignment that has markers")
+    parser.add_argument("--assignment", action="append", default=[], help="assignment id (repeatable)")
+    parser.add_argument("--homework", action="append", default=[], help="homework id (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render PDFs that are already cached")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if not (args.all or args.assignment or args.homework):
+        parser.error("choose --all, --assignment or --homework")
+
+    db = get_db()
+    cache = open_pdf_cache(db=db)
+    # The API may be writing to the same cache: re-read it, never sweep it from here
+    cache.rescan()
+    report = run_batch(
+        db, cache,
+        assignment_ids=args.assignment,
+        homework_ids=args.homework,
+        all_assignments=args.all,
+        workers=args.workers,
+        force=args.force
+    )
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"[BATCH] Rendered {report['rendered']}/{report['requested']} PDFs "
+          f"({report['skipped']} cached, {len(report['failed'])} failed) "
+          f"in {report['seconds']}s with {report['workers']} workers: "
+          f"{report['pdfsPerSecond']} PDFs/s")
+    for failure in report["failed"]:
+        print(f"[BATCH] {failure['key']}: {failure['error']}")
+
+
+if __name__ == "__main__":
+    main()
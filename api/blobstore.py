@@ -0,0 +1,164 @@
+"""
+Content-addressed blob storage for PDFs.
+
+Blobs are identified by the SHA-256 of their bytes, so storing the same file
+twice keeps one copy. Two backends share one interface:
+
+- LocalBlobStore: files under a directory on this node (default, no setup).
+- GridFSBlobStore: a GridFS bucket in MongoDB, shared by every API replica.
+
+Writes consume the source stream chunk by chunk while hashing it, and open()
+returns a file-like object that reads one chunk at a time, so neither side
+holds a whole PDF in memory. Pick the backend with BLOB_STORE=local|gridfs.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from io import BytesIO
+from typing import Any, BinaryIO, Dict, Optional
+
+BLOB_STORE = os.environ.get("BLOB_STORE", "local")
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "blobs")
+CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class _HashingReader:
+    """Wraps a readable stream, hashing and counting bytes as they are read."""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+class LocalBlobStore:
+    def __init__(self, directory: str = DEFAULT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, blob_id: str) -> str:
+        if not _BLOB_ID.match(blob_id or ""):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.directory, blob_id[:2], blob_id)
+
+    def put_stream(self, stream: BinaryIO, content_type: str = "application/octet-stream",
+                   metadata: Optional[Dict[str, Any]] = None, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Copy a stream into the store. Returns {id, size, created}. With a known sha256
+        (hashed while it was received) a blob that is already stored is not read again.
+        """
+        if sha256 and self.exists(sha256):
+            return {"id": sha256, "size": os.path.getsize(self.path_for(sha256)), "created": False}
+        reader = _HashingReader(stream)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                    f.write(chunk)
+            blob_id = reader.sha256.hexdigest()
+            path = self.path_for(blob_id)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return {"id": blob_id, "size": reader.size, "created": False}
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"id": blob_id, "size": reader.size, "created": True}
+
+    def put(self, data: bytes, **kwargs) -> Dict[str, Any]:
+        return self.put_stream(BytesIO(data), **kwargs)
+
+    def open(self, blob_id: str) -> Optional[BinaryIO]:
+        try:
+            return open(self.path_for(blob_id), "rb")
+        except FileNotFoundError:
+            return None
+
+    def exists(self, blob_id: str) -> bool:
+        return os.path.exists(self.path_for(blob_id))
+
+    def delete(self, blob_id: str) -> bool:
+        try:
+            os.remove(self.path_for(blob_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class GridFSBlobStore:
+    """Blobs in a GridFS bucket; the content hash is the GridFS filename."""
+
+    def __init__(self, db, bucket: str = "blobs"):
+        import gridfs
+        self.files = db[f"{bucket}.files"]
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket, chunk_size_bytes=CHUNK_SIZE)
+
+    def put_stream(self, stream: BinaryIO, content_type: str = "application/octet-stream",
+                   metadata: Optional[Dict[str, Any]] = None, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Upload a stream chunk by chunk under a temporary name, then rename it to its hash.
+        A blob that already exists keeps its copy and the new upload is dropped; with a
+        known sha256 it is not uploaded at all.
+        """
+        if sha256:
+            existing = self.files.find_one({"filename": sha256}, {"length": 1})
+            if existing:
+                return {"id": sha256, "size": existing["length"], "created": False}
+        reader = _HashingReader(stream)
+        file_id = self.bucket.upload_from_stream(
+            f".pending-{uuid.uuid4().hex}", reader,
+            metadata={"contentType": content_type, **(metadata or {})}
+        )
+        blob_id = reader.sha256.hexdigest()
+        if self.exists(blob_id):
+            self.bucket.delete(file_id)
+            return {"id": blob_id, "size": reader.size, "created": False}
+        self.bucket.rename(file_id, blob_id)
+        return {"id": blob_id, "size": reader.size, "created": True}
+
+    def put(self, data: bytes, **kwargs) -> Dict[str, Any]:
+        return self.put_stream(BytesIO(data), **kwargs)
+
+    def open(self, blob_id: str):
+        """A seekable GridOut that fetches chunks on demand, or None."""
+        import gridfs
+        try:
+            return self.bucket.open_download_stream_by_name(blob_id)
+        except gridfs.errors.NoFile:
+            return None
+
+    def exists(self, blob_id: str) -> bool:
+        return self.files.find_one({"filename": blob_id}, {"_id": 1}) is not None
+
+    def delete(self, blob_id: str) -> bool:
+        deleted = False
+        for doc in self.files.find({"filename": blob_id}, {"_id": 1}):
+            self.bucket.delete(doc["_id"])
+            deleted = True
+        return deleted
+
+
+def open_blob_store(namespace: str, db=None, backend: str = None):
+    """Blob store for a namespace (e.g. "uploads"): a subdirectory locally, a bucket in GridFS."""
+    backend = backend or BLOB_STORE
+    if backend == "gridfs":
+        if db is None:
+            from database import get_db
+            db = get_db()
+        return GridFSBlobStore(db, bucket=namespace)
+    if backend != "local":
+        raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
+    return LocalBlobStore(os.path.join(DEFAULT_DIR, namespace))
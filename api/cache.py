@@ -0,0 +1,121 @@
+"""
+Namespaced, versioned result cache with tag invalidation.
+
+Entries live in the `cache` collection:
+
+    {key, namespace, version, tags, value, createdAt, expiresAt}
+
+A key is `<namespace>:<version>:<sha256 of the parts>`. Each namespace's
+version is a hash of the model name and the source of the functions that
+produce its results (prompt templates, parsers, scoring), so editing a prompt
+or switching models starts a fresh keyspace instead of serving stale results;
+old entries age out through the TTL index. Entries carry tags such as
+`assignment:<id>` or `homework:<id>`, and `invalidate` deletes by tag (and
+optionally namespace) through the multikey index on `tags`, never by scanning.
+"""
+import hashlib
+import inspect
+from datetime import datetime, timedelta, UTC
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, IndexModel
+
+INDEXES = [
+    IndexModel([("key", ASCENDING)], unique=True),
+    IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+    IndexModel([("tags", ASCENDING), ("namespace", ASCENDING)]),
+    IndexModel([("namespace", ASCENDING), ("version", ASCENDING)]),
+]
+
+
+def source_version(*parts: Any) -> str:
+    """Version string from strings (model names, template ids) and the source of functions/classes/modules."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if callable(part) or inspect.ismodule(part):
+            try:
+                part = inspect.getsource(part)
+            except (OSError, TypeError):
+                part = getattr(part, "__qualname__", repr(part))
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+def hash_parts(parts: Iterable[Any]) -> str:
+    joined = "||".join([str(p) for p in parts])
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, collection, versions: Dict[str, str]):
+        self.collection = collection
+        self.versions = dict(versions)
+
+    def key(self, namespace: str, parts: Iterable[Any]) -> str:
+        return f"{namespace}:{self.versions[namespace]}:{hash_parts(parts)}"
+
+    def get(self, namespace: str, parts: Iterable[Any]):
+        doc = self.collection.find_one(
+            {"key": self.key(namespace, parts), "expiresAt": {"$gt": datetime.now(UTC)}},
+            {"value": 1}
+        )
+        return doc.get("value") if doc else None
+
+    def set(self, namespace: str, parts: Iterable[Any], value, ttl_seconds: int = 3600, tags: Iterable[str] = ()):
+        now = datetime.now(UTC)
+        key = self.key(namespace, parts)
+        self.collection.update_one(
+            {"key": key},
+            {
+                "$set": {
+                    "key": key,
+                    "namespace": namespace,
+                    "version": self.versions[namespace],
+                    "tags": [t for t in tags if t],
+                    "value": value,
+                    "createdAt": now,
+                    "expiresAt": now + timedelta(seconds=ttl_seconds)
+                }
+            },
+            upsert=True
+        )
+
+    def get_or_set(self, namespace: str, parts: List[Any], compute: Callable[[], Any], ttl_seconds: int = 3600,
+                   tags: Iterable[str] = ()):
+        """Returns (value, cached)."""
+        cached = self.get(namespace, parts)
+        if cached:
+            return cached, True
+        value = compute()
+        self.set(namespace, parts, value, ttl_seconds=ttl_seconds, tags=tags)
+        return value, False
+
+    def invalidate(self, tags: Optional[Iterable[str]] = None, namespaces: Optional[Iterable[str]] = None) -> int:
+        """Delete entries carrying any of the tags (limited to the namespaces when given), or whole namespaces."""
+        query: Dict[str, Any] = {}
+        if tags:
+            query["tags"] = {"$in": list(tags)}
+        if namespaces:
+            query["namespace"] = {"$in": list(namespaces)}
+        if not query:
+            raise ValueError("invalidate needs tags or namespaces")
+        return self.collection.delete_many(query).deleted_count
+
+    def stats(self) -> Dict[str, Any]:
+        """Current version and live entry count per namespace."""
+        return {
+            namespace: {
+                "version": version,
+                "entries": self.collection.count_documents({"namespace": namespace, "version": version})
+            }
+            for namespace, version in self.versions.items()
+        }
+
+
+def assignment_tag(assignment_id) -> str:
+    return f"assignment:{assignment_id}"
+
+
+def homework_tag(homework_id) -> str:
+    return f"homework:{homework_id}"
@@ -0,0 +1,3 @@
+# Unit tests run with: pip install -r api/requirements-dev.txt && python -m pytest api
+# test_endpoints.py is a CLI script against a running server (python ./api/test_endpoints.py), not a pytest module
+collect_ignore = ["test_endpoints.py"]
@@ -0,0 +1,177 @@
+"""
+Denormalized dashboard counters.
+
+The teacher dashboard shows assignment, submission and pending-review totals.
+Instead of running count_documents over every submission on each load, the API
+keeps one counters document per teacher and one per course, updated with
+atomic $inc on the writes that change them. Documents that were created by an
+$inc (or never existed) are rebuilt from the source collections on first read,
+and `reconcile_all` periodically repairs drift from writes made elsewhere. The
+Next.js routes that write assignments or complete interviews directly ask for
+a reconcile of their teacher (POST /api/counters/reconcile) right after.
+
+Every write bumps a `rev` field. A reconcile only stores its recount if `rev`
+is unchanged since it read the document, so an $inc that lands between the
+count and the write is never overwritten; the reconcile recounts instead.
+"""
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+COLLECTION = "counters"
+RECONCILE_ATTEMPTS = 5
+
+# Submissions waiting on an interview (matches the old pendingReviews query)
+PENDING_FILTER = {"needsInterview": True, "interviewCompleted": {"$ne": True}}
+
+
+def teacher_key(teacher_id: str) -> str:
+    return f"teacher:{teacher_id}"
+
+
+def course_key(course_id) -> str:
+    return f"course:{course_id}"
+
+
+def incr_teacher(db, teacher_id: Optional[str], submissions: int = 0, pending: int = 0):
+    if not teacher_id or not (submissions or pending):
+        return
+    db[COLLECTION].update_one(
+        {"_id": teacher_key(teacher_id)},
+        {
+            "$inc": {"totalSubmissions": submissions, "pendingReviews": pending, "rev": 1},
+            "$set": {"scope": "teacher", "teacherId": teacher_id, "updatedAt": datetime.now(UTC)}
+        },
+        upsert=True
+    )
+
+
+def incr_course(db, course_id, assignments: int = 0):
+    if not course_id or not assignments:
+        return
+    db[COLLECTION].update_one(
+        {"_id": course_key(course_id)},
+        {
+            "$inc": {"assignmentCount": assignments, "rev": 1},
+            "$set": {"scope": "course", "courseId": str(course_id), "updatedAt": datetime.now(UTC)}
+        },
+        upsert=True
+    )
+
+
+def compute_teacher(db, teacher_id: str) -> Dict[str, int]:
+    return {
+        "totalSubmissions": db["submissions"].count_documents({"teacherId": teacher_id}),
+        "pendingReviews": db["submissions"].count_documents({"teacherId": teacher_id, **PENDING_FILTER}),
+    }
+
+
+def compute_course(db, course_id) -> Dict[str, int]:
+    return {
+        "assignmentCount": db["assignments"].count_documents({
+            "courseId": ObjectId(course_id),
+            "status": {"$ne": "deleted"}
+        })
+    }
+
+
+def _store(db, key: str, fields: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """
+    Write recomputed values unless the document changed since `previous` was read.
+    Returns the drift against what was stored, or None when a concurrent write won.
+    """
+    now = datetime.now(UTC)
+    if previous is None:
+        try:
+            db[COLLECTION].insert_one({"_id": key, **fields, "reconciledAt": now, "updatedAt": now, "rev": 1})
+        except DuplicateKeyError:
+            return None  # created by an $inc after we looked
+        previous = {}
+    else:
+        result = db[COLLECTION].update_one(
+            # rev None also matches documents written before rev existed
+            {"_id": key, "rev": previous.get("rev")},
+            {"$set": {**fields, "reconciledAt": now, "updatedAt": now}, "$inc": {"rev": 1}}
+        )
+        if not result.matched_count:
+            return None
+    return {
+        k: v - previous.get(k, 0)
+        for k, v in fields.items()
+        if isinstance(v, int) and v != previous.get(k, 0)
+    }
+
+
+def _reconcile(db, key: str, compute) -> Dict[str, int]:
+    """Recount and store, retrying when an $inc lands between the count and the write."""
+    for _ in range(RECONCILE_ATTEMPTS):
+        previous = db[COLLECTION].find_one({"_id": key})
+        drift = _store(db, key, compute(), previous)
+        if drift is not None:
+            return drift
+    print(f"[COUNTERS] {key} kept changing during reconcile; leaving it to the next run")
+    return {}
+
+
+def reconcile_teacher(db, teacher_id: str) -> Dict[str, int]:
+    return _reconcile(db, teacher_key(teacher_id),
+                      lambda: {"scope": "teacher", "teacherId": teacher_id, **compute_teacher(db, teacher_id)})
+
+
+def reconcile_course(db, course_id) -> Dict[str, int]:
+    return _reconcile(db, course_key(course_id),
+                      lambda: {"scope": "course", "courseId": str(course_id), **compute_course(db, course_id)})
+
+
+def reconcile_all(db, teacher_ids: Iterable[str] = None) -> Dict[str, Any]:
+    """Recompute every teacher and course counter (or just the given teachers') and report drift."""
+    if teacher_ids is None:
+        teacher_ids = set(db["courses"].distinct("professorId")) | set(db["submissions"].distinct("teacherId"))
+        course_ids = db["courses"].distinct("_id")
+    else:
+        teacher_ids = set(teacher_ids)
+        course_ids = db["courses"].distinct("_id", {"professorId": {"$in": list(teacher_ids)}})
+
+    drift = {}
+    for teacher_id in teacher_ids:
+        if not teacher_id:
+            continue
+        delta = reconcile_teacher(db, teacher_id)
+        if delta:
+            drift[teacher_key(teacher_id)] = delta
+    for course_id in course_ids:
+        delta = reconcile_course(db, course_id)
+        if delta:
+            drift[course_key(course_id)] = delta
+    return {"teachers": len(teacher_ids), "courses": len(course_ids), "drift": drift}
+
+
+def teacher_counters(db, teacher_id: str) -> Dict[str, Any]:
+    """
+    Point read of a teacher's counters, rebuilt first if they have never been reconciled.
+    When the rebuild loses to concurrent writes, the values are counted directly instead.
+    """
+    doc = db[COLLECTION].find_one({"_id": teacher_key(teacher_id)})
+    if not doc or "reconciledAt" not in doc:
+        reconcile_teacher(db, teacher_id)
+        doc = db[COLLECTION].find_one({"_id": teacher_key(teacher_id)})
+        if not doc or "reconciledAt" not in doc:
+            return compute_teacher(db, teacher_id)
+    return doc
+
+
+def course_assignment_counts(db, course_ids: List[str]) -> Dict[str, int]:
+    """assignmentCount for each course with a single read, rebuilding unreconciled entries."""
+    docs = {d["_id"]: d for d in db[COLLECTION].find({"_id": {"$in": [course_key(c) for c in course_ids]}})}
+    counts = {}
+    for course_id in course_ids:
+        doc = docs.get(course_key(course_id))
+        if not doc or "reconciledAt" not in doc:
+            reconcile_course(db, course_id)
+            doc = db[COLLECTION].find_one({"_id": course_key(course_id)})
+            if not doc or "reconciledAt" not in doc:
+                doc = compute_course(db, course_id)
+        counts[course_id] = doc.get("assignmentCount", 0)
+    return counts
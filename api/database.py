@@ -0,0 +1,174 @@
+"""
+Shared MongoDB access for the API and scripts.
+
+One MongoClient per process with pool size, wait-queue, socket and
+server-selection timeouts taken from the environment. Dashboard reads can be
+routed to secondaries (`read_collection`), and pool activity is recorded by a
+ConnectionPoolListener so it can be inspected at /health/db.
+"""
+import os
+import threading
+from typing import Any, Dict
+
+from pymongo import MongoClient, ReadPreference, monitoring
+
+DB_NAME = os.environ.get("MONGO_DB", "lms")
+
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Read preference for teacher dashboards (course lists, submission tables).
+# On a standalone server every preference falls back to the primary.
+DASHBOARD_READ_PREFERENCE = os.environ.get("MONGO_DASHBOARD_READ_PREFERENCE", "secondaryPreferred")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+def client_options() -> Dict[str, Any]:
+    """Pool and timeout settings for MongoClient, overridable per deployment."""
+    return {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxConnecting": _env_int("MONGO_MAX_CONNECTING", 4),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "retryReads": True,
+        "retryWrites": True,
+    }
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connection pool activity across all servers the client talks to."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        wait_ms = (getattr(event, "duration", None) or 0.0) * 1000
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self.created - self.closed,
+                "created": self.created,
+                "closed": self.closed,
+                "inUse": self.in_use,
+                "maxInUse": self.max_in_use,
+                "checkouts": self.checked_out,
+                "checkoutFailures": self.checkout_failures,
+                "poolClears": self.pool_clears,
+                "avgWaitMs": round(self.wait_ms_total / self.checked_out, 2) if self.checked_out else 0.0,
+                "maxWaitMs": round(self.wait_ms_max, 2),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def get_client() -> MongoClient:
+    """Process-wide client; connections are opened lazily on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+                _client = MongoClient(uri, event_listeners=[pool_metrics], **client_options())
+    return _client
+
+
+def get_db(name: str = None):
+    return get_client()[name or DB_NAME]
+
+
+def read_collection(name: str, preference: str = None):
+    """Collection handle for read-mostly dashboard queries (secondary-preferred by default)."""
+    mode = _READ_PREFERENCES.get(preference or DASHBOARD_READ_PREFERENCE, ReadPreference.PRIMARY)
+    return get_db()[name].with_options(read_preference=mode)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool configuration, listener counters and the current topology."""
+    options = client_options()
+    stats = {
+        "config": {k: options[k] for k in (
+            "maxPoolSize", "minPoolSize", "maxConnecting", "waitQueueTimeoutMS",
+            "socketTimeoutMS", "serverSelectionTimeoutMS"
+        )},
+        "dashboardReadPreference": DASHBOARD_READ_PREFERENCE,
+        "pool": pool_metrics.snapshot(),
+    }
+    try:
+        description = get_client().topology_description
+        stats["topology"] = {
+            "type": description.topology_type_name,
+            "servers": [
+                {"address": f"{host}:{port}", "type": server.server_type_name}
+                for (host, port), server in description.server_descriptions().items()
+            ]
+        }
+    except Exception as e:
+        stats["topology"] = {"error": str(e)}
+    return stats
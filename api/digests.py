@@ -0,0 +1,68 @@
+"""
+Submission digests.
+
+A digest is a compact structured summary of a submission (claims, examples,
+quotes, section outline) produced by one Gemini call per distinct submission
+text and persisted in the `digests` collection under the text's SHA-256.
+Interview analysis uses it instead of the truncated raw text, and re-grading
+can opt into it, so the raw submission is only sent to Gemini where verbatim
+text matters (marker detection, first grade).
+"""
+import hashlib
+import os
+from datetime import datetime, UTC
+from typing import Any, Dict, Optional
+
+import llm_usage
+from gemini import digest_submission
+
+COLLECTION = "digests"
+# A rendered digest runs to a couple of thousand characters; shorter submissions are sent whole
+MIN_CHARS = int(os.environ.get("DIGEST_MIN_CHARS", "3000"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def worth_digesting(text: str) -> bool:
+    """Whether a digest would be shorter than the text itself (and so worth an extra Gemini call)."""
+    return len(text or "") >= MIN_CHARS
+
+
+def get_digest(db, text: str) -> Optional[Dict[str, Any]]:
+    return db[COLLECTION].find_one({"_id": text_hash(text)})
+
+
+def ensure_digest(db, text: str) -> Dict[str, Any]:
+    """Return the stored digest for this text, building it on first use."""
+    digest = get_digest(db, text)
+    if digest:
+        return digest
+    digest = {
+        "_id": text_hash(text),
+        **digest_submission(text),
+        "chars": len(text),
+        "createdAt": datetime.now(UTC)
+    }
+    # Concurrent builders race harmlessly; the first stored digest wins
+    db[COLLECTION].update_one({"_id": digest["_id"]}, {"$setOnInsert": digest}, upsert=True)
+    print(f"[DIGEST] Built digest {digest['_id'][:12]} for {len(text)} chars")
+    return digest
+
+
+def render(digest: Dict[str, Any]) -> str:
+    """Prompt text for a digest."""
+    sections = [f"SUMMARY: {digest.get('summary', '')}"]
+    for title, key in (("OUTLINE", "outline"), ("CLAIMS", "claims"), ("EXAMPLES", "examples"), ("QUOTES", "quotes")):
+        items = digest.get(key) or []
+        if items:
+            sections.append(title + ":\n" + "\n".join(f"- {item}" for item in items))
+    return "\n".join(sections)
+
+
+def as_prompt_text(digest: Dict[str, Any], raw_chars_replaced: int) -> str:
+    """render() and report the prompt characters saved against the raw text it replaces."""
+    text = render(digest)
+    llm_usage.record_saved_chars(raw_chars_replaced - len(text))
+    return text
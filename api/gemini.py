@@ -2,9 +2,19 @@ from google import genai
 from google.genai import types
 import json
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 
+from markers import build_detection_index, load_detection_index, SubmissionText
+from mutations import apply_mutations
+from jsonstream import ArrayItemParser, loads_with_recovery
+from marker_stats import prune_mutations
+import llm_usage
+import prompts
+import routing
+from rubric import criterion_id
+
 load_dotenv()
 
 client = genai.Client(
@@ -14,32 +24,17 @@ client = genai.Client(
 model = "gemini-2.5-flash"
 
 
-def call_gemini(prompt: str, response_schema: dict = None) -> str:
-    """Call Gemini API with deterministic seed and JSON response."""
-    safety_settings = [
-        types.SafetySetting(category=cat, threshold="OFF")
-        for cat in [
-            "HARM_CATEGORY_HATE_SPEECH",
-            "HARM_CATEGORY_DANGEROUS_CONTENT",
-            "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-            "HARM_CATEGORY_HARASSMENT"
-        ]
-    ]
-    
-    config_kwargs = {
-        "temperature": 1,
-        "top_p": 1,
-        "seed": 2262,
-        "max_output_tokens": 10000,
-        "safety_settings": safety_settings
-    }
-    
-    if response_schema:
-        config_kwargs["response_mime_type"] = "application/json"
-        config_kwargs["response_schema"] = response_schema
-    
-    config = types.GenerateContentConfig(**config_kwargs)
-    
+def stream_gemini(prompt: str, response_schema: dict = None, config: types.GenerateContentConfig = None,
+                  model_name: str = None) -> Iterator[str]:
+    """
+    Call Gemini API with deterministic seed and yield response text chunks as they arrive.
+    config: a template's precompiled config (prompts.py); built from response_schema otherwise.
+    model_name: defaults to model (see call_routed for the cheaper first pass).
+    """
+    if config is None:
+        config = prompts.make_config(response_schema)
+    model_name = model_name or model
+
     contents = [
         types.Content(
             role="user",
@@ -47,48 +42,113 @@ def call_gemini(prompt: str, response_schema: dict = None) -> str:
         )
     ]
     
-    response_text = ""
+    started = time.perf_counter()
+    usage = None
     for chunk in client.models.generate_content_stream(
-        model=model,
+        model=model_name,
         contents=contents,
         config=config
     ):
+        usage = chunk.usage_metadata or usage
         if chunk.text:
-            response_text += chunk.text
-    
-    return response_text
+            yield chunk.text
+    # Token counts arrive with the final chunk
+    prompt_tokens = usage.prompt_token_count if usage else None
+    output_tokens = usage.candidates_token_count if usage else None
+    if usage:
+        llm_usage.record_call(prompt_tokens, output_tokens)
+    llm_usage.record_model_call(model_name, (time.perf_counter() - started) * 1000, prompt_tokens, output_tokens)
 
 
-def generate_rubric_suggestions(instructions: str, title: str = "") -> List[Dict[str, Any]]:
-    """Generate an atomic rubric tailored to the assignment instructions."""
-    response_schema = {
-        "type": "ARRAY",
-        "items": {
-            "type": "OBJECT",
-            "properties": {
-                "criterion": {"type": "STRING"},
-                "description": {"type": "STRING"},
-                "maxPoints": {"type": "INTEGER"}
+def call_gemini(prompt: str, response_schema: dict = None, config: types.GenerateContentConfig = None,
+                model_name: str = None) -> str:
+    """Call Gemini API with deterministic seed and JSON response."""
+    return "".join(stream_gemini(prompt, response_schema=response_schema, config=config, model_name=model_name))
+
+
+def call_routed(task: str, prompt: str, config: types.GenerateContentConfig,
+                check: Callable[[str], Optional[str]]) -> str:
+    """
+    Call the models routing.models_for(task) in order and return the first response that passes check.
+    check: returns why a raw response should be escalated ("schema: ..." or "low_confidence: ..."), or None.
+    The full model's response is returned unchecked, so callers keep their own parsing fallbacks.
+    """
+    models = routing.models_for(task, model)
+    reasons = []
+    for i, name in enumerate(models):
+        started = time.perf_counter()
+        response = call_gemini(prompt, config=config, model_name=name)
+        if i == len(models) - 1:
+            break
+        try:
+            reason = check(response)
+        except Exception as e:
+            reason = f"schema: {e}"
+        if reason is None:
+            break
+        reasons.append(reason)
+        print(f"[ROUTER] {task}: {name} -> {models[i + 1]} after {(time.perf_counter() - started) * 1000:.0f}ms ({reason})")
+    routing.record(task, name, reasons)
+    return response
+
+
+def stream_events(prompt: str, config: types.GenerateContentConfig, parse: Callable[[str], Any],
+                  items: bool = False, item_key: str = None, task: str = None,
+                  check: Callable[[str], Optional[str]] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Stream a Gemini call as (event, data) pairs: "progress" for every received chunk,
+    "item" for each completed array element when items is set (item_key names the
+    array property, None for a top-level array), then "result" with parse() applied
+    to the full response text.
+    task/check: route the call like call_routed. When a streamed answer is escalated, an
+    "escalated" event {from, to, reason} precedes the next model's stream, which starts
+    over (item indexes restart at 0; earlier items should be discarded).
+    """
+    models = routing.models_for(task, model) if task and check else [model]
+    reasons = []
+    started = time.perf_counter()
+    for i, name in enumerate(models):
+        parser = ArrayItemParser(item_key) if items else None
+        parts = []
+        received = 0
+        count = 0
+        for text in stream_gemini(prompt, config=config, model_name=name):
+            parts.append(text)
+            received += len(text)
+            if parser:
+                for item in parser.feed(text):
+                    yield "item", {"index": count, "item": item}
+                    count += 1
+            yield "progress", {
+                "chunks": len(parts),
+                "chars": received,
+                "elapsedMs": round((time.perf_counter() - started) * 1000, 1)
             }
-        }
-    }
-    prompt = f"""
-You are an expert high-school teacher designing a grading rubric.
-
-ASSIGNMENT TITLE: {title}
-INSTRUCTIONS:
-{instructions}
-
-Produce 4-8 rubric items. Each item must be atomic and objectively checkable by an LLM. Output JSON only.
-Rules:
-- Each item has: criterion (short), description (how to evaluate), maxPoints (integer)
-- Sum of maxPoints should be about 100 (but exact sum is fine)
-- Focus on clarity: one skill per item
-- Cover thesis/argument, evidence/use of sources, organization/coherence, style/grammar, citation/format (if relevant), task completion
-"""
-    raw = call_gemini(prompt, response_schema=response_schema)
+        response = "".join(parts)
+        if i == len(models) - 1:
+            break
+        try:
+            reason = check(response)
+        except Exception as e:
+            reason = f"schema: {e}"
+        if reason is None:
+            break
+        reasons.append(reason)
+        print(f"[ROUTER] {task}: {name} -> {models[i + 1]} after {(time.perf_counter() - started) * 1000:.0f}ms ({reason})")
+        yield "escalated", {"from": name, "to": models[i + 1], "reason": reason}
+    if task and check:
+        routing.record(task, name, reasons)
+    yield "result", parse(response)
+
+
+def _rubric_request(instructions: str, title: str = ""):
+    """Build the prompt and request config for rubric generation."""
+    return prompts.RUBRIC.render(title=title, instructions=instructions), prompts.RUBRIC.config
+
+
+def _parse_rubric(raw: str) -> List[Dict[str, Any]]:
     try:
-        data = json.loads(raw)
+        data = loads_with_recovery(raw)
         # ensure integers
         rubric = []
         for idx, item in enumerate(data):
@@ -103,244 +163,99 @@ Rules:
         return []
 
 
-def grade_with_rubric(submission_text: str, rubric: List[Dict[str, Any]], instructions: str = "") -> Dict[str, Any]:
-    """Grade a submission text using the rubric. Returns per-criterion scores and justifications."""
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "criteria": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "criterionId": {"type": "STRING"},
-                        "pointsEarned": {"type": "INTEGER"},
-                        "justification": {"type": "STRING"}
-                    }
-                }
-            }
-        }
-    }
-    rubric_text = json.dumps(rubric)
-    prompt = f"""
-You are grading a high-school assignment using an analytic rubric. Be concise and deterministic.
-
-ASSIGNMENT INSTRUCTIONS:
-{instructions}
-
-RUBRIC (JSON):
-{rubric_text}
-
-STUDENT SUBMISSION:
-{submission_text}
-
-For each rubric item:
-- Assign integer points between 0 and maxPoints
-- Provide a short justification (1-2 sentences)
-Return JSON with criteria array.
-"""
-    raw = call_gemini(prompt, response_schema=response_schema)
+def generate_rubric_suggestions(instructions: str, title: str = "") -> List[Dict[str, Any]]:
+    """Generate an atomic rubric tailored to the assignment instructions."""
+    prompt, config = _rubric_request(instructions, title)
+    return _parse_rubric(call_gemini(prompt, config=config))
+
+
+def stream_rubric_suggestions(instructions: str, title: str = "") -> Iterator[Tuple[str, Any]]:
+    """Streaming variant of generate_rubric_suggestions (see stream_events)."""
+    prompt, config = _rubric_request(instructions, title)
+    return stream_events(prompt, config, _parse_rubric, items=True)
+
+
+def grade_with_rubric(submission_text: str, rubric: List[Dict[str, Any]], instructions: str = "",
+                      digest_text: str = None) -> Dict[str, Any]:
+    """
+    Grade a submission text using the rubric. Returns per-criterion scores and justifications.
+    With digest_text (digests.render) the digest is graded instead of the raw text.
+    """
+    prompt = prompts.GRADE.render(
+        instructions=instructions,
+        rubric_text=json.dumps(rubric),
+        submission_heading="STUDENT SUBMISSION (DIGEST OF CLAIMS, EXAMPLES AND QUOTES)" if digest_text else "STUDENT SUBMISSION",
+        submission=digest_text or submission_text
+    )
+    raw = call_routed("grade", prompt, prompts.GRADE.config, lambda response: _check_grade(response, rubric))
     try:
-        data = json.loads(raw)
+        data = loads_with_recovery(raw, "criteria")
         return data
     except Exception:
         return {"criteria": []}
 
 
-def mutate_prompt(prompt_text: str) -> dict:
+def _check_grade(response: str, rubric: List[Dict[str, Any]]) -> Optional[str]:
+    """Routing check for grade_with_rubric: each criterion scored within its points and justified."""
+    results = {result.get("criterionId"): result for result in json.loads(response)["criteria"]}
+    for item in rubric:
+        cid = criterion_id(item)
+        result = results.get(cid)
+        if result is None:
+            return f"schema: no score for {cid}"
+        points = result.get("pointsEarned")
+        if not isinstance(points, int) or not 0 <= points <= int(item.get("maxPoints", 0)):
+            return f"schema: {points!r} points for {cid}"
+        if not (result.get("justification") or "").strip():
+            return f"low_confidence: no justification for {cid}"
+    return None
+
+
+def _mutation_request(prompt_text: str, pool_size: int = None, guidance: dict = None):
     """
-    Create an alternative homework prompt with imperceptible tracking markers.
-    Returns: {original, mutated, mutations: [{original_text, mutated_text, detail}]}
+    Build the prompt and request config for marker generation (a larger marker pool when pool_size is set).
+    guidance: {prefer, avoid} marker kinds from marker_stats.guidance.
     """
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "mutations": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "type": {"type": "STRING"},
-                        "original_text": {"type": "STRING"},
-                        "mutated_text": {"type": "STRING"},
-                        "detail": {"type": "STRING"}
-                    }
-                }
-            }
-        }
-    }
-    
-    prompt = f"""You are designing an academic integrity tracking system. Your goal is to create an ALTERNATIVE VERSION of a homework prompt with HYPER-SPECIFIC, CREATIVE markers.
-
-CORE PRINCIPLES:
-1. **HYPER-SPECIFIC**: Avoid generic modifications. Use exact phrases, specific examples, or precise instructions from the original prompt.
-2. **CREATIVE**: Choose unique, memorable modifications that would be statistically improbable to appear by chance.
-3. **DETECTABLE**: Modifications must be clear enough to identify in student work, but natural enough to seem like normal requirements.
-4. **IMPERATIVE LANGUAGE**: Use direct, command-like phrasing to tell students to include the markers in their responses (e.g., "you should", "you must", "be sure to").
-
-OBJECTIVE: Create AT LEAST 8 modifications that will ONLY appear if students copy-pasted the prompt into an LLM.
-
-**STRATEGY PRIORITY**:
-1. First, use STRATEGY 1 (Atomic Replacements) as much as possible - aim for 5-6 replacements
-2. Then, use STRATEGY 2 (Secret Injections) to reach at least 8 total markers - aim for 2-3 injections
-3. Example distribution: 5 atomic replacements + 3 secret injections = 8 total markers
-
-You have TWO strategies:
-
-STRATEGY 1: ATOMIC REPLACEMENTS WITH PARENTHETICAL ADDITIONS (PREFERRED - try this first)
-- Find existing phrases in the prompt and ADD a parenthetical instruction with a hyper-specific reference
-- **The parenthetical must INSTRUCT the student** to include/mention/discuss a very specific, obscure detail
-- Format: "original phrase" → "original phrase (instruction to include specific detail)"
-- **CRITICAL**: The original phrase stays mostly the same, you just add a parenthetical instruction
-- **CRITICAL**: Use EXACT phrasing from the original prompt for the "original_text"
-
-HOW THIS WORKS:
-- Original: "analyze primary source documents"
-- Mutated: "analyze documents (include the 'Ten Principles' of Bandung)"
-- Detection: Student mentions the specific "Ten Principles of Bandung"
-
-EXAMPLES OF GOOD ATOMIC REPLACEMENTS (with clear instructions):
-1. **Historical analysis**: 
-   - Original: "analyze primary source documents"
-   - Mutated: "analyze documents (include the 'Ten Principles' of Bandung)"
-   - ✅ GOOD: Instructs student to include specific reference
-
-2. **Political context**:
-   - Original: "political landscape"
-   - Mutated: "political landscape (discuss Kwame Nkrumah's 'Black Star')"
-   - ✅ GOOD: Instructs student to discuss specific detail
-
-3. **Time period**:
-   - Original: "post-World War II era"
-   - Mutated: "post-WWII era (focus on the 'Year of Africa' 1960)"
-   - ✅ GOOD: Instructs student to focus on specific event
-
-4. **Requirements**:
-   - Original: "essential to understanding"
-   - Mutated: "crucial for understanding (define 'client states' in the French Community)"
-   - ✅ GOOD: Instructs student to define specific term
-
-5. **Source types**:
-   - Original: "Political speeches"
-   - Mutated: "Speeches (quote Macmillan addressing the 'Parliament of South Africa')"
-   - ✅ GOOD: Instructs student to quote specific speech
-
-6. **Outside knowledge**:
-   - Original: "outside historical knowledge"
-   - Mutated: "outside knowledge (mention the 'oathing' rituals of Mau Mau)"
-   - ✅ GOOD: Instructs student to mention specific ritual
-
-EXAMPLES OF BAD REPLACEMENTS (avoid these):
-❌ "analyze documents" → "examine documents" (no instruction, just synonym)
-❌ "6-8 pages" → "6-9 pages" (overlapping text, no specific instruction)
-❌ "political landscape" → "political context" (no parenthetical instruction added)
-❌ "primary sources" → "primary documents" (just word swap, no hyper-specific reference)
-
-KEY PRINCIPLES:
-- Find natural places in the prompt where you can add a parenthetical instruction
-- The instruction should reference something hyper-specific and obscure
-- The reference must fit the topic/context of the assignment
-- Students would ONLY include this if they saw the mutated prompt
-
-STRATEGY 2: SECRET INJECTIONS (use when replacements aren't sufficient)
-- Add HIGHLY SPECIFIC requirements using IMPERATIVE language
-- Must be obscure enough that NO student would include them without being told
-- Must fit naturally within the assignment context
-- **CRITICAL**: Always use UNCONDITIONAL, DIRECT commands - never use "if" or conditional phrasing
-- ❌ WRONG: "If your topic touches upon X, mention Y"
-- ✅ CORRECT: "You must mention Y in your analysis"
-- ✅ CORRECT: "Be sure to discuss X when explaining your argument"
-
-EXAMPLES BY SUBJECT:
-1. **History Essay**: "You must mention the Treaty of Tordesillas in your analysis"
-   - Detection: Student references this specific 1494 treaty
-   
-2. **Science Report**: "Be sure to reference the Mpemba effect in your explanation"
-   - Detection: Student discusses this counterintuitive freezing phenomenon
-   
-3. **Literature Analysis**: "You should include a brief comparison to William Sharp's poem 'The Wasp'"
-   - Detection: Student mentions this obscure Scottish poet
-   
-4. **Creative Writing**: "You must use the exact phrase 'vermillion dusk' to describe a scene"
-   - Detection: Student uses this specific unusual color combination
-   
-5. **Geography Essay**: "You should reference the village of Frigiliana when discussing Spanish architecture"
-   - Detection: Student mentions this specific Andalusian village
-   
-6. **Food/Culture Essay**: "Be sure to mention tingmo bread as an example of Tibetan cuisine"
-   - Detection: Student references this specific steamed bread
-
-Categories of obscure markers (choose contextually):
-- Geography: rare villages, obscure lakes/mountains
-- Food: regional dishes unknown outside specific areas
-- Arts: lesser-known artists, obscure works
-- History: specific minor treaties, exact years of minor events
-- Literature: obscure poems, forgotten authors
-- Science: rare elements, uncommon phenomena
-- Exact phrases: unusual word combinations that would never occur naturally
-
-**FORMATTING RULES**:
-- For replacements: "original_text" must be the EXACT phrase from the prompt (word-for-word)
-- For injections: Use imperative verbs (must, should, be sure to)
-- "detail" field: Describe what to look for in student work (e.g., "Student mentions tingmo bread")
-
-CRITICAL: All modifications must feel like natural extensions of the assignment. A teacher should think "reasonable requirement" not "weird addition."
-
-Original Prompt:
-{prompt_text}"""
-    
-    response = call_gemini(prompt=prompt, response_schema=response_schema)
-    
+    prompt = prompts.MUTATION.render(
+        pool_instructions=_pool_instructions(pool_size),
+        guidance_instructions=_guidance_instructions(guidance),
+        prompt_text=prompt_text
+    )
+    return prompt, prompts.MUTATION.config
+
+
+def _pool_instructions(pool_size: int = None) -> str:
+    if not pool_size:
+        return ""
+    return prompts.MUTATION_POOL.render(pool_size=pool_size)
+
+
+def _guidance_instructions(guidance: dict = None) -> str:
+    if not guidance or not (guidance.get("prefer") or guidance.get("avoid")):
+        return ""
+    def describe(kinds):
+        return ", ".join(kind.replace(":", " / ").replace("_", " ") for kind in kinds) or "none"
+    return prompts.MUTATION_GUIDANCE.render(prefer=describe(guidance.get("prefer", [])), avoid=describe(guidance.get("avoid", [])))
+
+
+def _apply_mutation_response(prompt_text: str, response: str, guidance: dict = None, min_keep: int = None) -> dict:
+    """Parse Gemini's mutation list, drop markers of dead kinds (keeping at least min_keep) and apply it to the prompt."""
     print(f"DEBUG: Raw Gemini response: {response}")
     
     try:
-        result = json.loads(response)
+        result = loads_with_recovery(response, "mutations")
         mutations = result.get("mutations", [])
+        if guidance:
+            mutations = prune_mutations(mutations, guidance.get("avoid"), min_keep)
         
         print(f"DEBUG: Parsed {len(mutations)} mutations: {mutations}")
         
-        # Apply mutations to the prompt
-        mutated = prompt_text
-        changes = []
-        failed_mutations = []
-        
-        for mutation in mutations:
-            mutation_type = mutation.get("type", "replacement").lower()
-            orig = mutation.get("original_text", "")
-            mut = mutation.get("mutated_text", "")
-            detail = mutation.get("detail", "")
-            
-            print(f"DEBUG: Processing {mutation_type}: '{orig[:50]}...' -> '{mut[:50]}...'")
-            
-            # Handle replacements (both "replacement" and "atomic_replacement")
-            if "replacement" in mutation_type and orig and mut:
-                if orig in mutated:
-                    mutated = mutated.replace(orig, mut, 1)  # Replace first occurrence only
-                    print(f"DEBUG: Applied replacement successfully")
-                    changes.append(detail)
-                else:
-                    print(f"DEBUG: WARNING - Replacement failed, original text not found: '{orig[:100]}'")
-                    failed_mutations.append({"type": mutation_type, "reason": "original_text not found", "orig": orig[:100]})
-            # Handle injections (both "injection" and "secret_injection")
-            elif "injection" in mutation_type and mut:
-                applied = False
-                
-                # If LLM provided an insertion point (original_text), use it
-                if orig and orig in mutated:
-                    mutated = mutated.replace(orig, mut, 1)
-                    print(f"DEBUG: Applied injection at LLM-suggested insertion point")
-                    applied = True
-                else:
-                    # Otherwise append at the end
-                    mutated = mutated.rstrip() + " " + mut
-                    print(f"DEBUG: Appended injection to end (no insertion point suggested)")
-                    applied = True
-                
-                if applied:
-                    changes.append(detail)
-                else:
-                    print(f"DEBUG: WARNING - Injection failed: '{mut[:100]}'")
-                    failed_mutations.append({"type": mutation_type, "reason": "no insertion point", "mut": mut[:100]})
+        # Apply all mutations against the original prompt in one pass
+        patch = apply_mutations(prompt_text, mutations)
+        mutated = patch["mutated"]
+        spans = patch["applied"]
+        changes = [span["detail"] for span in spans]
+        failed_mutations = patch["failed"]
         
         # Verify all mutations were applied
         if failed_mutations:
@@ -361,7 +276,9 @@ Original Prompt:
             "original": prompt_text,
             "mutated": mutated,
             "mutations": mutations,
-            "changes": changes
+            "changes": changes,
+            "spans": spans,
+            "detection_index": build_detection_index(changes, spans=spans)
         }
     except Exception as e:
         print(f"DEBUG: Mutation parsing error: {e}, response: {response}")
@@ -369,118 +286,78 @@ Original Prompt:
             "original": prompt_text,
             "mutated": prompt_text,
             "mutations": [],
-            "changes": []
+            "changes": [],
+            "spans": [],
+            "detection_index": build_detection_index([])
         }
 
 
-def detect_indicators(student_text: str, original_prompt: str, secret_prompt: str, changes: list) -> dict:
+def mutate_prompt(prompt_text: str, guidance: dict = None) -> dict:
     """
-    Find which indicators (changes) appear in student text.
-    Returns: {score, indicators_found, summary}
+    Create an alternative homework prompt with imperceptible tracking markers.
+    Returns: {original, mutated, mutations: [{type, category, original_text, mutated_text, detail}], changes, spans, detection_index}
+    spans carry the exact original/mutated offsets of every applied change.
+    guidance: optional {prefer, avoid} marker kinds (see marker_stats.guidance).
     """
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "indicators_found": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "change": {"type": "STRING"},
-                        "found": {"type": "BOOLEAN"},
-                        "locations": {
-                            "type": "ARRAY",
-                            "items": {"type": "STRING"}
-                        }
-                    },
-                    "required": ["change", "found", "locations"]
-                }
-            },
-            "summary": {"type": "STRING"}
-        },
-        "required": ["indicators_found", "summary"]
-    }
-    
-    changes_str = "\n".join([f"- {change}" for change in changes])
-    
-    prompt = f"""You are an academic integrity detector specializing in identifying hyper-specific, creative modifications.
-
-You have been given a list of SPECIFIC changes that were intentionally made to a homework prompt.
-These changes are:
-- HYPER-SPECIFIC: Not generic phrases, but precise wording, examples, or instructions
-- CREATIVE: Unique modifications that would be unlikely to appear by chance
-- DETECTABLE: Clear enough to identify if a student used the modified prompt
-
-Your job is to find which of these changes appear in the student's submitted text.
+    prompt, config = _mutation_request(prompt_text, guidance=guidance)
+    response = call_gemini(prompt=prompt, config=config)
+    return _apply_mutation_response(prompt_text, response, guidance)
 
-Original prompt:
-{original_prompt}
 
-Secret/mutated prompt (what the student may have seen):
-{secret_prompt}
+def generate_marker_pool(prompt_text: str, pool_size: int, guidance: dict = None) -> dict:
+    """
+    One Gemini call for a pool of mutually compatible markers (see variants.py).
+    Returns the same shape as mutate_prompt; spans hold only the markers that applied cleanly.
+    """
+    prompt, config = _mutation_request(prompt_text, pool_size=pool_size, guidance=guidance)
+    response = call_gemini(prompt=prompt, config=config)
+    # Pools need room for distinct per-student subsets, so prune less aggressively
+    return _apply_mutation_response(prompt_text, response, guidance, min_keep=pool_size // 2)
 
-Specific changes to detect:
-{changes_str}
 
-DETECTION CRITERIA:
-1. Look for EXACT or near-exact matches of the specific wording from the changes
-2. Consider context: Does the student's response directly address the modified instruction?
-3. Check for unique examples, phrases, or requirements that only appear in the mutated version
-4. Be strict: Only mark as "found" if there's clear evidence the student saw the modified prompt
+def stream_mutate_prompt(prompt_text: str, guidance: dict = None) -> Iterator[Tuple[str, Any]]:
+    """Streaming variant of mutate_prompt (see stream_events)."""
+    prompt, config = _mutation_request(prompt_text, guidance=guidance)
+    return stream_events(prompt, config, lambda raw: _apply_mutation_response(prompt_text, raw, guidance),
+                         items=True, item_key="mutations")
 
-REQUIRED OUTPUT:
-- indicators_found: array of detection results, EACH with change, found, and locations fields
-- summary: a brief summary of your findings and overall confidence level
 
-Student Submitted Text:
-{student_text}"""
-    
-    response = call_gemini(prompt=prompt, response_schema=response_schema)
+def detect_indicators(student_text: str, original_prompt: str, secret_prompt: str, changes: list, detection_index=None) -> dict:
+    """
+    Find which indicators (changes) appear in student text.
+    detection_index: precomputed markers.DetectionIndex for the homework (built from changes if omitted).
+    Returns: {score, indicators_found, summary}
+    """
+    if detection_index is None:
+        detection_index = load_detection_index(changes=changes)
+
+    prompt = prompts.DETECT.render(
+        original_prompt=original_prompt,
+        secret_prompt=secret_prompt,
+        changes=detection_index.changes_block,
+        student_text=student_text
+    )
+    response = call_routed("detect", prompt, prompts.DETECT.config,
+                           lambda raw: _check_detection(raw, detection_index))
     
     try:
-        result = json.loads(response)
+        result = loads_with_recovery(response, "indicators_found")
         found_count = sum(1 for ind in result["indicators_found"] if ind["found"])
-        total_count = len(result["indicators_found"])
+        # Score against every marker that was asked about: a truncated response that was only
+        # partly recovered must not shrink the denominator (2 of 3 found is 2/3, not 2/2)
+        expected = len(detection_index.changes)
+        total_count = max(expected, len(result["indicators_found"]))
+        partial = len(result["indicators_found"]) < expected
         
-        # Build precise locations by computing exact offsets and short snippets
-        def _find_snippet(text: str, query: str, radius: int) -> str:
-            t = text
-            q = query
-            i = t.lower().find(q.lower())
-            if i == -1:
-                # try punctuation-stripped search
-                import re
-                t2 = re.sub(r"[^a-zA-Z0-9\s]", " ", t).lower()
-                q2 = re.sub(r"[^a-zA-Z0-9\s]", " ", q).lower()
-                i = t2.find(q2)
-                if i == -1:
-                    # try first quoted phrase in query
-                    m = re.search(r"['\"]([^'\"]+)['\"]", q)
-                    if m:
-                        phrase = m.group(1)
-                        i = t.lower().find(phrase.lower())
-                        q = phrase
-                if i == -1:
-                    # fallback: first significant word
-                    words = [w for w in re.split(r"\s+", q) if len(w) > 4]
-                    if words:
-                        i = t.lower().find(words[0].lower())
-                        q = words[0]
-            if i == -1:
-                return "unknown"
-            start = max(0, i - radius)
-            end = min(len(t), i + len(q) + radius)
-            snip = t[start:end]
-            prefix = "..." if start > 0 else ""
-            suffix = "..." if end < len(t) else ""
-            return f"{prefix}{snip}{suffix}"
+        # Locate each found marker using the precomputed index
+        submission = SubmissionText(student_text)
 
         indicators_for_display = []
         for ind in result["indicators_found"]:
             if not ind.get("found"):
                 continue
             change_text = ind.get("change", "")
-            snippet = _find_snippet(student_text, change_text, radius=60)
+            snippet = detection_index.find_snippet(submission, change_text, radius=60)
             indicators_for_display.append({
                 "type": "marker_found",
                 "evidence": change_text,
@@ -490,7 +367,8 @@ Student Submitted Text:
         return {
             "score": f"{found_count}/{total_count}",
             "indicators_found": indicators_for_display,
-            "summary": result.get("summary", "")
+            "summary": result.get("summary", ""),
+            **({"partial": True} if partial else {})
         }
     except Exception as e:
         print(f"DEBUG: Indicators parsing error: {e}, response: {response}")
@@ -501,58 +379,124 @@ Student Submitted Text:
         }
 
 
-def analyze_interview_transcript(transcript: list, submission_text: str) -> dict:
-    """
-    Analyze an interview transcript to determine if the student knows their work.
-    Returns: {score: int, reasoning: str, verdict: str}
-    """
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "score": {"type": "INTEGER"},
-            "reasoning": {"type": "STRING"},
-            "verdict": {"type": "STRING"}
-        }
-    }
+def _check_detection(response: str, detection_index) -> Optional[str]:
+    """Routing check for detect_indicators: every marker answered; a marker rate near the flagging line is low confidence."""
+    items = json.loads(response)["indicators_found"]
+    expected = len(detection_index.changes)
+    if len(items) < expected:
+        return f"schema: {len(items)} of {expected} markers answered"
+    if any(not isinstance(item.get("found"), bool) for item in items):
+        return "schema: marker without a found flag"
+    rate = sum(1 for item in items if item["found"]) / len(items) if items else 0.0
+    if items and routing.is_borderline(rate, routing.PLAGIARISM_THRESHOLD):
+        return f"low_confidence: marker rate {rate:.2f}"
+    return None
+
 
-    # Format transcript
+def _format_transcript(transcript: list) -> str:
     transcript_text = ""
     for msg in transcript:
         driver = "Interviewer" if msg.get("role") != "user" else "Student"
         transcript_text += f"{driver}: {msg.get('content')}\n"
+    return transcript_text
+
+
+def _interview_request(transcript: list, submission_text: str, digest_text: str = None):
+    """Build the prompt and request config for interview analysis (against the digest when given)."""
+    if digest_text:
+        submission_section = f"STUDENT SUBMISSION DIGEST:\n{digest_text}"
+    else:
+        truncated = "... (truncated)" if len(submission_text) > 5000 else ""
+        submission_section = f"STUDENT SUBMISSION:\n{submission_text[:5000]}{truncated}"
+    prompt = prompts.INTERVIEW.render(submission_section=submission_section, transcript_text=_format_transcript(transcript))
+    return prompt, prompts.INTERVIEW.config
+
+
+def _check_verdict(response: str) -> Optional[str]:
+    """Routing check for analyze_interview_transcript: a valid verdict that agrees with a clear-cut score."""
+    result = json.loads(response)
+    score, verdict = result.get("score"), result.get("verdict")
+    if not isinstance(score, int) or not 0 <= score <= 100 or verdict not in ("SUSPICIOUS", "VERIFIED"):
+        return f"schema: score {score!r}, verdict {verdict!r}"
+    if (score < routing.INTERVIEW_PASS_SCORE) != (verdict == "SUSPICIOUS"):
+        return f"low_confidence: verdict {verdict} contradicts score {score}"
+    if routing.is_borderline(score, routing.INTERVIEW_PASS_SCORE, scale=100):
+        return f"low_confidence: score {score}"
+    return None
+
+
+def _parse_interview_analysis(response: str) -> dict:
+    try:
+        return json.loads(response)
+    except Exception as e:
+        print(f"DEBUG: Interview analysis error: {e}")
+        return {
+            "score": 0,
+            "reasoning": "Failed to analyze interview.",
+            "verdict": "ERROR"
+        }
 
-    prompt = f"""You are an academic integrity officer.
-Your job is to determine if a student is the true author of a submission by analyzing their interview performance.
 
-STUDENT SUBMISSION:
-{submission_text[:5000]}... (truncated)
+def analyze_interview_transcript(transcript: list, submission_text: str, digest_text: str = None) -> dict:
+    """
+    Analyze an interview transcript to determine if the student knows their work.
+    Returns: {score: int, reasoning: str, verdict: str}
+    """
+    prompt, config = _interview_request(transcript, submission_text, digest_text)
+    response = call_routed("interview", prompt, config, _check_verdict)
+    return _parse_interview_analysis(response)
 
-INTERVIEW TRANSCRIPT:
-{transcript_text}
 
-TASK:
-1. Compare the student's oral answers to the specific details in the text.
-2. Check for:
-   - Specificity: Do they recall their own arguments/examples?
-   - CONSISTENCY: Do their explanations match what was written?
-   - HALLUCINATION: Did they agree with "tricky" false premises? (Major red flag)
-   - Depth: Can they explain the *why* behind their points?
+def stream_interview_analysis(transcript: list, submission_text: str, digest_text: str = None) -> Iterator[Tuple[str, Any]]:
+    """Streaming variant of analyze_interview_transcript (see stream_events)."""
+    prompt, config = _interview_request(transcript, submission_text, digest_text)
+    return stream_events(prompt, config, _parse_interview_analysis, task="interview", check=_check_verdict)
 
-SCORING:
-- 0-49: Suspicious. Vague answers, contradictions, or falling for tricks. (Likely Plagiarism)
-- 50-100: Verified. Specific, consistent answers demonstrating authorship.
 
-Output JSON with integer score (0-100), reasoning (concise explanation), and verdict (SUSPICIOUS | VERIFIED).
-"""
+def digest_submission(submission_text: str) -> dict:
+    """
+    Compact structured digest of a submission (see digests.py).
+    Returns: {summary: str, outline: [str], claims: [str], examples: [str], quotes: [str]}
+    """
+    prompt = prompts.DIGEST.render(submission_text=submission_text)
+    response = call_gemini(prompt=prompt, config=prompts.DIGEST.config)
+    try:
+        result = json.loads(response)
+        return {key: result.get(key, "" if key == "summary" else []) for key in prompts.DIGEST_SCHEMA["properties"]}
+    except Exception as e:
+        print(f"DEBUG: Submission digest error: {e}")
+        return {"summary": submission_text[:1000], "outline": [], "claims": [], "examples": [], "quotes": []}
 
-    response = call_gemini(prompt=prompt, response_schema=response_schema)
 
+def analyze_interview_exchange(exchange: list, digest_text: str, previous_notes: list = None) -> dict:
+    """
+    Assess one new interview exchange against the submission digest (digests.render).
+    Returns: {score: int 0-100, note: str, red_flags: [str]}
+    """
+    notes = "\n".join(f"- {note}" for note in (previous_notes or [])) or "(none yet)"
+    prompt = prompts.INTERVIEW_EXCHANGE.render(digest_text=digest_text, notes=notes, exchange=_format_transcript(exchange))
+    response = call_gemini(prompt=prompt, config=prompts.INTERVIEW_EXCHANGE.config)
     try:
-        return json.loads(response)
-    except Exception as e:
-        print(f"DEBUG: Interview analysis error: {e}")
+        result = json.loads(response)
         return {
-            "score": 0,
-            "reasoning": "Failed to analyze interview.",
-            "verdict": "ERROR"
+            "score": max(0, min(100, int(result.get("score", 0)))),
+            "note": result.get("note", ""),
+            "red_flags": result.get("red_flags", [])
         }
+    except Exception as e:
+        print(f"DEBUG: Interview exchange error: {e}")
+        return {"score": 50, "note": "Exchange could not be analyzed.", "red_flags": []}
+
+
+def finalize_interview(notes: list, running_score: float) -> dict:
+    """
+    Closing call for an incrementally analyzed interview.
+    notes: [{score, note, red_flags}] per exchange. Returns the analyze_interview_transcript shape.
+    """
+    lines = "\n".join(
+        f"{i + 1}. [{n['score']}] {n['note']}" + (f" Red flags: {'; '.join(n['red_flags'])}" if n.get("red_flags") else "")
+        for i, n in enumerate(notes)
+    )
+    prompt = prompts.INTERVIEW_FINAL.render(running_score=f"{running_score:.0f}", lines=lines)
+    response = call_gemini(prompt=prompt, config=prompts.INTERVIEW_FINAL.config)
+    return _parse_interview_analysis(response)
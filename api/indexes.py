@@ -0,0 +1,114 @@
+"""
+Index manifest for the collections the Flask API queries.
+
+The Mongoose schemas in db/ declare indexes for the Next.js side; this manifest
+covers the query shapes used by app.py (and matches the Mongoose definitions
+where they overlap, so creating both is a no-op). `ensure_indexes` is applied
+at startup and is idempotent. `QUERY_SHAPES` lists one representative query per
+route so scripts/check_indexes.py can explain() them and fail on COLLSCANs.
+"""
+from datetime import datetime, UTC
+from typing import Any, Dict, List
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+import cache
+import pdf_cache
+import similarity
+
+INDEXES = {
+    "homeworks": [
+        IndexModel([("assignment_id", ASCENDING)]),
+    ],
+    "assignments": [
+        IndexModel([("courseId", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("courseId", ASCENDING), ("dueDate", ASCENDING)]),
+        IndexModel([("professorId", ASCENDING)]),
+    ],
+    "courses": [
+        IndexModel([("professorId", ASCENDING)]),
+    ],
+    "submissions": [
+        IndexModel([("assignmentId", ASCENDING), ("studentId", ASCENDING)]),
+        IndexModel([("studentId", ASCENDING), ("submittedAt", DESCENDING)]),
+        IndexModel([("teacherId", ASCENDING), ("needsInterview", ASCENDING)]),
+    ],
+    "cache": cache.INDEXES,
+    "similarity": similarity.INDEXES,
+    pdf_cache.ENTRIES_COLLECTION: pdf_cache.INDEXES,
+    "variants": [
+        IndexModel([("assignmentId", ASCENDING), ("studentId", ASCENDING)], unique=True),
+        IndexModel([("assignmentId", ASCENDING), ("poolHash", ASCENDING), ("bits", ASCENDING)]),
+    ],
+}
+
+
+def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create every index in the manifest. Returns index names per collection."""
+    created = {}
+    for name, models in INDEXES.items():
+        try:
+            created[name] = db[name].create_indexes(models)
+        except Exception as e:
+            # An existing index with the same keys but different options; leave it alone
+            print(f"[INDEXES] Could not create indexes on {name}: {str(e)}")
+            created[name] = []
+    return created
+
+
+# (route, collection, filter) with representative values
+_ID = ObjectId("000000000000000000000000")
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"route": "GET /api/courses", "collection": "courses",
+     "filter": {"professorId": "user_x"}},
+    {"route": "GET /api/courses (assignmentCount)", "collection": "assignments",
+     "filter": {"courseId": _ID}},
+    {"route": "GET /api/courses (totalSubmissions)", "collection": "submissions",
+     "filter": {"teacherId": "user_x"}},
+    {"route": "GET /api/courses (pendingReviews)", "collection": "submissions",
+     "filter": {"teacherId": "user_x", "needsInterview": True, "interviewCompleted": {"$ne": True}}},
+    {"route": "GET /api/courses/<id>/assignments", "collection": "assignments",
+     "filter": {"courseId": _ID, "status": {"$ne": "deleted"}}},
+    {"route": "GET /api/assignments/<id>/submissions", "collection": "submissions",
+     "filter": {"assignmentId": _ID}},
+    {"route": "GET /api/assignments/<id>/pdf", "collection": "homeworks",
+     "filter": {"assignment_id": str(_ID)}},
+    {"route": "ResultCache.get", "collection": "cache",
+     "filter": {"key": "k", "expiresAt": {"$gt": datetime.now(UTC)}}},
+    {"route": "POST /api/admin/cache/invalidate", "collection": "cache",
+     "filter": {"tags": {"$in": ["assignment:x"]}, "namespace": {"$in": ["grade"]}}},
+    {"route": "GET /api/assignments/<id>/similarity", "collection": "similarity",
+     "filter": {"assignmentId": str(_ID), "bands": {"$in": ["0:x"]}}},
+]
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten the stage names of an explain() winning plan."""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "queryPlan" in node:  # slot-based engine wraps the classic plan
+            stack.append(node["queryPlan"])
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+def explain_shape(db, shape: Dict[str, Any]) -> Dict[str, Any]:
+    """Explain one query shape and report its stages and whether it scans the collection."""
+    explain = db[shape["collection"]].find(shape["filter"]).explain()
+    planner = explain.get("queryPlanner", {})
+    stages = plan_stages(planner.get("winningPlan", {}))
+    stats = explain.get("executionStats", {})
+    return {
+        "route": shape["route"],
+        "collection": shape["collection"],
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "docsExamined": stats.get("totalDocsExamined"),
+    }
@@ -0,0 +1,95 @@
+"""
+Incremental interview analysis.
+
+Instead of sending the whole transcript and submission to Gemini once the
+interview ends, turns are appended as they happen and every completed exchange
+(interviewer question(s) + student answer(s)) is assessed on its own against
+the submission digest (digests.py). Progress lives on the submission as
+`interviewProgress`:
+
+    {analyzedTurns, exchanges: [{start, end, score, note, redFlags}], runningScore}
+
+so the closing verdict only needs the short per-exchange notes, and a retried
+append only re-sends the turns the server has not stored yet.
+"""
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from gemini import analyze_interview_exchange
+
+# Earlier notes passed along with each exchange (keeps consistency checks cheap)
+CONTEXT_NOTES = 6
+
+
+def _is_student(turn: Dict[str, Any]) -> bool:
+    return turn.get("role") == "user"
+
+
+def exchange_bounds(transcript: List[Dict[str, Any]], start: int, final: bool = False) -> List[Tuple[int, int]]:
+    """
+    (start, end) turn ranges of the complete exchanges after `start`. An exchange is
+    complete once the interviewer speaks again after a student answer; at finalization
+    the trailing turns count too if the student said anything.
+    """
+    bounds = []
+    begin = start
+    for i in range(start + 1, len(transcript)):
+        if not _is_student(transcript[i]) and _is_student(transcript[i - 1]):
+            bounds.append((begin, i))
+            begin = i
+    if final and any(_is_student(turn) for turn in transcript[begin:]):
+        bounds.append((begin, len(transcript)))
+    return bounds
+
+
+def new_progress() -> Dict[str, Any]:
+    return {"analyzedTurns": 0, "exchanges": [], "runningScore": None}
+
+
+def running_score(exchanges: List[Dict[str, Any]]) -> Optional[float]:
+    if not exchanges:
+        return None
+    return round(sum(e["score"] for e in exchanges) / len(exchanges), 1)
+
+
+def notes(progress: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"score": e["score"], "note": e["note"], "red_flags": e.get("redFlags", [])} for e in progress["exchanges"]]
+
+
+def advance(submissions_col, submission: Dict[str, Any], load_digest: Callable[[], str],
+            final: bool = False) -> Dict[str, Any]:
+    """
+    Assess the exchanges completed since the last call and store the new progress.
+    load_digest (rendered digest text, or the submission itself when it is short) is only called
+    when there is something to assess.
+    The write is conditional on analyzedTurns, so concurrent appends never double-count
+    an exchange; the loser returns the progress it read.
+    """
+    transcript = submission.get("interviewTranscript", [])
+    progress = submission.get("interviewProgress") or new_progress()
+    bounds = exchange_bounds(transcript, progress["analyzedTurns"], final=final)
+    if not bounds:
+        return progress
+
+    digest_text = load_digest()
+    exchanges = list(progress["exchanges"])
+    for start, end in bounds:
+        previous = [e["note"] for e in exchanges[-CONTEXT_NOTES:]]
+        result = analyze_interview_exchange(transcript[start:end], digest_text, previous)
+        exchanges.append({
+            "start": start,
+            "end": end,
+            "score": result["score"],
+            "note": result["note"],
+            "redFlags": result.get("red_flags", [])
+        })
+
+    updated = {"analyzedTurns": bounds[-1][1], "exchanges": exchanges, "runningScore": running_score(exchanges)}
+    result = submissions_col.update_one(
+        {"_id": submission["_id"], "interviewProgress.analyzedTurns": {"$in": [progress["analyzedTurns"], None]}},
+        {"$set": {"interviewProgress": updated, "updatedAt": datetime.now(UTC)}}
+    )
+    if result.matched_count == 0:
+        print(f"[INTERVIEW] Progress for {submission['_id']} moved on concurrently; discarding {len(bounds)} exchange(s)")
+        return progress
+    return updated
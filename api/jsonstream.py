@@ -0,0 +1,125 @@
+"""
+Incremental parsing of streamed Gemini JSON.
+
+Gemini responses are either a top-level array (rubric suggestions) or an object
+holding one array of interest (mutations, criteria, indicators_found). The
+parser walks the chunks once, tracking only string/escape state and container
+depth, and hands back every array item as soon as its closing bracket arrives.
+The same scan recovers all complete items from a truncated response, so a bad
+tail no longer throws away the whole answer.
+"""
+import json
+from typing import Any, List, Optional
+
+
+class ArrayItemParser:
+    """
+    Yield completed items of one JSON array from a chunked document.
+    key: property of the top-level object holding the array, or None for a top-level array.
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        self.key = key
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._array_depth = None   # stack depth inside the target array
+        self._item_start = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk and return the items it completed."""
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        items = []
+        text = self._text
+        i = self._pos
+        n = len(text)
+        while i < n:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._stack[0] == "{":
+                        self._last_string = text[self._string_start + 1:i]
+                i += 1
+                continue
+
+            in_array = self._array_depth is not None and len(self._stack) == self._array_depth
+            if in_array and self._item_start is None and c not in " \t\r\n,]":
+                self._item_start = i
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                if (c == "[" and self._array_depth is None and
+                        ((self.key is None and not self._stack) or
+                         (self._stack == ["{"] and self._last_string == self.key))):
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append(c)
+            elif c in "}]":
+                if in_array and c == "]":
+                    self._emit_scalar(text, i, items)
+                    self.done = True
+                    self._pos = i + 1
+                    return items
+                if self._stack:
+                    self._stack.pop()
+                if self._array_depth is not None and len(self._stack) == self._array_depth and self._item_start is not None:
+                    self._emit(text[self._item_start:i + 1], items)
+            elif c == "," and in_array:
+                self._emit_scalar(text, i, items)
+            i += 1
+        self._pos = i
+        # Drop consumed text that no pending item or key still refers to
+        keep = self._item_start if self._item_start is not None else (self._string_start if self._in_string else i)
+        if keep > 0:
+            self._text = text[keep:]
+            self._pos -= keep
+            if self._item_start is not None:
+                self._item_start -= keep
+            if self._string_start is not None:
+                self._string_start -= keep
+        return items
+
+    def _emit_scalar(self, text: str, end: int, items: List[Any]):
+        if self._item_start is not None:
+            self._emit(text[self._item_start:end].strip(), items)
+
+    def _emit(self, raw: str, items: List[Any]):
+        self._item_start = None
+        try:
+            items.append(json.loads(raw))
+        except ValueError:
+            pass
+
+
+def recover_items(raw: str, key: Optional[str] = None) -> List[Any]:
+    """Return every complete item of the target array in a (possibly truncated) response."""
+    return ArrayItemParser(key).feed(raw or "")
+
+
+def loads_with_recovery(raw: str, key: Optional[str] = None, tag: str = "GEMINI"):
+    """
+    json.loads the response; if it is malformed, fall back to the complete array items.
+    Returns the parsed document, or {key: items} / items when recovering.
+    Re-raises the original error when nothing can be recovered.
+    """
+    try:
+        return json.loads(raw)
+    except ValueError:
+        items = recover_items(raw, key)
+        if not items:
+            raise
+        print(f"[{tag}] Recovered {len(items)} complete items from a malformed response")
+        return items if key is None else {key: items}
@@ -0,0 +1,125 @@
+"""
+Per-route LLM token and latency accounting.
+
+Each Flask request opens a usage scope (a context variable). gemini.stream_gemini
+reports the token counts of every call into the current scope, and callers that
+send a digest instead of the raw submission report the estimated tokens saved.
+When the request ends, the scope is folded into per-route totals exposed at
+/health/llm. Work handed to thread pools must run in a copy of the request
+context (contextvars.copy_context().run) to be attributed to the route.
+Calls are also totalled per model (with their latency), whatever the scope.
+"""
+import contextvars
+import threading
+from typing import Any, Dict, Optional
+
+# Rough characters-per-token ratio for estimating savings before a call is made
+CHARS_PER_TOKEN = 4
+
+_scope: contextvars.ContextVar[Optional["Usage"]] = contextvars.ContextVar("llm_usage", default=None)
+
+_routes: Dict[str, Dict[str, Any]] = {}
+_routes_lock = threading.Lock()
+
+_models: Dict[str, Dict[str, Any]] = {}
+_models_lock = threading.Lock()
+
+
+class Usage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.saved_tokens = 0
+
+    def add_call(self, prompt_tokens: int, output_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+
+    def add_saved(self, tokens: int):
+        with self._lock:
+            self.saved_tokens += tokens
+
+
+def begin() -> contextvars.Token:
+    return _scope.set(Usage())
+
+
+def end(token: contextvars.Token, route: str, latency_ms: float) -> Optional[Usage]:
+    """Close the scope opened by begin() and add it to the route's totals."""
+    usage = _scope.get()
+    try:
+        _scope.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a server that moves requests between threads)
+        _scope.set(None)
+    if usage is None:
+        return None
+    with _routes_lock:
+        stats = _routes.setdefault(route, {
+            "requests": 0, "llmCalls": 0, "promptTokens": 0, "outputTokens": 0,
+            "tokensSavedEstimate": 0, "latencyMsTotal": 0.0, "latencyMsMax": 0.0
+        })
+        stats["requests"] += 1
+        stats["llmCalls"] += usage.calls
+        stats["promptTokens"] += usage.prompt_tokens
+        stats["outputTokens"] += usage.output_tokens
+        stats["tokensSavedEstimate"] += usage.saved_tokens
+        stats["latencyMsTotal"] += latency_ms
+        stats["latencyMsMax"] = max(stats["latencyMsMax"], latency_ms)
+    return usage
+
+
+def record_call(prompt_tokens: Optional[int], output_tokens: Optional[int]):
+    usage = _scope.get()
+    if usage is not None:
+        usage.add_call(prompt_tokens or 0, output_tokens or 0)
+
+
+def record_model_call(model: str, latency_ms: float, prompt_tokens: Optional[int], output_tokens: Optional[int]):
+    with _models_lock:
+        stats = _models.setdefault(model, {
+            "calls": 0, "promptTokens": 0, "outputTokens": 0, "latencyMsTotal": 0.0, "latencyMsMax": 0.0
+        })
+        stats["calls"] += 1
+        stats["promptTokens"] += prompt_tokens or 0
+        stats["outputTokens"] += output_tokens or 0
+        stats["latencyMsTotal"] += latency_ms
+        stats["latencyMsMax"] = max(stats["latencyMsMax"], latency_ms)
+
+
+def record_saved_chars(chars: int):
+    """Report raw text that was replaced by a shorter digest in a prompt."""
+    usage = _scope.get()
+    if usage is not None and chars > 0:
+        usage.add_saved(chars // CHARS_PER_TOKEN)
+
+
+def route_stats() -> Dict[str, Dict[str, Any]]:
+    with _routes_lock:
+        return {
+            route: {
+                **stats,
+                "latencyMsAvg": round(stats["latencyMsTotal"] / stats["requests"], 1),
+                "latencyMsTotal": round(stats["latencyMsTotal"], 1),
+                "latencyMsMax": round(stats["latencyMsMax"], 1),
+                "promptTokensAvg": round(stats["promptTokens"] / stats["requests"], 1)
+            }
+            for route, stats in _routes.items()
+        }
+
+
+def model_stats() -> Dict[str, Dict[str, Any]]:
+    with _models_lock:
+        return {
+            model: {
+                **stats,
+                "latencyMsAvg": round(stats["latencyMsTotal"] / stats["calls"], 1),
+                "latencyMsTotal": round(stats["latencyMsTotal"], 1),
+                "latencyMsMax": round(stats["latencyMsMax"], 1)
+            }
+            for model, stats in _models.items()
+        }
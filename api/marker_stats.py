@@ -0,0 +1,145 @@
+"""
+Marker effectiveness statistics.
+
+Every marker has a kind: its strategy (replacement / injection) plus the
+category of obscure detail it asks for (science, geography, exact phrase...).
+Each detection records, per kind, how many students were given such a marker
+and how many submissions contained it; a later interview verdict records
+whether those hits were confirmed (flagged) or refuted (verified). The ranking
+built from these counters is passed to Gemini at mutation time, and markers of
+dead kinds are dropped before they reach a prompt, so detection calls carry
+fewer, better markers.
+"""
+import os
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional
+
+COLLECTION = "marker_stats"
+
+CATEGORIES = ["geography", "food", "arts", "history", "literature", "science", "exact_phrase", "other"]
+
+MIN_EXPOSURES = int(os.environ.get("MARKER_STATS_MIN_EXPOSURES", "30"))
+DEAD_HIT_RATE = float(os.environ.get("MARKER_DEAD_HIT_RATE", "0.01"))
+MIN_VERDICTS = int(os.environ.get("MARKER_STATS_MIN_VERDICTS", "10"))
+MIN_MARKERS = int(os.environ.get("MARKER_MIN_KEPT", "8"))
+PREFERRED_KINDS = 3
+RANKING_TTL_SECONDS = 300
+
+_ranking_cache: Dict[str, Any] = {"at": 0.0, "ranking": None}
+_ranking_lock = threading.Lock()
+
+
+def marker_kind(marker: Dict[str, Any]) -> str:
+    strategy = "injection" if "injection" in (marker.get("type") or "").lower() else "replacement"
+    category = (marker.get("category") or "other").lower().replace(" ", "_")
+    if category not in CATEGORIES:
+        category = "other"
+    return f"{strategy}:{category}"
+
+
+def record_detection(db, markers: List[Dict[str, Any]], analysis: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Count one exposure for every marker the student was given and one hit for every
+    marker found. Returns the outcome to store on the submission for record_verdict.
+    """
+    found = {ind.get("evidence") for ind in analysis.get("indicators_found", [])}
+    checked = [marker_kind(m) for m in markers]
+    hit = [marker_kind(m) for m in markers if m.get("detail") in found]
+
+    increments: Dict[str, Dict[str, int]] = {}
+    for kind in checked:
+        increments.setdefault(kind, {"exposures": 0, "hits": 0})["exposures"] += 1
+    for kind in hit:
+        increments[kind]["hits"] += 1
+
+    now = datetime.now(UTC)
+    for kind, inc in increments.items():
+        db[COLLECTION].update_one(
+            {"_id": kind},
+            {"$inc": inc, "$set": {"updatedAt": now}},
+            upsert=True
+        )
+    return {"checked": checked, "hit": hit}
+
+
+def record_verdict(db, outcome: Optional[Dict[str, List[str]]], verdict: str):
+    """Attribute an interview verdict to the marker kinds that fired on the submission."""
+    if not outcome or not outcome.get("hit"):
+        return
+    field = "confirmed" if verdict == "flagged" else "refuted"
+    now = datetime.now(UTC)
+    for kind in set(outcome["hit"]):
+        db[COLLECTION].update_one(
+            {"_id": kind},
+            {"$inc": {field: outcome["hit"].count(kind)}, "$set": {"updatedAt": now}},
+            upsert=True
+        )
+
+
+def _score(doc: Dict[str, Any]) -> Dict[str, Any]:
+    exposures = doc.get("exposures", 0)
+    hits = doc.get("hits", 0)
+    confirmed = doc.get("confirmed", 0)
+    refuted = doc.get("refuted", 0)
+    # Laplace-smoothed rates so sparse kinds neither dominate nor vanish
+    hit_rate = (hits + 1) / (exposures + 2)
+    precision = (confirmed + 1) / (confirmed + refuted + 2)
+    dead = (
+        (exposures >= MIN_EXPOSURES and hits / exposures < DEAD_HIT_RATE)
+        or (confirmed + refuted >= MIN_VERDICTS and precision < 0.2)
+    )
+    return {
+        "kind": doc["_id"],
+        "exposures": exposures,
+        "hits": hits,
+        "confirmed": confirmed,
+        "refuted": refuted,
+        "hitRate": round(hits / exposures, 4) if exposures else 0.0,
+        "precision": round(confirmed / (confirmed + refuted), 3) if confirmed + refuted else None,
+        "score": round(hit_rate * precision, 4),
+        "dead": dead
+    }
+
+
+def ranking(db, refresh: bool = False) -> List[Dict[str, Any]]:
+    """Marker kinds ordered by effectiveness, cached in-process for a few minutes."""
+    with _ranking_lock:
+        if not refresh and _ranking_cache["ranking"] is not None and time.monotonic() - _ranking_cache["at"] < RANKING_TTL_SECONDS:
+            return _ranking_cache["ranking"]
+    ranked = sorted((_score(doc) for doc in db[COLLECTION].find()), key=lambda r: -r["score"])
+    with _ranking_lock:
+        _ranking_cache.update(at=time.monotonic(), ranking=ranked)
+    return ranked
+
+
+def guidance(db) -> Optional[Dict[str, List[str]]]:
+    """Kinds to prefer and avoid at mutation time, or None until there is enough history."""
+    try:
+        ranked = [r for r in ranking(db) if r["exposures"] >= MIN_EXPOSURES]
+    except Exception as e:
+        print(f"[MARKERS] Could not load marker ranking: {str(e)}")
+        return None
+    if not ranked:
+        return None
+    return {
+        "prefer": [r["kind"] for r in ranked if not r["dead"]][:PREFERRED_KINDS],
+        "avoid": [r["kind"] for r in ranked if r["dead"]]
+    }
+
+
+def prune_mutations(mutations: List[Dict[str, Any]], avoid: Iterable[str], min_keep: int = None) -> List[Dict[str, Any]]:
+    """Drop mutations of dead kinds, keeping at least min_keep (default MIN_MARKERS) overall."""
+    min_keep = MIN_MARKERS if min_keep is None else min_keep
+    avoid = set(avoid or [])
+    if not avoid:
+        return mutations
+    kept = [m for m in mutations if marker_kind(m) not in avoid]
+    if len(kept) < min_keep:
+        dropped = [m for m in mutations if marker_kind(m) in avoid]
+        kept_ids = {id(m) for m in kept + dropped[:min_keep - len(kept)]}
+        kept = [m for m in mutations if id(m) in kept_ids]
+    if len(kept) < len(mutations):
+        print(f"[MARKERS] Pruned {len(mutations) - len(kept)} markers of low-yield kinds")
+    return kept
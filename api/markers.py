@@ -0,0 +1,159 @@
+"""
+Precomputed detection index for homework markers.
+
+The index is built once when a homework is created (see `mutate_prompt` and the
+seeder) and persisted on the homework document as `detection_index`. At
+submission time it is loaded once per process, so detection only has to
+normalize the student text a single time instead of redoing the marker
+preprocessing for every indicator.
+"""
+import hashlib
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+INDEX_VERSION = 2
+
+_PUNCT_RE = re.compile(r"[^a-zA-Z0-9\s]")
+_QUOTED_RE = re.compile(r"['\"]([^'\"]+)['\"]")
+_SPACE_RE = re.compile(r"\s+")
+
+_MAX_LOADED = 512
+_loaded: Dict[str, "DetectionIndex"] = {}
+_loaded_lock = threading.Lock()
+
+
+def change_text(change: Any) -> str:
+    """Return the text of a change (Gemini stores strings, the seeder stores dicts)."""
+    if isinstance(change, dict):
+        return change.get("mutated") or change.get("mutated_text") or change.get("detail") or ""
+    return str(change)
+
+
+def _strip_punct(text: str) -> str:
+    return _PUNCT_RE.sub(" ", text).lower()
+
+
+def _build_entry(text: str, span: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Prefer a quoted term from the change itself, else from the marker text it was applied as
+    quoted = _QUOTED_RE.search(text)
+    if not quoted and span:
+        quoted = _QUOTED_RE.search(span.get("mutated_text", ""))
+    words = [w for w in _SPACE_RE.split(text) if len(w) > 4]
+    return {
+        "change": text,
+        "lower": text.lower(),
+        "normalized": _strip_punct(text),
+        "quoted": quoted.group(1).lower() if quoted else None,
+        "keyword": words[0].lower() if words else None,
+        "span": [span["mutated_start"], span["mutated_end"]] if span else None,
+        "hash": hashlib.sha1(text.encode("utf-8")).hexdigest()
+    }
+
+
+def build_detection_index(changes: List[Any], spans: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Precompute normalized marker phrases, quoted terms and keyword fallbacks for a change list.
+    spans: applied changes from mutations.apply_mutations, aligned with changes.
+    """
+    spans = spans or []
+    entries = [
+        _build_entry(change_text(c), spans[i] if i < len(spans) else None)
+        for i, c in enumerate(changes)
+    ]
+    entries = [e for e in entries if e["change"]]
+    index_hash = hashlib.sha256(
+        "\n".join(e["hash"] for e in entries).encode("utf-8")
+    ).hexdigest()
+    return {
+        "version": INDEX_VERSION,
+        "hash": index_hash,
+        "changes_block": "\n".join(f"- {e['change']}" for e in entries),
+        "entries": entries
+    }
+
+
+class SubmissionText:
+    """Student text with its lowercase and punctuation-stripped forms computed once."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        self._normalized = None
+
+    @property
+    def normalized(self) -> str:
+        if self._normalized is None:
+            self._normalized = _strip_punct(self.text)
+        return self._normalized
+
+
+class DetectionIndex:
+    """In-memory view of a persisted detection index."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.hash = data["hash"]
+        self.changes_block = data.get("changes_block", "")
+        self.entries = data.get("entries", [])
+        self.changes = [e["change"] for e in self.entries]
+        self._by_text = {}
+        for entry in self.entries:
+            self._by_text.setdefault(entry["change"], entry)
+            self._by_text.setdefault(entry["lower"], entry)
+
+    def entry_for(self, change: str) -> Dict[str, Any]:
+        """Return the precomputed entry for a change reported by Gemini."""
+        return (
+            self._by_text.get(change)
+            or self._by_text.get(change.lower())
+            or _build_entry(change)
+        )
+
+    def find_snippet(self, submission: SubmissionText, change: str, radius: int = 60) -> str:
+        """Locate a change in the student text and return a short surrounding snippet."""
+        entry = self.entry_for(change)
+        length = len(entry["change"])
+        i = submission.lower.find(entry["lower"])
+        if i == -1:
+            # punctuation-stripped search (same length as the original text)
+            i = submission.normalized.find(entry["normalized"])
+        if i == -1 and entry["quoted"]:
+            i = submission.lower.find(entry["quoted"])
+            length = len(entry["quoted"])
+        if i == -1 and entry["keyword"]:
+            i = submission.lower.find(entry["keyword"])
+            length = len(entry["keyword"])
+        if i == -1:
+            return "unknown"
+
+        t = submission.text
+        start = max(0, i - radius)
+        end = min(len(t), i + length + radius)
+        prefix = "..." if start > 0 else ""
+        suffix = "..." if end < len(t) else ""
+        return f"{prefix}{t[start:end]}{suffix}"
+
+
+def load_detection_index(homework: Optional[Dict[str, Any]] = None,
+                         changes: Optional[List[Any]] = None) -> DetectionIndex:
+    """
+    Return the detection index for a homework, memoized per process.
+    Homeworks created before the index existed get one built from their changes.
+    """
+    data = (homework or {}).get("detection_index")
+    if data and data.get("version") == INDEX_VERSION:
+        key = data["hash"]
+    else:
+        data = None
+        if changes is None:
+            changes = (homework or {}).get("changes", [])
+        key = "legacy:" + hashlib.sha256(repr(changes).encode("utf-8")).hexdigest()
+
+    index = _loaded.get(key)
+    if index is None:
+        index = DetectionIndex(data or build_detection_index(changes))
+        with _loaded_lock:
+            if len(_loaded) >= _MAX_LOADED:
+                _loaded.clear()
+            _loaded[key] = index
+    return index
@@ -0,0 +1,147 @@
+"""
+Span-based application of prompt mutations.
+
+All anchors are located against the ORIGINAL prompt in a single multi-pattern
+pass, overlapping claims are resolved in mutation order, and the mutated
+prompt is assembled with one join. Every applied change records its offsets in
+both the original and the mutated text so PDF building and detection can reuse
+them without searching again.
+"""
+import bisect
+import re
+from typing import Any, Dict, List
+
+
+def _kind(mutation: Dict[str, Any]) -> str:
+    mutation_type = (mutation.get("type") or "replacement").lower()
+    if "injection" in mutation_type:
+        return "injection"
+    if "replacement" in mutation_type:
+        return "replacement"
+    return ""
+
+
+def _locate_anchors(text: str, anchors: List[str]) -> Dict[str, List[int]]:
+    """Find every start offset of every anchor with one regex scan (longest anchor wins at a position)."""
+    positions: Dict[str, List[int]] = {a: [] for a in anchors}
+    if not anchors:
+        return positions
+    ordered = sorted(anchors, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(a) for a in ordered) + "))")
+    for match in pattern.finditer(text):
+        positions[match.group(1)].append(match.start())
+    return positions
+
+
+class _SpanSet:
+    """Sorted, non-overlapping [start, end) spans claimed in the original text."""
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def is_free(self, start: int, end: int) -> bool:
+        i = bisect.bisect_right(self.starts, start)
+        if i > 0 and self.ends[i - 1] > start:
+            return False
+        if i < len(self.starts) and self.starts[i] < end:
+            return False
+        return True
+
+    def claim(self, start: int, end: int):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def apply_mutations(prompt_text: str, mutations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply replacement/injection mutations to a prompt.
+    Returns: {mutated, applied: [{index, type, detail, original_text, mutated_text,
+              start, end, mutated_start, mutated_end}], failed: [...]}
+    Injections without a usable anchor are appended to the end of the prompt.
+    """
+    anchors = sorted({
+        m.get("original_text", "")
+        for m in mutations
+        if _kind(m) and m.get("original_text") and m.get("mutated_text")
+    })
+    positions = _locate_anchors(prompt_text, anchors)
+
+    claimed = _SpanSet()
+    placed = []      # (start, end, mutation index)
+    appended = []    # mutation indices
+    failed = []
+
+    for idx, mutation in enumerate(mutations):
+        kind = _kind(mutation)
+        orig = mutation.get("original_text", "")
+        mut = mutation.get("mutated_text", "")
+        if not kind or not mut:
+            continue
+
+        start = None
+        if orig:
+            for pos in positions.get(orig, []):
+                if claimed.is_free(pos, pos + len(orig)):
+                    start = pos
+                    break
+            if start is None:
+                # Occurrences shadowed by a longer anchor at the same offset
+                pos = prompt_text.find(orig)
+                while pos != -1 and not claimed.is_free(pos, pos + len(orig)):
+                    pos = prompt_text.find(orig, pos + 1)
+                if pos != -1:
+                    start = pos
+
+        if start is not None:
+            claimed.claim(start, start + len(orig))
+            placed.append((start, start + len(orig), idx))
+        elif kind == "injection":
+            appended.append(idx)
+        else:
+            reason = "overlapping anchor" if orig in positions and positions[orig] else "original_text not found"
+            failed.append({"index": idx, "type": mutation.get("type"), "reason": reason, "orig": orig[:100]})
+
+    # Assemble the mutated prompt in one pass
+    placed.sort()
+    pieces = []
+    records = {}
+    cursor = 0
+    out_len = 0
+    for start, end, idx in placed:
+        pieces.append(prompt_text[cursor:start])
+        out_len += start - cursor
+        mut = mutations[idx]["mutated_text"]
+        records[idx] = {"start": start, "end": end, "mutated_start": out_len, "mutated_end": out_len + len(mut)}
+        pieces.append(mut)
+        out_len += len(mut)
+        cursor = end
+    pieces.append(prompt_text[cursor:])
+    mutated = "".join(pieces)
+
+    if appended:
+        tail = [mutated.rstrip()]
+        out_len = len(tail[0])
+        for idx in appended:
+            mut = mutations[idx]["mutated_text"]
+            out_len += 1
+            records[idx] = {"start": None, "end": None, "mutated_start": out_len, "mutated_end": out_len + len(mut)}
+            tail.append(mut)
+            out_len += len(mut)
+        mutated = " ".join(tail)
+
+    applied = []
+    for idx in sorted(records):
+        mutation = mutations[idx]
+        applied.append({
+            "index": idx,
+            "type": mutation.get("type"),
+            "category": mutation.get("category"),
+            "detail": mutation.get("detail", ""),
+            "original_text": mutation.get("original_text", ""),
+            "mutated_text": mutation["mutated_text"],
+            **records[idx]
+        })
+
+    return {"mutated": mutated, "applied": applied, "failed": failed}
@@ -0,0 +1,189 @@
+"""
+Student-facing PDF rendering.
+
+The visible layer is the original prompt; each line carries an ActualText span
+with a slice of the mutated prompt, so copy/paste and accessibility tools see
+the markers while the page looks unchanged. Kept free of Flask/Mongo imports so
+batch rendering workers (batch_pdf.py) can load it cheaply.
+"""
+import bisect
+import re
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+PDF_LAYOUT_VERSION = "1"  # bump when the PDF layout/fonts change so cached files are re-rendered
+
+
+def build_secret_replacement_pdf(visible_text: str, secret_text: str, output_path: str, spans: list = None) -> bytes:
+    """
+    Generate a PDF with visible text but with secret text replacement via marked content.
+    The visible_text is what appears on screen, secret_text is what copy/paste/accessibility sees.
+    spans: applied mutation offsets into secret_text; each marker is kept within a single line's ActualText.
+    """
+    # Normalize text to avoid ReportLab encoding issues with standard fonts
+    replacements = {
+        '\u201c': '"', '\u201d': '"',  # Smart quotes
+        '\u2018': "'", '\u2019': "'",  # Smart single quotes
+        '\u2013': '-', '\u2014': '-'   # Dashes
+    }
+    for k, v in replacements.items():
+        if visible_text:
+            visible_text = visible_text.replace(k, v)
+        if secret_text:
+            secret_text = secret_text.replace(k, v)
+
+    page_size = letter
+    font_size = 12
+    margin = 50
+    line_height = font_size * 1.2
+    font_name = "Times-Roman"  # Reason: common assignment font
+    
+    # Use BytesIO if no output path specified
+    if output_path is None:
+        output_buffer = BytesIO()
+        c = canvas.Canvas(output_buffer, pagesize=page_size)
+    else:
+        c = canvas.Canvas(output_path, pagesize=page_size)
+    
+    c.setFont(font_name, font_size)
+    
+    # Layout: wrap text to fit page width, respecting newlines
+    lines = []
+    
+    # Normalize newlines
+    paragraphs = visible_text.replace('\r\n', '\n').split('\n')
+    
+    max_width = page_size[0] - 2 * margin
+    space_w = c.stringWidth(" ", font_name, font_size)
+    
+    for p_idx, paragraph in enumerate(paragraphs):
+        # If paragraph is empty, it's a blank line
+        if not paragraph.strip():
+            lines.append([])
+            continue
+            
+        words = paragraph.split()
+        current_line = []
+        current_width = 0
+        
+        for word in words:
+            w_w = c.stringWidth(word, font_name, font_size)
+            if current_width + w_w > max_width and current_line:
+                lines.append(current_line)
+                current_line = [word]
+                current_width = w_w + space_w
+            else:
+                current_line.append(word)
+                current_width += w_w + space_w
+        if current_line:
+            lines.append(current_line)
+
+    # Filter for non-empty lines to distribute secret text
+    non_empty_line_indices = [i for i, l in enumerate(lines) if l]
+    num_content_lines = len(non_empty_line_indices)
+    
+    if num_content_lines == 0:
+        c.save()
+        if output_path is None:
+            output_buffer.seek(0)
+            return output_buffer.getvalue()
+        return True
+    
+    # Distribute secret_text across NON-EMPTY lines
+    word_matches = list(re.finditer(r"\S+", secret_text))
+    target_words = [m.group(0) for m in word_matches]
+
+    # Words that start inside a marker span must stay on the same line as the marker's first word
+    glued = [False] * len(word_matches)
+    if spans:
+        marker_ranges = sorted(
+            (sp["mutated_start"], sp["mutated_end"]) for sp in spans
+            if sp.get("mutated_start") is not None
+        )
+        starts = [r[0] for r in marker_ranges]
+        for w_idx, m in enumerate(word_matches):
+            r_idx = bisect.bisect_right(starts, m.start()) - 1
+            if r_idx >= 0 and marker_ranges[r_idx][0] < m.start() < marker_ranges[r_idx][1]:
+                glued[w_idx] = True
+    total_len = len(secret_text)
+    ideal_len = total_len / num_content_lines if num_content_lines > 0 else 0
+    
+    chunks = []
+    current_chunk_words = []
+    current_len = 0
+    word_idx = 0
+    n_words = len(target_words)
+    
+    for i in range(num_content_lines - 1):
+        if word_idx >= n_words:
+            chunks.append("")
+            continue
+        
+        while word_idx < n_words:
+            word = target_words[word_idx]
+            w_len = len(word)
+            
+            if len(current_chunk_words) == 0:
+                current_chunk_words.append(word)
+                current_len += w_len
+                word_idx += 1
+            elif current_len + 1 + w_len <= ideal_len * 1.2 or glued[word_idx]:
+                current_chunk_words.append(word)
+                current_len += 1 + w_len
+                word_idx += 1
+            else:
+                break
+        
+        chunks.append(" ".join(current_chunk_words))
+        current_chunk_words = []
+        current_len = 0
+    
+    # Last content line gets the rest
+    if word_idx < n_words:
+        chunks.append(" ".join(target_words[word_idx:]))
+    else:
+        chunks.append("")
+    
+    # Map chunks back to line indices
+    line_to_chunk = {line_idx: chunk for line_idx, chunk in zip(non_empty_line_indices, chunks)}
+    
+    # Draw lines
+    y = page_size[1] - margin
+    for i, line_words in enumerate(lines):
+        # Check if we need new page
+        if y < margin:
+            c.showPage()
+            c.setFont(font_name, font_size)
+            y = page_size[1] - margin
+
+        if not line_words:
+            # Empty line, just spacing
+            y -= line_height
+            continue
+            
+        x = margin
+        line_str = " ".join(line_words)
+        
+        # Get corresponding secret chunk
+        chunk = line_to_chunk.get(i, "")
+        if not chunk:
+            chunk = " "
+        
+        # Escape special PDF characters
+        esc_chunk = chunk.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        
+        # Inject marked content with ActualText
+        c._code.append(f"/Span <</ActualText ({esc_chunk})>> BDC")
+        c.drawString(x, y, line_str)
+        c._code.append("EMC")
+        
+        y -= line_height
+    
+    c.save()
+    
+    if output_path is None:
+        output_buffer.seek(0)
+        return output_buffer.getvalue()
+    return True
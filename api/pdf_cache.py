@@ -0,0 +1,320 @@
+"""
+Bounded on-disk cache for generated assignment PDFs.
+
+Entries are keyed by a hash of the homework content they were rendered from,
+so regenerating mutations produces a new key and stale PDFs are never served.
+Writes go to a temp file that is atomically renamed into place, total size is
+capped with least-recently-used eviction, and the directory is validated on
+startup (rescan() re-reads it without deleting anything while other processes
+may be writing).
+
+PdfCache keeps the entries on this node's disk. BlobPdfCache offers the same
+interface on top of a blob store (blobstore.py) with its key index in MongoDB,
+so with PDF_CACHE_BACKEND=gridfs every API replica shares one cache. get() and
+put() return whatever send_file can stream: a path, or a chunked blob reader.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "pdf_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_MB", "512")) * 1024 * 1024
+PDF_CACHE_BACKEND = os.environ.get("PDF_CACHE_BACKEND", "local")  # local | gridfs
+
+# Key index of the shared (blob-backed) cache
+ENTRIES_COLLECTION = "pdf_cache_entries"
+INDEXES = [
+    IndexModel([("lastUsed", ASCENDING)]),
+    IndexModel([("blob", ASCENDING)]),
+]
+TOUCH_INTERVAL_SECONDS = 60
+
+PDF_SUFFIX = ".pdf"
+TMP_SUFFIX = ".tmp"
+# Temp files younger than this may still be written by a concurrent put() (another worker or process)
+TMP_MAX_AGE_SECONDS = int(os.environ.get("PDF_CACHE_TMP_MAX_AGE_SECONDS", "600"))
+_TRAILER_WINDOW = 1024
+
+
+def make_key(assignment_id: str, original_prompt: str, mutated_prompt: str, layout_version: str = "1") -> str:
+    """Cache key tied to the exact homework version a PDF is rendered from."""
+    digest = hashlib.sha256(
+        "\0".join([layout_version, original_prompt or "", mutated_prompt or ""]).encode("utf-8")
+    ).hexdigest()[:32]
+    return f"{assignment_id}-{digest}"
+
+
+def looks_like_pdf(path: str) -> bool:
+    """Cheap structural integrity check: PDF header and EOF trailer present."""
+    try:
+        size = os.path.getsize(path)
+        if size < 16:
+            return False
+        with open(path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(max(0, size - _TRAILER_WINDOW))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+class PdfCache:
+    """LRU-bounded directory of PDFs addressed by key."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, float]] = {}  # key -> (size, last_used)
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key + PDF_SUFFIX)
+
+    def validate(self) -> Dict[str, int]:
+        """
+        Drop abandoned temp files and corrupt PDFs, rebuild the index and enforce the size cap.
+        Temp files younger than TMP_MAX_AGE_SECONDS are left alone: a concurrent put() may own them.
+        """
+        removed = 0
+        entries = {}
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # renamed or removed by a concurrent writer
+            if not os.path.isfile(path):
+                continue
+            if name.endswith(TMP_SUFFIX) and now - stat.st_mtime < TMP_MAX_AGE_SECONDS:
+                continue
+            if not name.endswith(PDF_SUFFIX) or not looks_like_pdf(path):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                continue
+            entries[name[:-len(PDF_SUFFIX)]] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._entries = entries
+        evicted = self._evict()
+        return {"entries": len(entries) - evicted, "removed": removed, "evicted": evicted}
+
+    def rescan(self) -> Dict[str, int]:
+        """Re-read the index from disk (e.g. after batch workers wrote entries). Deletes nothing."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(PDF_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries[name[:-len(PDF_SUFFIX)]] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._entries = entries
+        return {"entries": len(entries)}
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of a cached PDF and mark it recently used, or None on a miss."""
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            return None
+        with self._lock:
+            self._entries[key] = (os.path.getsize(path), now)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Atomically write a PDF into the cache and evict older entries past the size cap."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._entries[key] = (len(data), time.time())
+        self._evict(keep=key)
+        return self.path_for(key)
+
+    def invalidate(self, prefix: str) -> int:
+        """
+        Remove every entry whose key starts with prefix (e.g. an assignment id).
+        The directory is scanned, not the in-memory index, so entries written by other workers go too.
+        """
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not (name.startswith(prefix) and name.endswith(PDF_SUFFIX)):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+            except FileNotFoundError:
+                pass  # removed by another worker meanwhile
+        with self._lock:
+            for k in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[k]
+        return removed
+
+    def trim(self) -> int:
+        """Enforce the size cap after entries were written by another process."""
+        return self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(size for size, _ in self._entries.values()),
+                "maxBytes": self.max_bytes
+            }
+
+    def _evict(self, keep: Optional[str] = None) -> int:
+        with self._lock:
+            total = sum(size for size, _ in self._entries.values())
+            if total <= self.max_bytes:
+                return 0
+            victims = []
+            for k, (size, _) in sorted(self._entries.items(), key=lambda kv: kv[1][1]):
+                if total <= self.max_bytes:
+                    break
+                if k == keep:
+                    continue
+                victims.append(k)
+                total -= size
+            for k in victims:
+                del self._entries[k]
+        for k in victims:
+            try:
+                os.remove(self.path_for(k))
+            except FileNotFoundError:
+                pass
+        return len(victims)
+
+
+class BlobPdfCache:
+    """PdfCache interface over a blob store; the key -> blob index lives in MongoDB."""
+
+    def __init__(self, store, entries_col, max_bytes: int):
+        self.store = store
+        self.entries = entries_col
+        self.max_bytes = max_bytes
+
+    def validate(self) -> Dict[str, int]:
+        """Drop entries whose blob is gone and enforce the size cap."""
+        removed = 0
+        for entry in self.entries.find({}, {"blob": 1}):
+            if not self.store.exists(entry["blob"]):
+                self.entries.delete_one({"_id": entry["_id"]})
+                removed += 1
+        evicted = self._evict()
+        return {"entries": self.entries.count_documents({}), "removed": removed, "evicted": evicted}
+
+    def rescan(self) -> Dict[str, int]:
+        """The index lives in MongoDB, so there is nothing to re-read; deletes nothing."""
+        return {"entries": self.entries.count_documents({})}
+
+    def get(self, key: str):
+        """Return a chunked reader for a cached PDF and mark it recently used, or None on a miss."""
+        entry = self.entries.find_one({"_id": key})
+        if not entry:
+            return None
+        stream = self.store.open(entry["blob"])
+        if stream is None:
+            self.entries.delete_one({"_id": key})
+            return None
+        now = datetime.now(UTC)
+        last_used = entry.get("lastUsed")
+        if last_used is not None and last_used.tzinfo is None:
+            last_used = last_used.replace(tzinfo=UTC)
+        if last_used is None or now - last_used > timedelta(seconds=TOUCH_INTERVAL_SECONDS):
+            self.entries.update_one({"_id": key}, {"$set": {"lastUsed": now}})
+        return stream
+
+    def put(self, key: str, data: bytes):
+        """Store a PDF (deduplicated by content) under key and evict older entries past the size cap."""
+        blob = self.store.put(data, content_type="application/pdf", metadata={"key": key})
+        previous = self.entries.find_one_and_update(
+            {"_id": key},
+            {"$set": {"blob": blob["id"], "size": blob["size"], "lastUsed": datetime.now(UTC)}},
+            upsert=True
+        )
+        if previous and previous.get("blob") != blob["id"]:
+            self._delete_unreferenced([previous["blob"]])
+        self._evict(keep=key)
+        return self.store.open(blob["id"])
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove every entry whose key starts with prefix (e.g. an assignment id)."""
+        query = {"_id": {"$regex": "^" + re.escape(prefix)}}
+        blobs = [entry["blob"] for entry in self.entries.find(query, {"blob": 1})]
+        removed = self.entries.delete_many(query).deleted_count
+        self._delete_unreferenced(blobs)
+        return removed
+
+    def trim(self) -> int:
+        return self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        totals = list(self.entries.aggregate([
+            {"$group": {"_id": None, "entries": {"$sum": 1}, "bytes": {"$sum": "$size"}}}
+        ]))
+        totals = totals[0] if totals else {"entries": 0, "bytes": 0}
+        return {"entries": totals["entries"], "bytes": totals["bytes"], "maxBytes": self.max_bytes}
+
+    def _delete_unreferenced(self, blobs):
+        for blob_id in set(blobs):
+            if not self.entries.find_one({"blob": blob_id}, {"_id": 1}):
+                self.store.delete(blob_id)
+
+    def _evict(self, keep: Optional[str] = None) -> int:
+        if self.max_bytes == float("inf"):
+            return 0  # batch workers leave the cap to the parent process
+        total = self.stats()["bytes"]
+        if total <= self.max_bytes:
+            return 0
+        victims = []
+        for entry in self.entries.find({}, {"size": 1, "blob": 1}).sort("lastUsed", ASCENDING):
+            if total <= self.max_bytes:
+                break
+            if entry["_id"] == keep:
+                continue
+            victims.append(entry)
+            total -= entry.get("size", 0)
+        if victims:
+            self.entries.delete_many({"_id": {"$in": [v["_id"] for v in victims]}})
+            self._delete_unreferenced([v["blob"] for v in victims])
+        return len(victims)
+
+
+def open_pdf_cache(max_bytes: int = DEFAULT_MAX_BYTES, db=None, backend: str = None):
+    """The PDF cache for this deployment: a local directory, or shared through GridFS."""
+    backend = backend or PDF_CACHE_BACKEND
+    if backend == "local":
+        return PdfCache(DEFAULT_DIR, max_bytes=max_bytes)
+    from blobstore import open_blob_store
+    if db is None:
+        from database import get_db
+        db = get_db()
+    return BlobPdfCache(open_blob_store("pdf_cache", db=db, backend=backend), db[ENTRIES_COLLECTION], max_bytes)
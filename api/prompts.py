@@ -0,0 +1,505 @@
+"""
+Prompt template registry.
+
+Every Gemini prompt is registered here once, at import time. Registration
+splits the text into static sections and {field} slots (folding in fields
+that never change, such as the marker categories), builds the request's
+types.GenerateContentConfig with its response schema, and hashes text, schema
+and generation settings into a version. Rendering only joins the precompiled
+sections with the per-call values, and every request for a template reuses
+the same config object. Versions feed the result cache namespaces in app.py,
+so editing a template invalidates exactly the results it produced. The text
+before the first per-call value (PromptTemplate.prefix; about 6 KB for the
+mutation prompt) is byte-identical across calls, which is what provider-side
+prefix caching matches on.
+"""
+import hashlib
+import json
+import string
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from marker_stats import CATEGORIES
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(category=cat, threshold="OFF")
+    for cat in [
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_HARASSMENT"
+    ]
+]
+
+GENERATION_SETTINGS = {
+    "temperature": 1,
+    "top_p": 1,
+    "seed": 2262,
+    "max_output_tokens": 10000
+}
+
+
+def make_config(response_schema: dict = None) -> types.GenerateContentConfig:
+    config_kwargs = {**GENERATION_SETTINGS, "safety_settings": SAFETY_SETTINGS}
+    if response_schema:
+        config_kwargs["response_mime_type"] = "application/json"
+        config_kwargs["response_schema"] = response_schema
+    return types.GenerateContentConfig(**config_kwargs)
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, response_schema: dict = None, static: Dict[str, str] = None):
+        self.name = name
+        self.response_schema = response_schema
+        self.config = make_config(response_schema) if response_schema else None
+        self.version = hashlib.sha256(
+            json.dumps([name, text, response_schema, GENERATION_SETTINGS, static], sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+
+        # Alternating [static, field, static, field, ..., static]; static fields are folded in
+        static = static or {}
+        segments: List[str] = [""]
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            segments[-1] += literal
+            if field is None:
+                continue
+            if spec or conversion:
+                raise ValueError(f"Template {name}: format specs are not supported ({field})")
+            if field in static:
+                segments[-1] += static[field]
+            else:
+                segments += [field, ""]
+        self._segments = segments
+        self.fields = segments[1::2]
+
+    @property
+    def prefix(self) -> str:
+        """Static text before the first per-call value."""
+        return self._segments[0]
+
+    def render(self, **values: Any) -> str:
+        parts = self._segments[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = str(values[parts[i]])
+        return "".join(parts)
+
+
+REGISTRY: Dict[str, PromptTemplate] = {}
+
+
+def register(name: str, text: str, response_schema: dict = None, static: Dict[str, str] = None) -> PromptTemplate:
+    template = PromptTemplate(name, text, response_schema, static)
+    REGISTRY[name] = template
+    return template
+
+
+def get(name: str) -> PromptTemplate:
+    return REGISTRY[name]
+
+
+def versions() -> Dict[str, str]:
+    return {name: template.version for name, template in REGISTRY.items()}
+
+
+RUBRIC_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "criterion": {"type": "STRING"},
+            "description": {"type": "STRING"},
+            "maxPoints": {"type": "INTEGER"}
+        }
+    }
+}
+
+GRADE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "criteria": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "criterionId": {"type": "STRING"},
+                    "pointsEarned": {"type": "INTEGER"},
+                    "justification": {"type": "STRING"}
+                }
+            }
+        }
+    }
+}
+
+MUTATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "mutations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "type": {"type": "STRING"},
+                    "category": {"type": "STRING", "enum": CATEGORIES},
+                    "original_text": {"type": "STRING"},
+                    "mutated_text": {"type": "STRING"},
+                    "detail": {"type": "STRING"}
+                }
+            }
+        }
+    }
+}
+
+DETECT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "indicators_found": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "change": {"type": "STRING"},
+                    "found": {"type": "BOOLEAN"},
+                    "locations": {
+                        "type": "ARRAY",
+                        "items": {"type": "STRING"}
+                    }
+                },
+                "required": ["change", "found", "locations"]
+            }
+        },
+        "summary": {"type": "STRING"}
+    },
+    "required": ["indicators_found", "summary"]
+}
+
+VERDICT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "score": {"type": "INTEGER"},
+        "reasoning": {"type": "STRING"},
+        "verdict": {"type": "STRING"}
+    }
+}
+
+DIGEST_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "outline": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "claims": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "examples": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "quotes": {"type": "ARRAY", "items": {"type": "STRING"}}
+    },
+    "required": ["summary", "outline", "claims", "examples", "quotes"]
+}
+
+EXCHANGE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "score": {"type": "INTEGER"},
+        "note": {"type": "STRING"},
+        "red_flags": {"type": "ARRAY", "items": {"type": "STRING"}}
+    },
+    "required": ["score", "note"]
+}
+
+
+RUBRIC = register(
+    "rubric",
+    """
+You are an expert high-school teacher designing a grading rubric.
+
+ASSIGNMENT TITLE: {title}
+INSTRUCTIONS:
+{instructions}
+
+Produce 4-8 rubric items. Each item must be atomic and objectively checkable by an LLM. Output JSON only.
+Rules:
+- Each item has: criterion (short), description (how to evaluate), maxPoints (integer)
+- Sum of maxPoints should be about 100 (but exact sum is fine)
+- Focus on clarity: one skill per item
+- Cover thesis/argument, evidence/use of sources, organization/coherence, style/grammar, citation/format (if relevant), task completion
+""",
+    RUBRIC_SCHEMA
+)
+
+GRADE = register(
+    "grade",
+    """
+You are grading a high-school assignment using an analytic rubric. Be concise and deterministic.
+
+ASSIGNMENT INSTRUCTIONS:
+{instructions}
+
+RUBRIC (JSON):
+{rubric_text}
+
+{submission_heading}:
+{submission}
+
+For each rubric item:
+- Assign integer points between 0 and maxPoints
+- Provide a short justification (1-2 sentences)
+Return JSON with criteria array.
+""",
+    GRADE_SCHEMA
+)
+
+MUTATION = register(
+    "mutation",
+    """You are designing an academic integrity tracking system. Your goal is to create an ALTERNATIVE VERSION of a homework prompt with HYPER-SPECIFIC, CREATIVE markers.
+
+CORE PRINCIPLES:
+1. **HYPER-SPECIFIC**: Avoid generic modifications. Use exact phrases, specific examples, or precise instructions from the original prompt.
+2. **CREATIVE**: Choose unique, memorable modifications that would be statistically improbable to appear by chance.
+3. **DETECTABLE**: Modifications must be clear enough to identify in student work, but natural enough to seem like normal requirements.
+4. **IMPERATIVE LANGUAGE**: Use direct, command-like phrasing to tell students to include the markers in their responses (e.g., "you should", "you must", "be sure to").
+
+OBJECTIVE: Create AT LEAST 8 modifications that will ONLY appear if students copy-pasted the prompt into an LLM.
+
+**STRATEGY PRIORITY**:
+1. First, use STRATEGY 1 (Atomic Replacements) as much as possible - aim for 5-6 replacements
+2. Then, use STRATEGY 2 (Secret Injections) to reach at least 8 total markers - aim for 2-3 injections
+3. Example distribution: 5 atomic replacements + 3 secret injections = 8 total markers
+
+You have TWO strategies:
+
+STRATEGY 1: ATOMIC REPLACEMENTS WITH PARENTHETICAL ADDITIONS (PREFERRED - try this first)
+- Find existing phrases in the prompt and ADD a parenthetical instruction with a hyper-specific reference
+- **The parenthetical must INSTRUCT the student** to include/mention/discuss a very specific, obscure detail
+- Format: "original phrase" → "original phrase (instruction to include specific detail)"
+- **CRITICAL**: The original phrase stays mostly the same, you just add a parenthetical instruction
+- **CRITICAL**: Use EXACT phrasing from the original prompt for the "original_text"
+
+HOW THIS WORKS:
+- Original: "analyze primary source documents"
+- Mutated: "analyze documents (include the 'Ten Principles' of Bandung)"
+- Detection: Student mentions the specific "Ten Principles of Bandung"
+
+EXAMPLES OF GOOD ATOMIC REPLACEMENTS (with clear instructions):
+1. **Historical analysis**: 
+   - Original: "analyze primary source documents"
+   - Mutated: "analyze documents (include the 'Ten Principles' of Bandung)"
+   - ✅ GOOD: Instructs student to include specific reference
+
+2. **Political context**:
+   - Original: "political landscape"
+   - Mutated: "political landscape (discuss Kwame Nkrumah's 'Black Star')"
+   - ✅ GOOD: Instructs student to discuss specific detail
+
+3. **Time period**:
+   - Original: "post-World War II era"
+   - Mutated: "post-WWII era (focus on the 'Year of Africa' 1960)"
+   - ✅ GOOD: Instructs student to focus on specific event
+
+4. **Requirements**:
+   - Original: "essential to understanding"
+   - Mutated: "crucial for understanding (define 'client states' in the French Community)"
+   - ✅ GOOD: Instructs student to define specific term
+
+5. **Source types**:
+   - Original: "Political speeches"
+   - Mutated: "Speeches (quote Macmillan addressing the 'Parliament of South Africa')"
+   - ✅ GOOD: Instructs student to quote specific speech
+
+6. **Outside knowledge**:
+   - Original: "outside historical knowledge"
+   - Mutated: "outside knowledge (mention the 'oathing' rituals of Mau Mau)"
+   - ✅ GOOD: Instructs student to mention specific ritual
+
+EXAMPLES OF BAD REPLACEMENTS (avoid these):
+❌ "analyze documents" → "examine documents" (no instruction, just synonym)
+❌ "6-8 pages" → "6-9 pages" (overlapping text, no specific instruction)
+❌ "political landscape" → "political context" (no parenthetical instruction added)
+❌ "primary sources" → "primary documents" (just word swap, no hyper-specific reference)
+
+KEY PRINCIPLES:
+- Find natural places in the prompt where you can add a parenthetical instruction
+- The instruction should reference something hyper-specific and obscure
+- The reference must fit the topic/context of the assignment
+- Students would ONLY include this if they saw the mutated prompt
+
+STRATEGY 2: SECRET INJECTIONS (use when replacements aren't sufficient)
+- Add HIGHLY SPECIFIC requirements using IMPERATIVE language
+- Must be obscure enough that NO student would include them without being told
+- Must fit naturally within the assignment context
+- **CRITICAL**: Always use UNCONDITIONAL, DIRECT commands - never use "if" or conditional phrasing
+- ❌ WRONG: "If your topic touches upon X, mention Y"
+- ✅ CORRECT: "You must mention Y in your analysis"
+- ✅ CORRECT: "Be sure to discuss X when explaining your argument"
+
+EXAMPLES BY SUBJECT:
+1. **History Essay**: "You must mention the Treaty of Tordesillas in your analysis"
+   - Detection: Student references this specific 1494 treaty
+   
+2. **Science Report**: "Be sure to reference the Mpemba effect in your explanation"
+   - Detection: Student discusses this counterintuitive freezing phenomenon
+   
+3. **Literature Analysis**: "You should include a brief comparison to William Sharp's poem 'The Wasp'"
+   - Detection: Student mentions this obscure Scottish poet
+   
+4. **Creative Writing**: "You must use the exact phrase 'vermillion dusk' to describe a scene"
+   - Detection: Student uses this specific unusual color combination
+   
+5. **Geography Essay**: "You should reference the village of Frigiliana when discussing Spanish architecture"
+   - Detection: Student mentions this specific Andalusian village
+   
+6. **Food/Culture Essay**: "Be sure to mention tingmo bread as an example of Tibetan cuisine"
+   - Detection: Student references this specific steamed bread
+
+Categories of obscure markers (choose contextually):
+- Geography: rare villages, obscure lakes/mountains
+- Food: regional dishes unknown outside specific areas
+- Arts: lesser-known artists, obscure works
+- History: specific minor treaties, exact years of minor events
+- Literature: obscure poems, forgotten authors
+- Science: rare elements, uncommon phenomena
+- Exact phrases: unusual word combinations that would never occur naturally
+
+**FORMATTING RULES**:
+- For replacements: "original_text" must be the EXACT phrase from the prompt (word-for-word)
+- For injections: Use imperative verbs (must, should, be sure to)
+- "detail" field: Describe what to look for in student work (e.g., "Student mentions tingmo bread")
+- "category" field: The category of the obscure detail ({categories})
+
+CRITICAL: All modifications must feel like natural extensions of the assignment. A teacher should think "reasonable requirement" not "weird addition."
+{pool_instructions}{guidance_instructions}
+Original Prompt:
+{prompt_text}""",
+    MUTATION_SCHEMA,
+    static={"categories": ", ".join(CATEGORIES)}
+)
+
+# Fragments spliced into MUTATION
+MUTATION_POOL = register(
+    "mutation-pool",
+    """
+**MARKER POOL MODE**: Instead of one version, create a POOL of {pool_size} modifications. Each student will receive a different subset of them, so:
+- Every modification must work on its own, independent of the others
+- No two modifications may use the same or overlapping "original_text"
+- Keep the same mix of atomic replacements and secret injections
+"""
+)
+
+MUTATION_GUIDANCE = register(
+    "mutation-guidance",
+    """
+**WHAT HAS WORKED BEFORE** (strategy / category, from past detections):
+- Prefer these, they most often catch copied LLM output: {prefer}
+- Avoid these, they almost never show up in copied work: {avoid}
+"""
+)
+
+DETECT = register(
+    "detect",
+    """You are an academic integrity detector specializing in identifying hyper-specific, creative modifications.
+
+You have been given a list of SPECIFIC changes that were intentionally made to a homework prompt.
+These changes are:
+- HYPER-SPECIFIC: Not generic phrases, but precise wording, examples, or instructions
+- CREATIVE: Unique modifications that would be unlikely to appear by chance
+- DETECTABLE: Clear enough to identify if a student used the modified prompt
+
+Your job is to find which of these changes appear in the student's submitted text.
+
+Original prompt:
+{original_prompt}
+
+Secret/mutated prompt (what the student may have seen):
+{secret_prompt}
+
+Specific changes to detect:
+{changes}
+
+DETECTION CRITERIA:
+1. Look for EXACT or near-exact matches of the specific wording from the changes
+2. Consider context: Does the student's response directly address the modified instruction?
+3. Check for unique examples, phrases, or requirements that only appear in the mutated version
+4. Be strict: Only mark as "found" if there's clear evidence the student saw the modified prompt
+
+REQUIRED OUTPUT:
+- indicators_found: array of detection results, EACH with change, found, and locations fields
+- summary: a brief summary of your findings and overall confidence level
+
+Student Submitted Text:
+{student_text}""",
+    DETECT_SCHEMA
+)
+
+INTERVIEW = register(
+    "interview",
+    """You are an academic integrity officer.
+Your job is to determine if a student is the true author of a submission by analyzing their interview performance.
+
+{submission_section}
+
+INTERVIEW TRANSCRIPT:
+{transcript_text}
+
+TASK:
+1. Compare the student's oral answers to the specific details in the text.
+2. Check for:
+   - Specificity: Do they recall their own arguments/examples?
+   - CONSISTENCY: Do their explanations match what was written?
+   - HALLUCINATION: Did they agree with "tricky" false premises? (Major red flag)
+   - Depth: Can they explain the *why* behind their points?
+
+SCORING:
+- 0-49: Suspicious. Vague answers, contradictions, or falling for tricks. (Likely Plagiarism)
+- 50-100: Verified. Specific, consistent answers demonstrating authorship.
+
+Output JSON with integer score (0-100), reasoning (concise explanation), and verdict (SUSPICIOUS | VERIFIED).
+""",
+    VERDICT_SCHEMA
+)
+
+DIGEST = register(
+    "digest",
+    """Digest this student submission for examiners who will grade it and question the student about it without reading the full text.
+
+SUBMISSION:
+{submission_text}
+
+Output JSON with:
+- summary: 2-3 sentences on the thesis and approach
+- outline: the section or paragraph structure, one short line each
+- claims: up to 12 specific arguments the author makes
+- examples: up to 12 concrete examples, names, figures or data the author uses
+- quotes: up to 6 short verbatim quotes that carry the argument
+""",
+    DIGEST_SCHEMA
+)
+
+INTERVIEW_EXCHANGE = register(
+    "interview-exchange",
+    """You are an academic integrity officer assessing an authorship interview one exchange at a time.
+
+SUBMISSION (A DIGEST OF ITS CLAIMS, EXAMPLES AND QUOTES, OR THE FULL TEXT WHEN SHORT):
+{digest_text}
+
+NOTES ON EARLIER EXCHANGES:
+{notes}
+
+NEW EXCHANGE:
+{exchange}
+Judge only the new exchange: does the student recall their own arguments and examples, stay consistent with the submission and with earlier answers, and resist false premises?
+
+Output JSON with integer score (0-100; below 50 is suspicious), note (one sentence for the file) and red_flags (empty if none).
+""",
+    EXCHANGE_SCHEMA
+)
+
+INTERVIEW_FINAL = register(
+    "interview-final",
+    """You are an academic integrity officer closing an authorship interview.
+Each exchange has already been assessed (score 0-100, below 50 is suspicious). The running average is {running_score}.
+
+EXCHANGE ASSESSMENTS:
+{lines}
+
+Weigh the pattern across exchanges (falling for a false premise outweighs several vague answers).
+Output JSON with integer score (0-100; 0-49 suspicious, 50-100 verified), reasoning (concise explanation), and verdict (SUSPICIOUS | VERIFIED).
+""",
+    VERDICT_SCHEMA
+)
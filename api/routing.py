@@ -0,0 +1,72 @@
+"""
+Adaptive model routing for the high-volume Gemini calls.
+
+Marker detection, rubric grading and interview analysis are first sent to
+GEMINI_FAST_MODEL. gemini.call_routed (and gemini.stream_events for the
+streamed interview analysis) checks every answer before accepting it: one
+that fails its schema check (malformed JSON, missing markers or criteria,
+points out of range) or comes back low confidence (a marker rate or interview
+score within ROUTING_BORDERLINE_MARGIN of the flagging line, a verdict that
+contradicts its score) is asked again of the full model (gemini.model), whose
+answer is final. Each decision is logged as a [ROUTER]
+line and counted per task; per-model latency lives in llm_usage. Setting
+GEMINI_ROUTED_TASKS to an empty string sends every call to the full model.
+"""
+import os
+import threading
+from typing import Any, Dict, List
+
+FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+ROUTED_TASKS = {t.strip() for t in os.environ.get("GEMINI_ROUTED_TASKS", "detect,grade,interview").split(",") if t.strip()}
+
+# Distance from the flagging line (as a fraction of the scale) that counts as borderline
+BORDERLINE_MARGIN = float(os.environ.get("ROUTING_BORDERLINE_MARGIN", "0.1"))
+# Marker rate above which a submission is flagged (mirrors app.PLAGIARISM_THRESHOLD)
+PLAGIARISM_THRESHOLD = float(os.environ.get("PLAGIARISM_THRESHOLD", "0.5"))
+# Interview scores below this are SUSPICIOUS (see prompts.INTERVIEW)
+INTERVIEW_PASS_SCORE = 50
+
+_tasks: Dict[str, Dict[str, Any]] = {}
+_tasks_lock = threading.Lock()
+
+
+def models_for(task: str, full_model: str) -> List[str]:
+    """Models to try in order for a task; the last one's answer is always accepted."""
+    if task in ROUTED_TASKS and FAST_MODEL and FAST_MODEL != full_model:
+        return [FAST_MODEL, full_model]
+    return [full_model]
+
+
+def chain(task: str, full_model: str) -> str:
+    """Routing for a task as a string (e.g. for result cache versions)."""
+    return ">".join(models_for(task, full_model))
+
+
+def is_borderline(value: float, line: float, scale: float = 1.0) -> bool:
+    return abs(value - line) <= BORDERLINE_MARGIN * scale
+
+
+def record(task: str, model: str, reasons: List[str]):
+    """Count the model that answered a task and why earlier models were passed over."""
+    with _tasks_lock:
+        stats = _tasks.setdefault(task, {"calls": 0, "escalated": 0, "answeredBy": {}, "reasons": {}})
+        stats["calls"] += 1
+        stats["answeredBy"][model] = stats["answeredBy"].get(model, 0) + 1
+        if reasons:
+            stats["escalated"] += 1
+        for reason in reasons:
+            kind = reason.split(":", 1)[0]
+            stats["reasons"][kind] = stats["reasons"].get(kind, 0) + 1
+
+
+def task_stats() -> Dict[str, Dict[str, Any]]:
+    with _tasks_lock:
+        return {
+            task: {
+                **stats,
+                "answeredBy": dict(stats["answeredBy"]),
+                "reasons": dict(stats["reasons"]),
+                "escalationRate": round(stats["escalated"] / stats["calls"], 3)
+            }
+            for task, stats in _tasks.items()
+        }
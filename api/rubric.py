@@ -0,0 +1,202 @@
+"""
+Compiled rubrics and class-wide criterion statistics.
+
+A rubric is compiled once per version (when it is saved) and stored on the
+assignment as `rubricCompiled`: a content hash, the criterion ids in order,
+their max points and, for criteria rubric_rules can check without the LLM
+(length, citations, sections), a rule spec. Grading reuses the hash as its
+cache key and assembles the per-criterion scores in a single pass with
+clamping, instead of re-hashing the rubric and scanning Gemini's results once
+per criterion.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime, UTC
+from typing import Any, Dict, List
+
+import rubric_rules
+
+COMPILED_VERSION = 3
+
+_MAX_LOADED = 512
+_loaded: Dict[str, "CompiledRubric"] = {}
+_loaded_lock = threading.Lock()
+
+
+def criterion_id(item: Dict[str, Any]) -> str:
+    return item.get("id") or item.get("criterion")
+
+
+def _int_points(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def compile_rubric(rubric: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Serializable compiled form, stored on the assignment next to the rubric."""
+    return {
+        "version": COMPILED_VERSION,
+        "hash": hashlib.sha256(json.dumps(rubric, sort_keys=True).encode("utf-8")).hexdigest(),
+        "ids": [criterion_id(item) for item in rubric],
+        "criteria": [item.get("criterion") for item in rubric],
+        "maxPoints": [_int_points(item.get("maxPoints", 0)) for item in rubric],
+        "totalPoints": sum(_int_points(item.get("maxPoints", 0)) for item in rubric),
+        "rules": [rubric_rules.classify(item) for item in rubric]
+    }
+
+
+class CompiledRubric:
+    """In-memory view of a compiled rubric with an id -> position index."""
+
+    def __init__(self, rubric: List[Dict[str, Any]], data: Dict[str, Any]):
+        self.rubric = rubric
+        self.hash = data["hash"]
+        self.ids = data["ids"]
+        self.criteria = data["criteria"]
+        self.max_points = data["maxPoints"]
+        self.total_points = data["totalPoints"]
+        self.rules = data.get("rules") or [None] * len(self.ids)
+        # Criteria the LLM still has to grade
+        self.llm_rubric = [item for item, rule in zip(rubric, self.rules) if rule is None]
+        self.index = {}
+        for i, cid in enumerate(self.ids):
+            self.index.setdefault(cid, i)
+
+    def apply_rules(self, text: str) -> List[Dict[str, Any]]:
+        """Per-criterion results for the rule-scored criteria, in the shape Gemini returns."""
+        results = []
+        for i, rule in enumerate(self.rules):
+            if rule is None:
+                continue
+            points, justification = rubric_rules.apply(rule, text, self.max_points[i])
+            results.append({"criterionId": self.ids[i], "pointsEarned": points, "justification": justification,
+                            "scoredBy": "rule"})
+        return results
+
+    def score(self, criteria_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Assemble a grade from Gemini's per-criterion results, clamping points to [0, maxPoints].
+        Criteria without a result are marked: the grade gets incomplete=True and missingCriteria.
+        """
+        earned = [0] * len(self.ids)
+        justifications = [""] * len(self.ids)
+        seen = [False] * len(self.ids)
+        scored_by = [None] * len(self.ids)
+        for result in criteria_results:
+            i = self.index.get(result.get("criterionId"))
+            if i is None or seen[i]:
+                continue
+            seen[i] = True
+            earned[i] = min(max(_int_points(result.get("pointsEarned", 0)), 0), self.max_points[i])
+            justifications[i] = result.get("justification", "")
+            scored_by[i] = result.get("scoredBy")
+
+        missing = [self.ids[i] for i in range(len(self.ids)) if not seen[i]]
+        grade = {
+            "totalScore": sum(earned),
+            "maxScore": self.total_points,
+            "gradedAt": datetime.now(UTC).isoformat(),
+            "criteria": [
+                {
+                    "criterionId": self.ids[i],
+                    "criterion": self.criteria[i],
+                    "maxPoints": self.max_points[i],
+                    "pointsEarned": earned[i],
+                    "justification": justifications[i] if seen[i] else "Not graded (incomplete response).",
+                    **({"scoredBy": scored_by[i]} if scored_by[i] else {})
+                }
+                for i in range(len(self.ids))
+            ]
+        }
+        if missing:
+            # e.g. a truncated Gemini response recovered item by item; never pass 0 off as a score
+            grade["incomplete"] = True
+            grade["missingCriteria"] = missing
+        return grade
+
+
+def load_rubric(assignment: Dict[str, Any]) -> CompiledRubric:
+    """
+    Return the compiled rubric for an assignment, memoized per process by hash.
+    Assignments saved before compilation existed are compiled on the fly.
+    """
+    rubric = assignment.get("rubric", [])
+    data = assignment.get("rubricCompiled")
+    if not data or data.get("version") != COMPILED_VERSION or len(data.get("ids", [])) != len(rubric):
+        data = compile_rubric(rubric)
+
+    compiled = _loaded.get(data["hash"])
+    if compiled is None:
+        compiled = CompiledRubric(rubric, data)
+        with _loaded_lock:
+            if len(_loaded) >= _MAX_LOADED:
+                _loaded.clear()
+            _loaded[data["hash"]] = compiled
+    return compiled
+
+
+def criterion_stats_stages(field: str = "autoGrade") -> List[Dict[str, Any]]:
+    """
+    Aggregation stages computing per-criterion statistics over `<field>.criteria`
+    (autoGrade or manualGrade): count, sum, sum of squares, min, max and the
+    distribution of awarded points. Summarize the rows with summarize_criteria.
+    """
+    return [
+        {"$match": {f"{field}.criteria": {"$exists": True}}},
+        {"$unwind": f"${field}.criteria"},
+        {"$group": {
+            "_id": {"criterionId": f"${field}.criteria.criterionId", "points": f"${field}.criteria.pointsEarned"},
+            "n": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": "$_id.criterionId",
+            "count": {"$sum": "$n"},
+            "total": {"$sum": {"$multiply": ["$_id.points", "$n"]}},
+            "totalSquares": {"$sum": {"$multiply": ["$_id.points", "$_id.points", "$n"]}},
+            "min": {"$min": "$_id.points"},
+            "max": {"$max": "$_id.points"},
+            "distribution": {"$push": {"points": "$_id.points", "count": "$n"}}
+        }}
+    ]
+
+
+def criterion_stats_pipeline(assignment_id, field: str = "autoGrade") -> List[Dict[str, Any]]:
+    return [{"$match": {"assignmentId": assignment_id}}] + criterion_stats_stages(field)
+
+
+def summarize_criteria(compiled: CompiledRubric, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn criterion_stats_stages rows into per-criterion stats, ordered by the rubric."""
+    rows = {row["_id"]: row for row in rows}
+    stats = []
+    for i, cid in enumerate(compiled.ids):
+        row = rows.get(cid)
+        count = row["count"] if row else 0
+        mean = row["total"] / count if count else 0.0
+        variance = max(row["totalSquares"] / count - mean * mean, 0.0) if count else 0.0
+        max_points = compiled.max_points[i]
+        stats.append({
+            "criterionId": cid,
+            "criterion": compiled.criteria[i],
+            "maxPoints": max_points,
+            "count": count,
+            "mean": round(mean, 2),
+            "meanPercent": round(100 * mean / max_points, 1) if max_points and count else 0.0,
+            "stdDev": round(variance ** 0.5, 2),
+            "min": row["min"] if row else None,
+            "max": row["max"] if row else None,
+            "distribution": sorted(
+                ({"points": d["points"], "count": d["count"]} for d in (row["distribution"] if row else [])),
+                key=lambda d: d["points"]
+            )
+        })
+    return stats
+
+
+def criterion_stats(submissions_col, assignment: Dict[str, Any], field: str = "autoGrade") -> List[Dict[str, Any]]:
+    """Per-criterion class statistics for an assignment's auto (or manual) grades."""
+    compiled = load_rubric(assignment)
+    rows = list(submissions_col.aggregate(criterion_stats_pipeline(assignment["_id"], field)))
+    return summarize_criteria(compiled, rows)
@@ -0,0 +1,181 @@
+"""
+Deterministic scoring for objective rubric criteria.
+
+When a rubric is compiled, each criterion is classified: one whose name asks
+for a length, a number of sources/citations or named sections, and whose text
+states the requirement ("500-800 words", "at least 3 sources", "Introduction,
+Methods, Results and Conclusion sections"), gets a rule spec stored with the
+compiled rubric. Those criteria are scored here from the full submission text
+with precompiled patterns, without a Gemini call. Everything else is left to
+the LLM: criteria whose requirement cannot be read off their text, and
+criteria that ask for more than the rule checks, i.e. a name joining several
+aspects ("Length and Organization") or a judgment word anywhere in the name or
+description ("correctly formatted", "logically organized").
+
+Rule specs (JSON-serializable, stored in rubricCompiled.rules):
+
+    {"kind": "word_count", "min": 500, "max": 800}      # either bound (not both) may be None
+    {"kind": "citations", "min": 3}
+    {"kind": "sections", "sections": ["introduction", "conclusion"]}
+
+Points are proportional to how much of the requirement is met.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+_NUMBER = r"(\d[\d,]*|one|two|three|four|five|six|seven|eight|nine|ten)"
+
+# Criterion names that make a criterion a candidate for each rule
+_LENGTH_NAME = re.compile(r"\b(length|word count|word limit|words)\b", re.I)
+_CITATION_NAME = re.compile(r"\b(citations?|cited|references|bibliography|works cited)\b", re.I)
+_SECTION_NAME = re.compile(r"\b(sections?|headings?|required parts)\b", re.I)
+# Words that ask for a judgment the rules cannot make ("Quality of evidence", "correctly formatted")
+_SUBJECTIVE = re.compile(
+    r"\b(quality|evidence|use of|integrat\w*|analy\w*|effective\w*|format\w*|style|relevan\w*|organi[sz]\w*|"
+    r"coheren\w*|transitions?|logical\w*|clear\w*|clarity|correct\w*|accura\w*|appropriate\w*|credib\w*|"
+    r"persuasive\w*|thorough\w*|MLA|APA|Chicago)\b",
+    re.I
+)
+# A name that joins several aspects ("Length and Organization", "Citations & Format", "Citation/Format")
+_COMPOUND_NAME = re.compile(r"\band\b|&|,|/|\+", re.I)
+
+_WORD_RANGE = re.compile(_NUMBER + r"\s*(?:-|–|—|to)\s*" + _NUMBER + r"\s*words\b", re.I)
+_WORD_MIN = re.compile(r"(at least|minimum(?: of)?|min\.?|no (?:less|fewer) than|(?<!no )more than)\s*" + _NUMBER + r"\s*words\b", re.I)
+_WORD_MAX = re.compile(r"(at most|maximum(?: of)?|max\.?|no more than|not exceed(?:ing)?|under|(?<!no )(?:fewer|less) than|up to)\s*" + _NUMBER + r"\s*words\b", re.I)
+# Qualifiers that exclude the number itself ("more than 300 words" starts at 301)
+_EXCLUSIVE = re.compile(r"more than|fewer than|less than|under", re.I)
+_SOURCE_COUNT = re.compile(
+    r"(?:(?:at least|minimum(?: of)?|min\.?)\s*)?\b" + _NUMBER + r"\s+(?:\w+\s+){0,2}?(?:sources|citations|references|works)\b", re.I
+)
+
+SECTION_NAMES = [
+    "abstract", "introduction", "background", "hypothesis", "materials", "methods", "methodology", "procedure",
+    "results", "analysis", "discussion", "conclusion", "summary", "references", "works cited", "bibliography"
+]
+_SECTION_MENTION = re.compile(r"\b(" + "|".join(re.escape(name) for name in SECTION_NAMES) + r")\b", re.I)
+
+_WORD = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+# Parenthetical author-date / author-page citations: (Smith, 2020), (Smith and Lee 2019, p. 4), (Smith 45)
+_PAREN_CITATION = re.compile(
+    r"\(\s*(?:[A-Z][\w'’-]+(?:\s+(?:and|&)\s+[A-Z][\w'’-]+|\s+et al\.?)?,?\s+(?:\d{4}[a-z]?|n\.d\.)(?:,\s*(?:p{1,2}\.\s*)?\d+(?:[-–]\d+)?)?"
+    r"|[A-Z][\w'’-]+\s+\d+(?:[-–]\d+)?)\s*\)"
+)
+_NUMERIC_CITATION = re.compile(r"\[(\d+)(?:[,–-]\s*\d+)*\]")
+_URL = re.compile(r"https?://[^\s)\]]+", re.I)
+_REFERENCE_HEADING = re.compile(r"^\s*(?:references|works cited|bibliography|sources)\s*:?\s*$", re.I | re.M)
+_HEADING_PREFIX = r"^[ \t]*(?:#{1,6}[ \t]*|\d+(?:\.\d+)*[.)]?[ \t]+|[IVX]+\.[ \t]+)?"
+
+
+def _number(text: str) -> int:
+    text = text.lower().replace(",", "")
+    return _NUMBER_WORDS[text] if text in _NUMBER_WORDS else int(text)
+
+
+def _bound(match: Optional[re.Match], step: int) -> Optional[int]:
+    """The number of a _WORD_MIN (step 1) or _WORD_MAX (step -1) match, moved past it when exclusive."""
+    if not match:
+        return None
+    value = _number(match.group(2))
+    return value + step if _EXCLUSIVE.fullmatch(match.group(1)) else value
+
+
+def _word_count_spec(low: Optional[int], high: Optional[int]) -> Optional[Dict[str, Any]]:
+    """word_count spec, or None when the bounds require nothing (or contradict each other)."""
+    low = low if low and low > 0 else None
+    high = high if high and high > 0 else None
+    if (low is None and high is None) or (low and high and low > high):
+        return None
+    return {"kind": "word_count", "min": low, "max": high}
+
+
+def classify(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Rule spec for a rubric item, or None when it needs the LLM."""
+    name = item.get("criterion") or ""
+    text = f"{name}. {item.get('description') or ''}"
+    if _COMPOUND_NAME.search(name) or _SUBJECTIVE.search(text):
+        return None
+
+    if _LENGTH_NAME.search(name):
+        match = _WORD_RANGE.search(text)
+        if match:
+            return _word_count_spec(*sorted((_number(match.group(1)), _number(match.group(2)))))
+        low, high = _WORD_MIN.search(text), _WORD_MAX.search(text)
+        if low or high:
+            return _word_count_spec(_bound(low, 1), _bound(high, -1))
+
+    if _CITATION_NAME.search(name):
+        match = _SOURCE_COUNT.search(text)
+        if match:
+            return {"kind": "citations", "min": max(1, _number(match.group(1)))}
+
+    if _SECTION_NAME.search(name):
+        sections = []
+        for mention in _SECTION_MENTION.findall(text):
+            if mention.lower() not in sections:
+                sections.append(mention.lower())
+        if len(sections) >= 2:
+            return {"kind": "sections", "sections": sections}
+
+    return None
+
+
+def word_count(text: str) -> int:
+    return sum(1 for _ in _WORD.finditer(text))
+
+
+def count_citations(text: str) -> int:
+    """Distinct in-text citations, or reference-list entries when there are more of those."""
+    in_text = {re.sub(r"\s+", " ", m.group(0)) for m in _PAREN_CITATION.finditer(text)}
+    in_text |= {f"[{m.group(1)}]" for m in _NUMERIC_CITATION.finditer(text)}
+    in_text |= {m.group(0).rstrip(".,;") for m in _URL.finditer(text)}
+    listed = 0
+    headings = list(_REFERENCE_HEADING.finditer(text))
+    if headings:
+        # Entries after the last reference heading, one per (non-trivial) line
+        listed = sum(1 for line in text[headings[-1].end():].splitlines() if len(line.strip()) > 20)
+    return max(len(in_text), listed)
+
+
+def _section_pattern(name: str) -> re.Pattern:
+    return re.compile(_HEADING_PREFIX + re.escape(name) + r"[ \t]*[:.]?[ \t]*$", re.I | re.M)
+
+
+_SECTION_PATTERNS = {name: _section_pattern(name) for name in SECTION_NAMES}
+
+
+def find_sections(text: str, sections: List[str]) -> List[str]:
+    """Required sections that appear as a heading line of their own."""
+    return [name for name in sections if (_SECTION_PATTERNS.get(name) or _section_pattern(name)).search(text)]
+
+
+def _points(max_points: int, fraction: float) -> int:
+    return int(round(max_points * max(0.0, min(1.0, fraction))))
+
+
+def apply(rule: Dict[str, Any], text: str, max_points: int) -> Tuple[int, str]:
+    """(points, justification) for a rule spec from classify()."""
+    kind = rule["kind"]
+    if kind == "word_count":
+        count = word_count(text)
+        low, high = rule.get("min"), rule.get("max")
+        bounds = f"{low}-{high}" if low and high else (f"at least {low}" if low else f"at most {high}")
+        if low and count < low:
+            return _points(max_points, count / low), f"{count} words; {bounds} required."
+        if high and count > high:
+            return _points(max_points, high / count), f"{count} words; {bounds} required."
+        return max_points, f"{count} words ({bounds} required)."
+    if kind == "citations":
+        found = count_citations(text)
+        required = rule["min"]
+        return _points(max_points, found / required), f"{found} citation(s) found; {required} required."
+    if kind == "sections":
+        required = rule["sections"]
+        present = find_sections(text, required)
+        missing = [name for name in required if name not in present]
+        note = f"Missing: {', '.join(missing)}." if missing else "All present."
+        return _points(max_points, len(present) / len(required)), f"{len(present)} of {len(required)} required sections found. {note}"
+    raise ValueError(f"Unknown rule kind: {kind}")
@@ -0,0 +1,282 @@
+"""
+Cross-submission near-duplicate detection.
+
+Each submission is reduced to a MinHash signature over word shingles and split
+into LSH bands. Band keys are stored per submission in the `similarity`
+collection, so looking up candidates for a submission is an indexed `$in`
+query on the bands instead of a pairwise comparison against every other
+submission for the assignment.
+
+Submissions are indexed when the pipeline stores them and when they are graded;
+the read routes only query the index. Submissions stored before that (or only
+through the Next.js routes) are indexed by `python api/similarity.py`, which is
+safe to re-run.
+"""
+import argparse
+import hashlib
+import random
+import re
+from typing import List, Dict, Any, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+
+import textstore
+
+SHINGLE_SIZE = 5        # words per shingle
+NUM_PERM = 128          # MinHash permutations
+BANDS = 32              # LSH bands (BANDS * ROWS must equal NUM_PERM)
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.5  # minimum estimated Jaccard similarity to report
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Placeholder signature value earlier versions stored for texts without words
+_LEGACY_EMPTY_HASH = (1 << 61) - 1
+# Letters and digits of any script, with inner apostrophes ("don't", "l'eau")
+_WORD_RE = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = random.Random(2262)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Return the set of hashed word shingles for a text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big")
+        for g in grams
+    }
+
+
+def minhash_signature(text: str) -> List[int]:
+    """Compute the MinHash signature of a text, or [] when it has no words to compare."""
+    hashed = shingles(text)
+    if not hashed:
+        return []
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashed)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(signature: List[int]) -> List[str]:
+    """Split a signature into LSH band keys ("<band>:<digest>")."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            ",".join(str(v) for v in rows).encode("ascii"), digest_size=8
+        ).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimate Jaccard similarity from two signatures."""
+    if not sig_a or not sig_b:
+        return 0.0
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / len(sig_a)
+
+
+INDEXES = [
+    IndexModel([("assignmentId", ASCENDING), ("submissionId", ASCENDING)], unique=True),
+    IndexModel([("assignmentId", ASCENDING), ("bands", ASCENDING)]),
+]
+
+
+def ensure_indexes(col):
+    col.create_indexes(INDEXES)
+
+
+def index_submission(col, assignment_id: str, submission_id: str, text: str,
+                     student_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Add or refresh a submission in the similarity index. Unchanged texts are skipped.
+    A text without words is not comparable: it is left out of (or dropped from) the index and None is returned.
+    """
+    digest = text_hash(text)
+    existing = col.find_one(
+        {"assignmentId": assignment_id, "submissionId": submission_id},
+        {"textHash": 1, "signature": 1, "bands": 1}
+    )
+    if existing and existing.get("textHash") == digest:
+        return existing
+
+    signature = minhash_signature(text)
+    if not signature:
+        # An identical placeholder signature would collide in every band and report 1.0 matches
+        if existing:
+            col.delete_one({"_id": existing["_id"]})
+        return None
+    doc = {
+        "assignmentId": assignment_id,
+        "submissionId": submission_id,
+        "studentId": student_id,
+        "textHash": digest,
+        "signature": signature,
+        "bands": band_keys(signature),
+    }
+    col.update_one(
+        {"assignmentId": assignment_id, "submissionId": submission_id},
+        {"$set": doc},
+        upsert=True
+    )
+    return doc
+
+
+def backfill(submissions_col, col, assignment_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Index submissions (of one assignment, or all) that are not in the similarity index yet,
+    after dropping entries stored with the placeholder signature of a text without words.
+    """
+    scope = {"assignmentId": assignment_id} if assignment_id else {}
+    dropped = col.delete_many({**scope, "signature.0": _LEGACY_EMPTY_HASH, "signature.1": _LEGACY_EMPTY_HASH}).deleted_count
+    query = {"assignmentId": {"$exists": True}}
+    if assignment_id:
+        query = {"assignmentId": ObjectId(assignment_id)}
+    indexed = {
+        (doc["assignmentId"], doc["submissionId"])
+        for doc in col.find(scope, {"assignmentId": 1, "submissionId": 1})
+    }
+    projection = {"assignmentId": 1, "studentId": 1, **{field: 1 for field in textstore.SUBMISSION_STORED_FIELDS}}
+    added = 0
+    for sub in submissions_col.find(query, projection):
+        key = (str(sub["assignmentId"]), str(sub["_id"]))
+        text = textstore.submission_text(sub)
+        if key in indexed or not text:
+            continue
+        if index_submission(col, key[0], key[1], text, student_id=sub.get("studentId")):
+            added += 1
+    return {"indexed": len(indexed), "added": added, "dropped": dropped}
+
+
+def find_similar(col, assignment_id: str, submission_id: str,
+                 threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """Return submissions of the same assignment that look like near-duplicates of one submission."""
+    entry = col.find_one({"assignmentId": assignment_id, "submissionId": submission_id})
+    if not entry:
+        return []
+    candidates = col.find(
+        {
+            "assignmentId": assignment_id,
+            "bands": {"$in": entry["bands"]},
+            "submissionId": {"$ne": submission_id}
+        },
+        {"submissionId": 1, "studentId": 1, "signature": 1}
+    )
+    matches = []
+    for cand in candidates:
+        score = estimate_similarity(entry["signature"], cand["signature"])
+        if score >= threshold:
+            matches.append({
+                "submissionId": cand["submissionId"],
+                "studentId": cand.get("studentId"),
+                "similarity": round(score, 3)
+            })
+    matches.sort(key=lambda m: m["similarity"], reverse=True)
+    return matches
+
+
+def near_duplicate_clusters(col, assignment_id: str,
+                            threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Group an assignment's submissions into near-duplicate clusters.
+    Only submissions sharing at least one LSH bucket are ever compared.
+    """
+    buckets = col.aggregate([
+        {"$match": {"assignmentId": assignment_id}},
+        {"$unwind": "$bands"},
+        {"$group": {"_id": "$bands", "ids": {"$push": "$submissionId"}}},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ])
+
+    pairs = set()
+    for bucket in buckets:
+        ids = sorted(set(bucket["ids"]))
+        for i in range(len(ids)):
+            for j in range(i + 1, len(ids)):
+                pairs.add((ids[i], ids[j]))
+    if not pairs:
+        return []
+
+    involved = {sid for pair in pairs for sid in pair}
+    entries = {
+        doc["submissionId"]: doc
+        for doc in col.find(
+            {"assignmentId": assignment_id, "submissionId": {"$in": list(involved)}},
+            {"submissionId": 1, "studentId": 1, "signature": 1}
+        )
+    }
+
+    # Union-find over verified pairs
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    verified = []
+    for a, b in pairs:
+        if a not in entries or b not in entries:
+            continue
+        score = estimate_similarity(entries[a]["signature"], entries[b]["signature"])
+        if score >= threshold:
+            verified.append((a, b, score))
+            parent[find(a)] = find(b)
+
+    groups: Dict[str, Dict[str, Any]] = {}
+    for a, b, score in verified:
+        root = find(a)
+        group = groups.setdefault(root, {"members": set(), "pairs": []})
+        group["members"].update([a, b])
+        group["pairs"].append({"a": a, "b": b, "similarity": round(score, 3)})
+
+    clusters = []
+    for group in groups.values():
+        members = sorted(group["members"])
+        clusters.append({
+            "submissions": [
+                {"submissionId": sid, "studentId": entries[sid].get("studentId")}
+                for sid in members
+            ],
+            "size": len(members),
+            "maxSimilarity": max(p["similarity"] for p in group["pairs"]),
+            "pairs": sorted(group["pairs"], key=lambda p: p["similarity"], reverse=True)
+        })
+    clusters.sort(key=lambda c: (c["maxSimilarity"], c["size"]), reverse=True)
+    return clusters
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import get_db
+
+    parser = argparse.ArgumentParser(description="Index submissions missing from the similarity index")
+    parser.add_argument("--assignment", help="only this assignment id")
+    args = parser.parse_args()
+    db = get_db()
+    ensure_indexes(db["similarity"])
+    report = backfill(db["submissions"], db["similarity"], assignment_id=args.assignment)
+    print(f"[SIMILARITY] Indexed {report['added']} submissions ({report['indexed']} already indexed, "
+          f"{report['dropped']} without words dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import mongomock
+from bson import ObjectId
+
+import counters
+
+
+def _db():
+    db = mongomock.MongoClient().db
+    db.submissions.insert_many([
+        {"teacherId": "t", "needsInterview": True},
+        {"teacherId": "t", "needsInterview": True, "interviewCompleted": True},
+        {"teacherId": "t"},
+    ])
+    return db
+
+
+def test_teacher_counters_rebuilds_unreconciled_entry():
+    db = _db()
+    counters.incr_teacher(db, "t", submissions=1)  # $inc before any reconcile: partial values
+    stats = counters.teacher_counters(db, "t")
+    assert (stats["totalSubmissions"], stats["pendingReviews"]) == (3, 1)
+    assert "reconciledAt" in stats
+
+
+def test_counters_fall_back_to_a_direct_count_when_reconcile_keeps_losing(monkeypatch):
+    db = _db()
+    course_id = ObjectId()
+    db.assignments.insert_many([{"courseId": course_id}, {"courseId": course_id, "status": "deleted"}])
+    monkeypatch.setattr(counters, "_store", lambda *args: None)
+    assert counters.teacher_counters(db, "t") == {"totalSubmissions": 3, "pendingReviews": 1}
+    assert counters.course_assignment_counts(db, [str(course_id)]) == {str(course_id): 1}
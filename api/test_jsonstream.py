@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from jsonstream import ArrayItemParser, loads_with_recovery, recover_items
+
+DOC = json.dumps({
+    "summary": "two markers, one says \"[braces]\" {inside} a string",
+    "indicators_found": [
+        {"type": "marker_found", "evidence": "a \\\"quoted\\\" ] bracket", "location": "p1"},
+        {"type": "marker_found", "evidence": "nested", "location": {"para": [1, 2]}},
+    ],
+    "score": "2/3",
+})
+
+
+def _feed_in_chunks(parser, text, size):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(DOC)])
+def test_chunk_boundaries_do_not_change_items(size):
+    parser = ArrayItemParser("indicators_found")
+    assert _feed_in_chunks(parser, DOC, size) == json.loads(DOC)["indicators_found"]
+    assert parser.done
+
+
+def test_items_arrive_as_soon_as_they_close():
+    parser = ArrayItemParser("criteria")
+    assert parser.feed('{"criteria": [{"criterionId": "a", "pointsEarned": 3}') == [
+        {"criterionId": "a", "pointsEarned": 3}]
+    assert parser.feed(', {"criterionId": "b"') == []
+    assert parser.feed(', "pointsEarned": 1}]}') == [{"criterionId": "b", "pointsEarned": 1}]
+    assert parser.feed('trailing') == []
+
+
+def test_top_level_array_with_scalars():
+    parser = ArrayItemParser()
+    assert _feed_in_chunks(parser, '[1, "two", true, null, {"x": [3]}]', 4) == [1, "two", True, None, {"x": [3]}]
+
+
+def test_key_must_be_top_level():
+    text = '{"meta": {"mutations": [1]}, "mutations": [2, 3]}'
+    assert recover_items(text, "mutations") == [2, 3]
+
+
+def test_truncated_response_keeps_complete_items():
+    truncated = DOC[:DOC.index('"nested"') + 5]
+    assert recover_items(truncated, "indicators_found") == json.loads(DOC)["indicators_found"][:1]
+
+
+def test_loads_with_recovery():
+    assert loads_with_recovery(DOC, "indicators_found") == json.loads(DOC)
+    truncated = '{"mutations": [{"type": "replacement"}, {"type": "inj'
+    assert loads_with_recovery(truncated, "mutations") == {"mutations": [{"type": "replacement"}]}
+    assert loads_with_recovery('[{"a": 1}, {"b"', None) == [{"a": 1}]
+    with pytest.raises(ValueError):
+        loads_with_recovery('{"mutations": [{"type"', "mutations")
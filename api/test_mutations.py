@@ -0,0 +1,66 @@
+from mutations import apply_mutations
+
+PROMPT = "Discuss the water cycle. Explain evaporation and condensation in 300 words."
+
+
+def _replacement(original, mutated):
+    return {"type": "replacement", "original_text": original, "mutated_text": mutated}
+
+
+def test_offsets_point_at_both_texts():
+    result = apply_mutations(PROMPT, [
+        _replacement("evaporation", "sublimation"),
+        _replacement("300 words", "350 words"),
+    ])
+    assert result["mutated"] == "Discuss the water cycle. Explain sublimation and condensation in 350 words."
+    assert result["failed"] == []
+    for change in result["applied"]:
+        assert PROMPT[change["start"]:change["end"]] == change["original_text"]
+        assert result["mutated"][change["mutated_start"]:change["mutated_end"]] == change["mutated_text"]
+
+
+def test_overlapping_spans_first_mutation_wins():
+    result = apply_mutations(PROMPT, [
+        _replacement("evaporation and condensation", "melting and freezing"),
+        _replacement("condensation", "precipitation"),
+        _replacement("water cycle", "carbon cycle"),
+    ])
+    assert result["mutated"] == "Discuss the carbon cycle. Explain melting and freezing in 300 words."
+    assert [change["index"] for change in result["applied"]] == [0, 2]
+    assert result["failed"] == [{"index": 1, "type": "replacement", "reason": "overlapping anchor",
+                                 "orig": "condensation"}]
+
+
+def test_repeated_anchor_takes_next_free_occurrence():
+    text = "red ball, red car"
+    result = apply_mutations(text, [_replacement("red", "blue"), _replacement("red", "green")])
+    assert result["mutated"] == "blue ball, green car"
+    assert [change["start"] for change in result["applied"]] == [0, 10]
+
+
+def test_anchor_shadowed_by_longer_anchor_at_same_offset():
+    # The single regex pass reports "red ball" at offset 0, not "red"; the fallback search still finds it
+    result = apply_mutations("red ball", [_replacement("red", "blue"), _replacement("red ball", "big ball")])
+    assert result["mutated"] == "blue ball"
+    assert [change["index"] for change in result["applied"]] == [0]
+    assert result["failed"][0]["index"] == 1
+
+
+def test_missing_anchor_fails_replacement_and_appends_injection():
+    result = apply_mutations(PROMPT, [
+        _replacement("photosynthesis", "respiration"),
+        {"type": "injection", "original_text": "not in the prompt", "mutated_text": "Mention the Mpemba effect."},
+    ])
+    assert result["failed"][0]["reason"] == "original_text not found"
+    assert result["mutated"] == PROMPT + " Mention the Mpemba effect."
+    injected = result["applied"][0]
+    assert injected["start"] is None
+    assert result["mutated"][injected["mutated_start"]:injected["mutated_end"]] == "Mention the Mpemba effect."
+
+
+def test_unknown_type_and_empty_mutation_are_ignored():
+    result = apply_mutations(PROMPT, [
+        {"type": "deletion", "original_text": "water", "mutated_text": "ice"},
+        _replacement("water", ""),
+    ])
+    assert result == {"mutated": PROMPT, "applied": [], "failed": []}
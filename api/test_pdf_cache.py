@@ -0,0 +1,105 @@
+import os
+import time
+
+import mongomock
+
+import pdf_cache
+from blobstore import LocalBlobStore
+from pdf_cache import BlobPdfCache, PdfCache
+
+
+def _pdf(size: int = 100) -> bytes:
+    body = b"%PDF-1.4\n"
+    return body + b"x" * max(0, size - len(body) - 6) + b"\n%%EOF"
+
+
+def _age(path: str, seconds: float):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_make_key_tracks_homework_version():
+    key = pdf_cache.make_key("a1", "original", "mutated")
+    assert key.startswith("a1-")
+    assert pdf_cache.make_key("a1", "original", "mutated") == key
+    assert pdf_cache.make_key("a1", "original", "mutated again") != key
+    assert pdf_cache.make_key("a1", "original", "mutated", layout_version="2") != key
+
+
+def test_put_get_and_invalidate(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=10_000)
+    assert cache.get("a1-k") is None
+    path = cache.put("a1-k", _pdf())
+    assert cache.get("a1-k") == path and pdf_cache.looks_like_pdf(path)
+    cache.put("a2-k", _pdf())
+    assert cache.invalidate("a1") == 1
+    assert cache.get("a1-k") is None and cache.get("a2-k")
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(pdf_cache.TMP_SUFFIX)]
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=250)
+    cache.put("old", _pdf())
+    time.sleep(0.01)
+    cache.put("used", _pdf())
+    time.sleep(0.01)
+    cache.get("old")
+    time.sleep(0.01)
+    cache.put("new", _pdf())
+    assert cache.get("used") is None
+    assert cache.get("old") and cache.get("new")
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_validate_spares_young_temp_files(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=10_000)
+    cache.put("good", _pdf())
+    (tmp_path / "corrupt.pdf").write_bytes(b"not a pdf at all")
+    (tmp_path / ".writing.tmp").write_bytes(b"%PDF-partial")
+    (tmp_path / ".abandoned.tmp").write_bytes(b"%PDF-partial")
+    _age(str(tmp_path / ".abandoned.tmp"), pdf_cache.TMP_MAX_AGE_SECONDS + 60)
+
+    result = PdfCache(str(tmp_path), max_bytes=10_000).validate()
+    assert result == {"entries": 1, "removed": 2, "evicted": 0}
+    assert sorted(os.listdir(tmp_path)) == [".writing.tmp", "good.pdf"]
+
+
+def test_rescan_picks_up_other_writers_and_deletes_nothing(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=10_000)
+    PdfCache(str(tmp_path), max_bytes=10_000).put("from-worker", _pdf())
+    (tmp_path / ".writing.tmp").write_bytes(b"%PDF-partial")
+    assert cache.stats()["entries"] == 0
+    assert cache.rescan() == {"entries": 1}
+    assert cache.stats()["entries"] == 1
+    assert ".writing.tmp" in os.listdir(tmp_path)
+
+
+def test_blob_cache_shares_blobs_and_evicts(tmp_path):
+    entries = mongomock.MongoClient().db[pdf_cache.ENTRIES_COLLECTION]
+    store = LocalBlobStore(str(tmp_path))
+    cache = BlobPdfCache(store, entries, max_bytes=250)
+    assert cache.get("a1-k") is None
+    with cache.put("a1-k", _pdf()) as stream:
+        assert stream.read() == _pdf()
+    cache.put("a1-copy", _pdf()).close()  # same content, one blob
+    assert entries.count_documents({}) == 2 and cache.stats()["bytes"] == 200
+
+    blob = entries.find_one({"_id": "a1-k"})["blob"]
+    assert cache.invalidate("a1-k") == 1
+    assert store.exists(blob)  # still referenced by a1-copy
+    assert cache.invalidate("a1") == 1
+    assert not store.exists(blob)
+
+    for key in ("x", "y", "z"):
+        cache.put(key, _pdf() + key.encode()).close()
+    assert cache.stats()["entries"] == 2 and cache.get("x") is None
+    assert cache.rescan() == {"entries": 2}
+
+
+def test_invalidate_removes_entries_written_by_other_workers(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=10_000)
+    other = PdfCache(str(tmp_path), max_bytes=10_000)
+    other.put("a1-old", _pdf())
+    other.put("a2-keep", _pdf())
+    assert cache.invalidate("a1") == 1
+    assert other.get("a1-old") is None and other.get("a2-keep")
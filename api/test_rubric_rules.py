@@ -0,0 +1,92 @@
+import pytest
+
+import rubric_rules
+from rubric import CompiledRubric, compile_rubric
+
+
+@pytest.mark.parametrize("item, expected", [
+    ({"criterion": "Length", "description": "The essay is 500-800 words long."},
+     {"kind": "word_count", "min": 500, "max": 800}),
+    ({"criterion": "Word count", "description": "Must be at least 300 words."},
+     {"kind": "word_count", "min": 300, "max": None}),
+    ({"criterion": "Word limit", "description": "No more than 1,200 words."},
+     {"kind": "word_count", "min": None, "max": 1200}),
+    ({"criterion": "Length", "description": "No fewer than 400 words."},
+     {"kind": "word_count", "min": 400, "max": None}),
+    # Exclusive bounds
+    ({"criterion": "Length", "description": "More than 300 words."},
+     {"kind": "word_count", "min": 301, "max": None}),
+    ({"criterion": "Word limit", "description": "Fewer than 1,000 words."},
+     {"kind": "word_count", "min": None, "max": 999}),
+    ({"criterion": "Length", "description": "More than 300 words but under 600 words."},
+     {"kind": "word_count", "min": 301, "max": 599}),
+    ({"criterion": "Length", "description": "0-500 words."},
+     {"kind": "word_count", "min": None, "max": 500}),
+    ({"criterion": "Citations", "description": "Cites at least three sources in the text."},
+     {"kind": "citations", "min": 3}),
+    ({"criterion": "Required sections", "description": "Includes Introduction, Methods, Results and Conclusion headings."},
+     {"kind": "sections", "sections": ["introduction", "methods", "results", "conclusion"]}),
+])
+def test_classify_objective(item, expected):
+    assert rubric_rules.classify(item) == expected
+
+
+@pytest.mark.parametrize("item", [
+    # Several aspects in one criterion: the rule would only check one of them
+    {"criterion": "Length and Organization",
+     "description": "The essay is 500-800 words and logically organized with clear transitions."},
+    {"criterion": "Length & Focus", "description": "500-800 words."},
+    {"criterion": "Citation/Format", "description": "At least 3 citations."},
+    # Judgments in the description
+    {"criterion": "Citations", "description": "At least 3 citations in MLA format, all correctly formatted."},
+    {"criterion": "Length", "description": "500-800 words, clearly written."},
+    # Judgments in the name
+    {"criterion": "Evidence & use of sources", "description": "Uses at least 2 sources."},
+    {"criterion": "Quality of references", "description": "At least 3 references."},
+    # No requirement that can be read off the text
+    {"criterion": "Thesis", "description": "Clear thesis in a 500 word essay."},
+    {"criterion": "Length", "description": "Appropriate length for the task."},
+    {"criterion": "Sections", "description": "Has an introduction."},
+    # Bounds that require nothing
+    {"criterion": "Length", "description": "At least 0 words."},
+    {"criterion": "Length", "description": "Fewer than 1 words."},
+])
+def test_classify_falls_back_to_llm(item):
+    assert rubric_rules.classify(item) is None
+
+
+def test_word_count_points():
+    rule = {"kind": "word_count", "min": 500, "max": 800}
+    assert rubric_rules.apply(rule, "word " * 600, 10)[0] == 10
+    assert rubric_rules.apply(rule, "word " * 250, 10)[0] == 5
+    assert rubric_rules.apply(rule, "word " * 1600, 10)[0] == 5
+
+
+def test_count_citations():
+    text = "As shown (Smith, 2020) and (Lee and Park 2019, p. 4), also [1] and [2], see https://example.com/a."
+    assert rubric_rules.count_citations(text) == 5
+    assert rubric_rules.count_citations("No sources (here) at all.") == 0
+
+
+def test_count_citations_reference_list():
+    text = "Body text.\n\nWorks Cited\nSmith, John. A Long Book Title. 2020.\nLee, Ann. Another Long Title. 2019.\n"
+    assert rubric_rules.count_citations(text) == 2
+
+
+def test_find_sections_needs_heading_lines():
+    text = "Introduction\nIn the introduction we...\n2. Methods\nWe did things.\nConclusion: it worked."
+    assert rubric_rules.find_sections(text, ["introduction", "methods", "conclusion"]) == ["introduction", "methods"]
+
+
+def test_compiled_rubric_splits_rule_and_llm_criteria():
+    items = [
+        {"id": "len", "criterion": "Length", "description": "300-800 words.", "maxPoints": 10},
+        {"id": "org", "criterion": "Length and Organization", "description": "300-800 words, well organized.", "maxPoints": 10},
+    ]
+    compiled = CompiledRubric(items, compile_rubric(items))
+    assert [item["id"] for item in compiled.llm_rubric] == ["org"]
+    results = compiled.apply_rules("word " * 400)
+    assert results == [{"criterionId": "len", "pointsEarned": 10, "justification": "400 words (300-800 required).",
+                        "scoredBy": "rule"}]
+    grade = compiled.score(results)
+    assert grade["incomplete"] and grade["missingCriteria"] == ["org"]
@@ -0,0 +1,106 @@
+import mongomock
+from bson import ObjectId
+
+import similarity
+
+ESSAY = ("The French Revolution began in 1789 when financial crisis and food shortages pushed the Third Estate "
+         "to declare itself a National Assembly and demand a constitution limiting the power of the king")
+OTHER = ("Photosynthesis converts light energy into chemical energy as chlorophyll in the leaves of green plants "
+         "absorbs sunlight and splits water to release oxygen while fixing carbon dioxide into sugars")
+
+
+def _col():
+    col = mongomock.MongoClient().db.similarity
+    similarity.ensure_indexes(col)
+    return col
+
+
+def test_signature_estimates_jaccard():
+    sig = similarity.minhash_signature(ESSAY)
+    assert len(sig) == similarity.NUM_PERM
+    assert similarity.minhash_signature(ESSAY) == sig
+    assert similarity.estimate_similarity(sig, sig) == 1.0
+    assert similarity.estimate_similarity(sig, similarity.minhash_signature(OTHER)) < 0.1
+    assert similarity.estimate_similarity(sig, similarity.minhash_signature(ESSAY + " in France")) > 0.8
+
+
+def test_short_and_empty_texts():
+    assert len(similarity.shingles("too short")) == 1
+    assert similarity.shingles("") == set()
+    assert similarity.minhash_signature("") == []
+    assert similarity.minhash_signature("?! — … ++ ==") == []
+    assert len(similarity.band_keys(similarity.minhash_signature(ESSAY))) == similarity.BANDS
+
+
+def test_non_latin_text_is_compared_by_its_words():
+    greek = "Η Γαλλική Επανάσταση ξεκίνησε το 1789 όταν η οικονομική κρίση και η έλλειψη τροφίμων πίεσαν την Τρίτη Τάξη"
+    russian = "Фотосинтез превращает энергию света в химическую энергию когда хлорофилл в листьях поглощает солнечный свет"
+    assert len(similarity.shingles(greek)) > 10
+    assert similarity.estimate_similarity(similarity.minhash_signature(greek),
+                                          similarity.minhash_signature(russian)) < 0.1
+    assert similarity.shingles("Ça n’est pas l’eau") == similarity.shingles("ça N’EST pas l’eau")
+
+
+def test_texts_without_words_are_not_indexed():
+    col = _col()
+    similarity.index_submission(col, "a1", "s1", ESSAY)
+    assert similarity.index_submission(col, "a1", "s1", "∑ ∫ √ —") is None
+    assert similarity.index_submission(col, "a1", "s2", "?!") is None
+    assert col.count_documents({}) == 0
+    assert similarity.find_similar(col, "a1", "s1") == []
+
+
+def test_index_submission_skips_unchanged_text():
+    col = _col()
+    first = similarity.index_submission(col, "a1", "s1", ESSAY, student_id="alice")
+    assert similarity.index_submission(col, "a1", "s1", ESSAY)["bands"] == first["bands"]
+    assert col.find_one({"submissionId": "s1"})["studentId"] == "alice"
+    similarity.index_submission(col, "a1", "s1", OTHER)
+    assert col.count_documents({}) == 1
+    assert col.find_one({"submissionId": "s1"})["textHash"] == similarity.text_hash(OTHER)
+
+
+def test_find_similar_within_assignment():
+    col = _col()
+    similarity.index_submission(col, "a1", "s1", ESSAY, student_id="alice")
+    similarity.index_submission(col, "a1", "s2", ESSAY + " in France", student_id="bob")
+    similarity.index_submission(col, "a1", "s3", OTHER, student_id="carol")
+    similarity.index_submission(col, "a2", "s4", ESSAY, student_id="dave")
+
+    matches = similarity.find_similar(col, "a1", "s1")
+    assert [(m["submissionId"], m["studentId"]) for m in matches] == [("s2", "bob")]
+    assert matches[0]["similarity"] > 0.8
+    assert similarity.find_similar(col, "a1", "s3") == []
+    assert similarity.find_similar(col, "a1", "missing") == []
+    assert similarity.find_similar(col, "a1", "s1", threshold=1.0) == []
+
+
+def test_near_duplicate_clusters():
+    col = _col()
+    similarity.index_submission(col, "a1", "s1", ESSAY)
+    similarity.index_submission(col, "a1", "s2", ESSAY + " in France")
+    similarity.index_submission(col, "a1", "s3", "Indeed " + ESSAY)
+    similarity.index_submission(col, "a1", "s4", OTHER)
+
+    clusters = similarity.near_duplicate_clusters(col, "a1")
+    assert len(clusters) == 1
+    assert [s["submissionId"] for s in clusters[0]["submissions"]] == ["s1", "s2", "s3"]
+    assert clusters[0]["size"] == 3
+    assert clusters[0]["maxSimilarity"] == clusters[0]["pairs"][0]["similarity"]
+    assert similarity.near_duplicate_clusters(col, "a2") == []
+
+
+def test_backfill_indexes_only_missing_submissions():
+    db = mongomock.MongoClient().db
+    col = _col()
+    ids = db.submissions.insert_many([
+        {"assignmentId": ObjectId(), "studentId": "alice", "submittedText": ESSAY},
+        {"assignmentId": ObjectId(), "studentId": "bob", "submittedText": ""},
+        {"homework_id": "legacy", "response_text": ESSAY},
+    ]).inserted_ids
+    first = db.submissions.find_one({"_id": ids[0]})
+    col.insert_one({"assignmentId": "old", "submissionId": "x", "signature": [(1 << 61) - 1] * similarity.NUM_PERM})
+    assert similarity.backfill(db.submissions, col) == {"indexed": 0, "added": 1, "dropped": 1}
+    assert col.find_one({"submissionId": str(ids[0])})["assignmentId"] == str(first["assignmentId"])
+    assert similarity.backfill(db.submissions, col) == {"indexed": 1, "added": 0, "dropped": 0}
+    assert similarity.backfill(db.submissions, col, assignment_id=str(first["assignmentId"]))["added"] == 0
@@ -0,0 +1,87 @@
+import pytest
+
+import textstore
+
+ORIGINAL = "Discuss the water cycle. Explain evaporation and condensation in 300 words. Cite two sources."
+
+
+@pytest.mark.parametrize("mutated", [
+    ORIGINAL,
+    ORIGINAL.replace("evaporation", "sublimation"),
+    ORIGINAL.replace("300", "350").replace("two", "three"),
+    "Intro. " + ORIGINAL + " Mention the Mpemba effect.",
+    ORIGINAL.replace(" Cite two sources.", ""),
+    "",
+    "Entirely different text — with ünïcode ✓",
+])
+def test_patch_roundtrip(mutated):
+    patch = textstore.make_patch(ORIGINAL, mutated)
+    assert textstore.apply_patch(ORIGINAL, patch) == mutated
+
+
+def test_patch_is_in_original_coordinates():
+    mutated = ORIGINAL.replace("evaporation", "sublimation")
+    assert textstore.make_patch(ORIGINAL, ORIGINAL) == []
+    for start, end, replacement in textstore.make_patch(ORIGINAL, mutated):
+        assert 0 <= start <= end <= len(ORIGINAL)
+        assert len(replacement) < len("sublimation")
+
+
+def test_pack_unpack():
+    short = "short answer"
+    assert textstore.pack(short) == short
+    assert textstore.pack(None) is None
+    long_text = "The water cycle moves water between the oceans, the air and the land. " * 40
+    packed = textstore.pack(long_text)
+    assert packed["codec"] == "zlib" and packed["chars"] == len(long_text)
+    assert textstore.unpack(packed) == long_text
+    assert textstore.unpack(short) == short
+
+
+def test_homework_prompts_in_every_stored_form():
+    mutated = ORIGINAL.replace("water", "carbon")
+    fields = textstore.prompt_fields(ORIGINAL, mutated)
+    assert "mutated_patch" in fields and textstore.prompt_unset(fields) == {"mutated_prompt": ""}
+    assert textstore.homework_prompts(fields) == (ORIGINAL, mutated)
+    legacy = {"original_prompt": ORIGINAL, "mutated_prompt": mutated}
+    assert textstore.homework_prompts(legacy) == (ORIGINAL, mutated)
+
+
+def test_submission_text_prefers_newest_field():
+    assert textstore.submission_text({"response_text": "old", "submittedText": "new"}) == "new"
+    assert textstore.submission_text({"submissionText": "", "response_text": "old"}) == "old"
+    assert textstore.submission_text({}) == ""
+
+
+def test_pack_field_keeps_the_plain_field_a_string():
+    assert textstore.pack_field("submittedText", "short") == {"submittedText": "short"}
+    long_text = "A long essay about rivers and the sea. " * 60
+    fields = textstore.pack_field("submittedText", long_text)
+    assert list(fields) == ["submittedTextPacked"]
+    assert textstore.submission_text(fields) == long_text
+
+
+def test_plain_text_written_later_wins_over_packed_copy():
+    stale = textstore.pack_field("submittedText", "Old upload. " * 200)
+    assert textstore.submission_text({**stale, "submittedText": "re-uploaded"}) == "re-uploaded"
+    # Documents packed in place before the Packed fields existed
+    assert textstore.submission_text({"submittedText": textstore.pack("Old upload. " * 200)}) == "Old upload. " * 200
+
+
+def test_compact_moves_long_text_to_the_packed_field():
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient().db
+    long_text = "A long essay about rivers and the sea. " * 60
+    ids = db.submissions.insert_many([
+        {"submittedText": "short"},
+        {"submittedText": long_text},
+        {"response_text": long_text},
+        {"submittedText": textstore.pack(long_text)},
+    ]).inserted_ids
+    assert textstore.compact(db)["submissions"] == 3
+    docs = [db.submissions.find_one({"_id": i}) for i in ids]
+    assert docs[0]["submittedText"] == "short"
+    for doc in docs[1:]:
+        assert set(doc) == {"_id", "submittedTextPacked"}
+        assert textstore.submission_text(doc) == long_text
+    assert textstore.compact(db)["submissions"] == 0
@@ -0,0 +1,174 @@
+"""
+Compact storage for large text fields.
+
+Long texts (submission text, homework prompts) are stored compressed:
+
+    {"codec": "zlib", "data": Binary, "chars": n}
+
+Every node writes zlib, which any reader can decompress. Rows written with
+"zstd" by an earlier version are still read when the zstandard package is
+installed.
+
+Short texts stay plain strings, and readers accept either form, so documents
+written before compression keep working. Submission text is shared with the
+Next.js routes, which read and write `submittedText` as a plain string through
+Mongoose, so a compressed submission text goes to a separate `<field>Packed`
+field instead (see pack_field); a plain value, e.g. from a re-upload, always
+wins over a packed one. The mutated prompt of a homework is nearly identical
+to the original, so it is stored as `mutated_patch`, a list of [start, end,
+replacement] edits against the original prompt, instead of a second copy.
+Nothing is decompressed on read until a route actually asks for the text.
+"""
+import difflib
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Binary
+
+try:
+    import zstandard
+except ImportError:  # only needed to read rows written with zstd
+    zstandard = None
+
+# Texts shorter than this (UTF-8 bytes) are stored as plain strings
+COMPRESS_MIN_BYTES = int(os.environ.get("TEXT_COMPRESS_MIN_BYTES", "1024"))
+ZLIB_LEVEL = 6
+
+PACKED_SUFFIX = "Packed"
+# Submission fields that may hold the submitted text (newest name first)
+SUBMISSION_TEXT_FIELDS = ["submittedText", "submissionText", "response_text"]
+# ... and every stored form of them, for projections and $unset
+SUBMISSION_STORED_FIELDS = [f for name in SUBMISSION_TEXT_FIELDS for f in (name, name + PACKED_SUFFIX)]
+
+
+def _compress(raw: bytes) -> Tuple[str, bytes]:
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def pack(text: Optional[str]):
+    """Stored form of a text: compressed when that pays off, else the string itself."""
+    if not isinstance(text, str):
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text
+    codec, data = _compress(raw)
+    if len(data) >= len(raw):
+        return text
+    return {"codec": codec, "data": Binary(data), "chars": len(text)}
+
+
+def unpack(value) -> Optional[str]:
+    """Text from a stored value written by pack() (plain strings pass through)."""
+    if not isinstance(value, dict) or "codec" not in value:
+        return value
+    data = bytes(value["data"])
+    if value["codec"] == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if value["codec"] == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Text was stored with zstd; install the 'zstandard' package to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown text codec: {value['codec']}")
+
+
+def make_patch(original: str, mutated: str) -> List[List[Any]]:
+    """Edits turning original into mutated: [[start, end, replacement], ...] in original coordinates."""
+    matcher = difflib.SequenceMatcher(None, original, mutated, autojunk=False)
+    return [
+        [i1, i2, mutated[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_patch(original: str, patch: List[List[Any]]) -> str:
+    parts = []
+    cursor = 0
+    for start, end, replacement in patch:
+        parts.append(original[cursor:start])
+        parts.append(replacement)
+        cursor = end
+    parts.append(original[cursor:])
+    return "".join(parts)
+
+
+def prompt_fields(original: str, mutated: str) -> Dict[str, Any]:
+    """Homework fields for a prompt pair: packed original plus the mutated prompt as a patch."""
+    patch = make_patch(original, mutated)
+    if apply_patch(original, patch) != mutated:
+        # Never store a lossy patch; fall back to a compressed copy
+        return {"original_prompt": pack(original), "mutated_prompt": pack(mutated)}
+    return {"original_prompt": pack(original), "mutated_patch": patch}
+
+
+def prompt_unset(fields: Dict[str, Any]) -> Dict[str, str]:
+    """$unset for the mutated-prompt representation that prompt_fields() did not use."""
+    return {"mutated_prompt": ""} if "mutated_patch" in fields else {"mutated_patch": ""}
+
+
+def original_prompt(homework: Dict[str, Any]) -> str:
+    return unpack(homework.get("original_prompt")) or ""
+
+
+def homework_prompts(homework: Dict[str, Any]) -> Tuple[str, str]:
+    """(original, mutated) prompt texts of a homework in any stored form."""
+    original = original_prompt(homework)
+    if homework.get("mutated_patch") is not None:
+        return original, apply_patch(original, homework["mutated_patch"])
+    return original, unpack(homework.get("mutated_prompt")) or ""
+
+
+def pack_field(field: str, text: Optional[str]) -> Dict[str, Any]:
+    """{field: text} for a short text, {field + "Packed": packed} when compression pays off."""
+    packed = pack(text)
+    return {field: packed} if packed is text else {field + PACKED_SUFFIX: packed}
+
+
+def submission_text(submission: Dict[str, Any]) -> str:
+    """The submitted text under its current or legacy field name, plain or packed."""
+    for field in SUBMISSION_TEXT_FIELDS:
+        # unpack() also reads documents that were packed in place before the Packed fields
+        text = unpack(submission.get(field)) or unpack(submission.get(field + PACKED_SUFFIX))
+        if text:
+            return text
+    return ""
+
+
+def compact(db) -> Dict[str, int]:
+    """Rewrite existing homeworks and submissions into the compact form. Safe to re-run."""
+    homeworks = 0
+    for homework in db["homeworks"].find({"mutated_prompt": {"$exists": True}}, {"original_prompt": 1, "mutated_prompt": 1}):
+        fields = prompt_fields(*homework_prompts(homework))
+        db["homeworks"].update_one({"_id": homework["_id"]}, {"$set": fields, "$unset": prompt_unset(fields)})
+        homeworks += 1
+
+    submissions = 0
+    projection = {field: 1 for field in SUBMISSION_STORED_FIELDS}
+    query = {"$or": [{f: {"$type": t}} for f in SUBMISSION_TEXT_FIELDS for t in ("string", "object")]}
+    for submission in db["submissions"].find(query, projection):
+        text = submission_text(submission)
+        fields = pack_field("submittedText", text)
+        stored = {f: submission[f] for f in SUBMISSION_STORED_FIELDS if f in submission}
+        if stored == fields:
+            continue
+        db["submissions"].update_one(
+            {"_id": submission["_id"]},
+            {"$set": fields, "$unset": {f: "" for f in SUBMISSION_STORED_FIELDS if f not in fields}}
+        )
+        submissions += 1
+    return {"homeworks": homeworks, "submissions": submissions}
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import get_db
+
+    report = compact(get_db())
+    print(f"[TEXTSTORE] Compacted {report['homeworks']} homeworks and {report['submissions']} submissions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Streaming handling of uploaded files.
+
+The multipart parser writes every uploaded file through UploadRequest's stream
+factory into a SpooledUpload: it stays in memory up to UPLOAD_SPOOL_KB and
+rolls over to a temp file beyond that, hashes each chunk as it is written, and
+aborts with 413 as soon as a file passes UPLOAD_MAX_MB, before buffering any
+more of it (whole request bodies over the cap are refused up front through
+MAX_CONTENT_LENGTH). Routes never call file.read(): the PDF reader gets the
+spooled file itself, memory-mapped once it is on disk, so a worker's memory
+use does not grow with the size of the uploads it is handling.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_MB", "10")) * 1024 * 1024
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_KB", "512")) * 1024
+# Room for the non-file form fields of an upload request
+FORM_OVERHEAD_BYTES = 1024 * 1024
+MAX_CONTENT_LENGTH = UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES
+
+
+class SpooledUpload(tempfile.SpooledTemporaryFile):
+    """Spooled temp file that hashes what is written to it and enforces the upload cap."""
+
+    def __init__(self):
+        super().__init__(max_size=UPLOAD_SPOOL_BYTES, mode="w+b")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.on_disk = False
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        if self.size > UPLOAD_MAX_BYTES:
+            raise RequestEntityTooLarge(f"Uploaded file exceeds {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+        self.sha256.update(data)
+        return super().write(data)
+
+    def rollover(self):
+        super().rollover()
+        self.on_disk = True
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload()
+
+
+def upload_digest(file) -> Optional[str]:
+    """SHA-256 of an uploaded file, computed while it was received (None if it was not spooled here)."""
+    stream = getattr(file, "stream", None)
+    return stream.sha256.hexdigest() if isinstance(stream, SpooledUpload) else None
+
+
+@contextmanager
+def pdf_source(file):
+    """Seekable view of an uploaded file for the PDF reader: memory-mapped once spooled to disk."""
+    stream = file.stream
+    stream.seek(0)
+    view = None
+    if isinstance(stream, SpooledUpload) and stream.on_disk and stream.size:
+        view = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield view if view is not None else stream
+    finally:
+        if view is not None:
+            view.close()
+        stream.seek(0)
@@ -0,0 +1,137 @@
+"""
+Per-student marker variants.
+
+A single Gemini call produces a pool of mutually compatible markers for an
+assignment (stored on the homework as `marker_pool`). Each student is assigned
+a deterministic subset of the pool, stored in the `variants` collection as a
+hex bitset over pool indices. The mutated prompt, spans and detection index
+for a variant are derived locally with apply_mutations, and the PDF is
+rendered lazily through the PDF cache, so per-student copies cost no extra
+LLM calls and one leaked copy only exposes that student's markers.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional
+
+from markers import build_detection_index
+from mutations import apply_mutations
+import textstore
+
+MARKER_POOL_SIZE = int(os.environ.get("MARKER_POOL_SIZE", "24"))
+MARKERS_PER_VARIANT = int(os.environ.get("MARKERS_PER_VARIANT", "8"))
+_MAX_ATTEMPTS = 8  # re-draws when a subset is already used by a classmate
+
+_MAX_BUILT = 512
+_built: Dict[str, Dict[str, Any]] = {}
+_built_lock = threading.Lock()
+
+
+def indices_to_hex(indices: List[int]) -> str:
+    bits = 0
+    for i in indices:
+        bits |= 1 << i
+    return format(bits, "x")
+
+
+def hex_to_indices(bits_hex: str) -> List[int]:
+    bits = int(bits_hex, 16)
+    return [i for i in range(bits.bit_length()) if bits >> i & 1]
+
+
+def pool_from_result(mutation_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Keep the markers that applied cleanly together; any subset of them is conflict-free."""
+    return [
+        {
+            "type": span.get("type"),
+            "category": span.get("category"),
+            "original_text": span.get("original_text", ""),
+            "mutated_text": span["mutated_text"],
+            "detail": span.get("detail", "")
+        }
+        for span in mutation_result["spans"]
+    ]
+
+
+def pool_hash(pool: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(pool, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def default_indices(pool_size: int, k: int = MARKERS_PER_VARIANT) -> List[int]:
+    """Subset used for the class-wide prompt (no student id)."""
+    return list(range(min(k, pool_size)))
+
+
+def choose_indices(pool_size: int, seed: str, k: int = MARKERS_PER_VARIANT) -> List[int]:
+    rng = random.Random(int(hashlib.sha256(seed.encode("utf-8")).hexdigest(), 16))
+    return sorted(rng.sample(range(pool_size), min(k, pool_size)))
+
+
+def build_variant(original_prompt: str, pool: List[Dict[str, Any]], indices: List[int],
+                  pool_digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Derive a variant from the pool: {bits, mutated, mutations, changes, spans, detection_index}.
+    Memoized per (pool, bits) when pool_digest is given.
+    """
+    bits = indices_to_hex(indices)
+    memo_key = f"{pool_digest}:{bits}" if pool_digest else None
+    if memo_key and memo_key in _built:
+        return _built[memo_key]
+
+    subset = [pool[i] for i in indices if i < len(pool)]
+    patch = apply_mutations(original_prompt, subset)
+    spans = patch["applied"]
+    changes = [span["detail"] for span in spans]
+    variant = {
+        "bits": bits,
+        "mutated": patch["mutated"],
+        "mutations": subset,
+        "changes": changes,
+        "spans": spans,
+        "detection_index": build_detection_index(changes, spans=spans)
+    }
+    if memo_key:
+        with _built_lock:
+            if len(_built) >= _MAX_BUILT:
+                _built.clear()
+            _built[memo_key] = variant
+    return variant
+
+
+def assign_bits(variants_col, homework: Dict[str, Any], student_id: str) -> str:
+    """Return the student's stored bitset, drawing (and storing) a fresh one for new students or a new pool."""
+    assignment_id = homework["assignment_id"]
+    digest = homework["pool_hash"]
+    doc = variants_col.find_one({"assignmentId": assignment_id, "studentId": student_id})
+    if doc and doc.get("poolHash") == digest:
+        return doc["bits"]
+
+    pool_size = len(homework["marker_pool"])
+    bits = None
+    for attempt in range(_MAX_ATTEMPTS):
+        candidate = indices_to_hex(choose_indices(pool_size, f"{assignment_id}:{student_id}:{digest}:{attempt}"))
+        bits = candidate
+        if not variants_col.find_one({"assignmentId": assignment_id, "poolHash": digest, "bits": candidate}, {"_id": 1}):
+            break
+
+    variants_col.update_one(
+        {"assignmentId": assignment_id, "studentId": student_id},
+        {
+            "$set": {"bits": bits, "poolHash": digest, "updatedAt": datetime.now(UTC)},
+            "$setOnInsert": {"createdAt": datetime.now(UTC)}
+        },
+        upsert=True
+    )
+    return bits
+
+
+def variant_for_student(variants_col, homework: Optional[Dict[str, Any]], student_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The student's variant, or None when the homework has no marker pool (single shared prompt)."""
+    if not homework or not homework.get("marker_pool") or not student_id:
+        return None
+    bits = assign_bits(variants_col, homework, student_id)
+    return build_variant(textstore.original_prompt(homework), homework["marker_pool"], hex_to_indices(bits),
+                         pool_digest=homework["pool_hash"])
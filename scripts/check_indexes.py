@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Explain every query shape the Flask API runs and fail on collection scans.
+Run with: python scripts/check_indexes.py [--min-docs 1000] [--synthetic 5000]
+
+By default the configured database is checked; collections smaller than
+--min-docs are reported but not failed, since the planner may legitimately
+scan tiny collections. With --synthetic N a scratch database is filled with N
+documents per collection, indexed from the manifest, checked and dropped.
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, UTC
+from bson import ObjectId
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Add parent directory to path to import from api
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from database import get_client, get_db
+from indexes import QUERY_SHAPES, ensure_indexes, explain_shape
+
+SCRATCH_DB = "lms_index_check"
+
+
+def fill_synthetic(db, count: int):
+    """Insert count documents per collection with realistic field cardinality."""
+    teachers = [f"user_teacher_{i}" for i in range(max(1, count // 200))]
+    students = [f"user_student_{i}" for i in range(max(1, count // 10))]
+    course_ids = [ObjectId() for _ in range(max(1, count // 100))]
+    assignment_ids = [ObjectId() for _ in range(max(1, count // 20))]
+    now = datetime.now(UTC)
+
+    db.courses.insert_many([
+        {"professorId": random.choice(teachers), "name": f"Course {i}"} for i in range(count)
+    ])
+    db.assignments.insert_many([
+        {
+            "courseId": random.choice(course_ids),
+            "professorId": random.choice(teachers),
+            "status": random.choice(["active", "draft", "deleted"]),
+            "dueDate": now + timedelta(days=random.randint(-30, 30))
+        }
+        for _ in range(count)
+    ])
+    db.submissions.insert_many([
+        {
+            "assignmentId": random.choice(assignment_ids),
+            "studentId": random.choice(students),
+            "teacherId": random.choice(teachers),
+            "needsInterview": random.random() < 0.2,
+            "interviewCompleted": random.random() < 0.5,
+            "submittedAt": now
+        }
+        for _ in range(count)
+    ])
+    db.homeworks.insert_many([
+        {"assignment_id": str(random.choice(assignment_ids))} for _ in range(count)
+    ])
+    db.cache.insert_many([
+        {"key": f"k{i}", "value": None, "expiresAt": now + timedelta(hours=1)} for i in range(count)
+    ])
+    db.similarity.insert_many([
+        {
+            "assignmentId": str(assignment_ids[i % len(assignment_ids)]),
+            "submissionId": str(ObjectId()),
+            "bands": [f"{b}:{random.getrandbits(32):x}" for b in range(4)]
+        }
+        for i in range(count)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-docs", type=int, default=1000,
+                        help="only fail COLLSCANs on collections with at least this many documents")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="check a scratch database filled with this many documents per collection")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        get_client().drop_database(SCRATCH_DB)
+        db = get_db(SCRATCH_DB)
+        print(f"Filling {SCRATCH_DB} with {args.synthetic} documents per collection...")
+        fill_synthetic(db, args.synthetic)
+    else:
+        db = get_db()
+
+    ensure_indexes(db)
+
+    failures = 0
+    try:
+        for shape in QUERY_SHAPES:
+            result = explain_shape(db, shape)
+            size = db[shape["collection"]].estimated_document_count()
+            large = size >= args.min_docs
+            if result["collscan"] and large:
+                status = "FAIL"
+                failures += 1
+            elif result["collscan"]:
+                status = "scan (small collection)"
+            else:
+                status = "ok"
+            print(f"[{status}] {result['route']}: {' <- '.join(result['stages'])} "
+                  f"({shape['collection']}, {size} docs, examined {result['docsExamined']})")
+    finally:
+        if args.synthetic:
+            get_client().drop_database(SCRATCH_DB)
+
+    if failures:
+        print(f"\n{failures} query shape(s) scan a large collection. Add an index to api/indexes.py.")
+        sys.exit(1)
+    print("\nAll query shapes use an index.")
+
+
+if __name__ == "__main__":
+    main()
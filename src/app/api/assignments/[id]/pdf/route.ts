@@ -6,11 +6,21 @@ export async function GET(
 ) {
   try {
     const { id } = await params;
-    console.log('[PDF] Requesting PDF for assignment:', id);
+    const studentId = new URL(request.url).searchParams.get('studentId');
+    console.log('[PDF] Requesting PDF for assignment:', id, studentId ? `(student ${studentId})` : '');
 
-    // Request PDF from Flask API (it will check cache or generate)
+    // Request PDF from Flask API (it will check cache or generate); students get their own marker variant
     const PYTHON_API_URL = process.env.PYTHON_API_URL || 'http://localhost:5000';
-    const response = await fetch(`${PYTHON_API_URL}/api/assignments/${id}/pdf`);
+    const query = studentId ? `?studentId=${encodeURIComponent(studentId)}` : '';
+    const response = await fetch(`${PYTHON_API_URL}/api/assignments/${id}/pdf${query}`);
+
+    // Mutations are still being prepared; pass the 202 and its Retry-After through
+    if (response.status === 202) {
+      return NextResponse.json(await response.json(), {
+        status: 202,
+        headers: { 'Retry-After': response.headers.get('Retry-After') || '5' },
+      });
+    }
 
     if (!response.ok) {
       const errorText = await response.text();
@@ -1,6 +1,7 @@
 import { NextResponse } from 'next/server';
 import { connectToDatabase } from '@/lib/mongodb';
 import { ObjectId } from 'mongodb';
+import { reconcileTeacherCounters } from '@/lib/counters';
 
 export async function GET(request: Request) {
   try {
@@ -111,6 +112,7 @@ export async function POST(request: Request) {
 
     const result = await db.collection('assignments').insertOne(assignment);
     console.log('[ASSIGNMENTS] Stored in MongoDB:', result.insertedId);
+    await reconcileTeacherCounters(teacherId);
 
     return NextResponse.json({
       success: true,
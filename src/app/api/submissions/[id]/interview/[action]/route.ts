@@ -0,0 +1,32 @@
+import { NextResponse } from 'next/server';
+
+// Proxies incremental interview analysis to the Python API:
+//   POST /api/submissions/:id/interview/turns     { turns, offset }
+//   POST /api/submissions/:id/interview/finalize  { turns, offset }
+const ACTIONS = new Set(['turns', 'finalize']);
+
+export async function POST(
+  request: Request,
+  { params }: { params: Promise<{ id: string; action: string }> }
+) {
+  try {
+    const { id, action } = await params;
+    if (!ACTIONS.has(action)) {
+      return NextResponse.json({ error: 'Unknown interview action' }, { status: 404 });
+    }
+    const body = await request.json();
+    const PYTHON_API_URL = process.env.PYTHON_API_URL || 'http://localhost:5000';
+
+    const response = await fetch(`${PYTHON_API_URL}/api/submissions/${id}/interview/${action}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    });
+
+    const data = await response.json().catch(() => ({}));
+    return NextResponse.json(data, { status: response.status });
+  } catch (error) {
+    console.error('[INTERVIEW] Proxy error:', error);
+    return NextResponse.json({ error: 'Failed to reach interview analysis' }, { status: 500 });
+  }
+}
@@ -1,6 +1,7 @@
 import { NextResponse } from 'next/server';
 import { connectToDatabase } from '@/lib/mongodb';
 import { ObjectId } from 'mongodb';
+import { reconcileTeacherCounters } from '@/lib/counters';
 
 export async function POST(
     request: Request,
@@ -9,7 +10,7 @@ export async function POST(
     try {
         const { db } = await connectToDatabase();
 
-        const result = await db.collection('submissions').updateOne(
+        const result = await db.collection('submissions').findOneAndUpdate(
             { _id: new ObjectId(params.id) },
             {
                 $set: {
@@ -19,16 +20,20 @@ export async function POST(
                     interviewSkipped: true,
                     updatedAt: new Date()
                 }
-            }
+            },
+            { projection: { teacherId: 1 } }
         );
 
-        if (result.matchedCount === 0) {
+        if (!result) {
             return NextResponse.json(
                 { error: 'Submission not found' },
                 { status: 404 }
             );
         }
 
+        // The submission now matches the pendingReviews filter, which may change the teacher's counters
+        await reconcileTeacherCounters(result.teacherId);
+
         return NextResponse.json({ success: true });
     } catch (error) {
         console.error('[SKIP-INTERVIEW] Error:', error);
@@ -1,6 +1,7 @@
 import { NextResponse } from "next/server";
 import { connectToDatabase } from "@/lib/mongodb";
 import { ObjectId } from "mongodb";
+import { reconcileTeacherCounters } from "@/lib/counters";
 
 // GET - Retrieve the transcript for a submission
 export async function GET(
@@ -79,6 +80,7 @@ export async function POST(
     }
 
     const now = new Date();
+    const submissionId = new ObjectId(id);
 
     // Determine status based on verdict (if provided)
     const status = verdict
@@ -89,12 +91,20 @@ export async function POST(
           : "interviewed"
       : "interviewed";
 
+    const previous = await db.collection("submissions").findOne(
+      { _id: submissionId },
+      { projection: { interviewScore: 1, interviewVerdict: 1, status: 1 } }
+    );
+    // The interview pages stream turns to the Python API, whose /interview/finalize already
+    // stored the transcript, score and verdict; keep those and only archive the interview here
+    const analyzed = typeof previous?.interviewScore === "number";
+
     // Insert into interviews collection first to get the interview ID
     const interviewResult = await db.collection("interviews").insertOne({
-      submissionId: new ObjectId(id),
+      submissionId,
       transcript,
-      verdict: verdict || null,
-      status,
+      verdict: verdict || (analyzed ? previous?.interviewVerdict : null) || null,
+      status: analyzed ? previous?.status : status,
       messageCount: transcript.length,
       startedAt: now,
       completedAt: now,
@@ -103,22 +113,32 @@ export async function POST(
 
     const interviewId = interviewResult.insertedId;
 
-    // Update submission with transcript and link to interview
-    await db.collection("submissions").updateOne(
-      { _id: new ObjectId(id) },
+    // Update submission with transcript and link to interview; the document as it was
+    // before this write tells whether the write itself completed a pending interview
+    const before = await db.collection("submissions").findOneAndUpdate(
+      { _id: submissionId },
       {
-        $set: {
-          interviewTranscript: transcript,
-          interviewVerdict: verdict || null,
-          interviewId: interviewId,
-          interviewCompleted: true,
-          status,
-          interviewedAt: now,
-          updatedAt: now,
-        },
+        $set: analyzed
+          ? { interviewId, interviewedAt: now, updatedAt: now }
+          : {
+            interviewTranscript: transcript,
+            interviewVerdict: verdict || null,
+            interviewId: interviewId,
+            interviewCompleted: true,
+            status,
+            interviewedAt: now,
+            updatedAt: now,
+          },
       },
+      { returnDocument: "before", projection: { teacherId: 1, needsInterview: 1, interviewCompleted: 1 } },
     );
 
+    // Completing a pending interview here changes the teacher's pendingReviews counter
+    // (the Python API keeps the counter itself when it finalized the interview)
+    if (!analyzed && before?.needsInterview && !before.interviewCompleted) {
+      await reconcileTeacherCounters(before.teacherId);
+    }
+
     console.log(`[Transcript] Saved interview ${interviewId} for submission ${id} with ${transcript.length} messages`);
 
     return NextResponse.json({
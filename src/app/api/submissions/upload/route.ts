@@ -10,6 +10,7 @@ import {
   SUBMISSIONS_DIR 
 } from '@/lib/fileStorage';
 import PDFParser from 'pdf2json';
+import { reconcileTeacherCounters } from '@/lib/counters';
 
 /**
  * Upload student submission PDF
@@ -184,6 +185,9 @@ export async function POST(request: NextRequest) {
       console.log('[UploadSubmission] Created new submission:', submission._id);
     }
 
+    // The submission was written here, not through the Python API's counted write paths
+    await reconcileTeacherCounters(submission.teacherId || teacherId);
+
     return NextResponse.json({
       success: true,
       submissionId: submission._id.toString(),
@@ -5,6 +5,7 @@ import { DeepgramClient, AgentEvents } from '@deepgram/sdk';
 import { useSearchParams, useRouter } from 'next/navigation';
 import { Mic } from '@/components/mic/Mic';
 import { Button } from '@/components/ui/button';
+import { createInterviewSync } from '@/lib/interviewSync';
 
 export default function InterviewPage() {
   const searchParams = useSearchParams();
@@ -30,12 +31,18 @@ export default function InterviewPage() {
   const isPlayingRef = useRef(false);
   const currentSourceRef = useRef<AudioBufferSourceNode | null>(null);
   const transcriptEndRef = useRef<HTMLDivElement | null>(null);
+  const interviewSync = useMemo(() => (submissionId ? createInterviewSync(submissionId) : null), [submissionId]);
 
   // Keep ref in sync with state for access in closures/timeouts
   useEffect(() => {
     transcriptRef.current = transcript;
   }, [transcript]);
 
+  // Stream turns to the analysis as they happen (each completed exchange is assessed right away)
+  useEffect(() => {
+    interviewSync?.push(transcript);
+  }, [transcript, interviewSync]);
+
   // Create WAV header for linear16 PCM audio at 24kHz
   const createWavHeader = (dataLength: number, sampleRate: number = 24000): Uint8Array => {
     const header = new Uint8Array(44);
@@ -594,6 +601,8 @@ End the interview once you have a reasonable sense of their understanding. Don't
   const saveTranscript = async () => {
     if (!submissionId) return;
     // Use ref to get latest transcript even if called from closure
+    // Send the last turns and get the verdict from the per-exchange notes, then archive the transcript
+    await interviewSync?.finish(transcriptRef.current);
     await fetch(`/api/submissions/${submissionId}/transcript`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
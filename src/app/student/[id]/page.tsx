@@ -26,10 +26,17 @@ export default function AssignmentView() {
         setAssignment(found);
       });
 
-    // Fetch PDF
-    fetch(`/api/assignments/${params.id}/pdf?studentId=${user.id}`)
+    // Fetch PDF (202 while the assignment's markers are still being prepared)
+    const fetchPdf = async (attempt = 0): Promise<Response> => {
+      const res = await fetch(`/api/assignments/${params.id}/pdf?studentId=${user.id}`);
+      if (res.status !== 202 || attempt >= 60) return res;
+      const retryAfter = Number(res.headers.get('Retry-After')) || 5;
+      await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+      return fetchPdf(attempt + 1);
+    };
+    fetchPdf()
       .then(async res => {
-        if (!res.ok) {
+        if (!res.ok || res.status === 202) {
           const text = await res.text();
           console.error('PDF loading failed:', res.status, text);
           throw new Error(`Failed to load PDF: ${res.status}`);
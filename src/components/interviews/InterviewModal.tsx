@@ -1,8 +1,9 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { DeepgramClient, AgentEvents } from '@deepgram/sdk';
 import { Mic } from '@/components/mic/Mic';
+import { createInterviewSync } from '@/lib/interviewSync';
 
 interface InterviewModalProps {
   assignmentId: string;
@@ -13,6 +14,7 @@ interface InterviewModalProps {
 
 export function InterviewModal({ assignmentId, submissionId, submissionText, onClose }: InterviewModalProps) {
   const [transcript, setTranscript] = useState<Array<{ role: string; content: string }>>([]);
+  const interviewSync = useMemo(() => createInterviewSync(submissionId), [submissionId]);
   const [isComplete, setIsComplete] = useState(false);
   const [client, setClient] = useState<any>(null);
   const [micState, setMicState] = useState<'open' | 'loading' | 'closed'>('closed');
@@ -99,6 +101,11 @@ Rules:
     });
   };
 
+  // Stream turns to the analysis as they happen (each completed exchange is assessed right away)
+  useEffect(() => {
+    interviewSync.push(transcript);
+  }, [transcript, interviewSync]);
+
   // Detect when interview completes
   useEffect(() => {
     const lastMessage = transcript[transcript.length - 1];
@@ -109,6 +116,8 @@ Rules:
   }, [transcript]);
 
   const saveTranscript = async () => {
+    // Send the last turns and get the verdict from the per-exchange notes, then archive the transcript
+    await interviewSync.finish(transcript);
     await fetch(`/api/submissions/${submissionId}/transcript`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
@@ -0,0 +1,20 @@
+// Dashboard counters live in the Python API's `counters` collection and are kept
+// current with $inc on the Flask write paths. Routes here that write the counted
+// collections directly ask Flask to recount that teacher right after the write.
+export async function reconcileTeacherCounters(teacherId: string | null | undefined) {
+  if (!teacherId) return;
+  const PYTHON_API_URL = process.env.PYTHON_API_URL || 'http://localhost:5000';
+  try {
+    const response = await fetch(`${PYTHON_API_URL}/api/counters/reconcile`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ teacherId })
+    });
+    if (!response.ok) {
+      console.error('[COUNTERS] Reconcile failed:', response.status);
+    }
+  } catch (error) {
+    // The periodic reconcile in the Python API repairs the counters later
+    console.error('[COUNTERS] Reconcile request failed:', error);
+  }
+}
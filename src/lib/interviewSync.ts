@@ -0,0 +1,53 @@
+// Sends interview turns to the Python API while the interview is running, so each
+// completed exchange is assessed against the submission digest as it happens
+// (api/interview.py). finish() sends whatever is left and asks for the verdict,
+// which is then built from the short per-exchange notes instead of the whole
+// transcript. Requests are queued so turns always arrive in order; `offset`
+// makes retries and repeated sends idempotent on the server.
+type Turn = { role: string; content: string };
+
+export function createInterviewSync(submissionId: string) {
+  let sent = 0;
+  let queue: Promise<unknown> = Promise.resolve();
+  let finishing: Promise<any> | null = null;
+
+  const post = async (action: 'turns' | 'finalize', transcript: Turn[]) => {
+    const send = (offset: number) => fetch(`/api/submissions/${submissionId}/interview/${action}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ turns: transcript.slice(offset), offset })
+    });
+
+    let response = await send(sent);
+    if (response.status === 409 && sent > 0) {
+      // The server has fewer turns than we think (e.g. a lost request): resend everything
+      response = await send(0);
+    }
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      console.error(`[INTERVIEW] ${action} failed:`, response.status, data);
+      return null;
+    }
+    sent = typeof data.stored === 'number' ? data.stored : transcript.length;
+    return data;
+  };
+
+  return {
+    push(transcript: Turn[]) {
+      if (finishing || transcript.length <= sent) return queue;
+      const snapshot = [...transcript];
+      queue = queue.then(() => post('turns', snapshot)).catch((err) => console.error('[INTERVIEW] turns error', err));
+      return queue;
+    },
+    finish(transcript: Turn[]) {
+      if (!finishing) {
+        const snapshot = [...transcript];
+        finishing = queue.then(() => post('finalize', snapshot)).catch((err) => {
+          console.error('[INTERVIEW] finalize error', err);
+          return null;
+        });
+      }
+      return finishing;
+    }
+  };
+}